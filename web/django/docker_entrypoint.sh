@@ -6,4 +6,7 @@ python manage.py migrate --no-input
 python manage.py tailwind install --no-input
 python manage.py tailwind build --no-input
 python manage.py collectstatic --no-input 
+# the progress stream keeps its connections open, so only it is served by uvicorn,
+# the sync views stay on the WSGI workers instead of sharing one thread per worker
+gunicorn -b 0.0.0.0:8081 ligand_service.asgi -k uvicorn.workers.UvicornWorker --timeout 120 &
 gunicorn -b 0.0.0.0:8080 ligand_service.wsgi --timeout 120
@@ -0,0 +1,61 @@
+import time
+
+from django.core.cache import cache
+from huey.exceptions import CancelExecution
+
+from .models import Simulation
+
+CANCEL_KEY_PREFIX = "sim_cancelled:"
+CANCEL_TIMEOUT_IN_SECONDS = 60 * 60 * 24
+# how often a running analysis looks at the flag, at most
+CANCEL_CHECK_INTERVAL_IN_SECONDS = 2
+
+
+class AnalysisCancelled(CancelExecution):
+    def __init__(self, *args, **kwargs) -> None:
+        # a deleted simulation must not be picked up again by the task retries
+        super().__init__(False, *args, **kwargs)
+
+
+def cancel_key(sim_id) -> str:
+    return CANCEL_KEY_PREFIX + str(sim_id)
+
+
+def request_cancellation(sim_id):
+    cache.set(cancel_key(sim_id), True, CANCEL_TIMEOUT_IN_SECONDS)
+
+
+class CancellationToken:
+    """Checked by the running analysis between stages and while PLIP runs."""
+
+    def __init__(self, sim_id, lease=None) -> None:
+        self.sim_id = str(sim_id)
+        # a LeaseKeeper, the analysis stops once another worker may take it
+        self.lease = lease
+        self.cancelled = False
+        self.checked_at = None
+
+    def is_cancelled(self) -> bool:
+        if self.cancelled:
+            return True
+        if self.lease is not None and self.lease.is_lost():
+            print(f"Lost the lease of {self.sim_id}", flush=True)
+            self.cancelled = True
+            return True
+        now = time.monotonic()
+        if (
+            self.checked_at is not None
+            and now - self.checked_at < CANCEL_CHECK_INTERVAL_IN_SECONDS
+        ):
+            return False
+        self.checked_at = now
+        # the cache flag is the fast path, the database covers an evicted or missing cache
+        self.cancelled = bool(cache.get(cancel_key(self.sim_id))) or (
+            Simulation.objects.filter(sim_id=self.sim_id, was_deleted=True).exists()
+        )
+        return self.cancelled
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            print(f"Analysis of {self.sim_id} was cancelled", flush=True)
+            raise AnalysisCancelled()
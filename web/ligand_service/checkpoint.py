@@ -0,0 +1,172 @@
+from pathlib import Path
+from xml.parsers.expat import ExpatError
+import json
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from .plip_report import (
+    frame_from_dirname,
+    frame_from_pdbfile,
+    parse_plip_report,
+    records_to_dataframes,
+    set_frame,
+)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def write_json_atomically(path: Path, data):
+    # a worker killed mid-write leaves only the temporary file behind,
+    # concurrent writers each get their own one
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def count_completed_frames(checkpoint_dir: Path) -> int:
+    """Frames done according to the manifest, read without changing the checkpoint."""
+    try:
+        with open(checkpoint_dir / MANIFEST_FILENAME) as f:
+            return len(json.load(f)["completed"])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+class FrameCheckpoint:
+    """Parsed PLIP results of every finished frame, kept in the work directory,
+    so a retried analysis only processes the frames that are still missing.
+    """
+
+    def __init__(
+        self, checkpoint_dir: Path, frames: list[int], engine: str = "plip"
+    ) -> None:
+        self.checkpoint_dir = checkpoint_dir
+        self.frames = list(frames)
+        # results of different engines are never mixed
+        self.engine = engine
+        self.selected = set(self.frames)
+        self.completed = set()
+        self.load_manifest()
+
+    @property
+    def manifest_file(self) -> Path:
+        return self.checkpoint_dir / MANIFEST_FILENAME
+
+    def frame_file(self, frame: int) -> Path:
+        return self.checkpoint_dir / f"frame{frame}.json"
+
+    def load_manifest(self):
+        if self.manifest_file.is_file():
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            if (
+                manifest["frames"] == self.frames
+                and manifest.get("engine", "plip") == self.engine
+            ):
+                self.completed = {
+                    frame
+                    for frame in manifest["completed"]
+                    if self.frame_file(frame).is_file()
+                }
+                return
+            print(
+                "Frame selection or engine changed, discarding the checkpoint",
+                flush=True,
+            )
+            shutil.rmtree(self.checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.write_manifest()
+
+    def write_manifest(self):
+        write_json_atomically(
+            self.manifest_file,
+            {
+                "frames": self.frames,
+                "engine": self.engine,
+                "completed": sorted(self.completed),
+            },
+        )
+
+    def missing(self) -> list[int]:
+        return [frame for frame in self.frames if frame not in self.completed]
+
+    def store(self, frame: int, records: dict[str, list[dict]]):
+        write_json_atomically(self.frame_file(frame), records)
+        self.completed.add(frame)
+
+    def store_by_pdbfile(self, records_by_pdbfile: dict[str, dict[str, list[dict]]]):
+        """Stores records of frames, by the pdb file they were extracted to."""
+        for pdbfile, records in records_by_pdbfile.items():
+            frame = frame_from_pdbfile(pdbfile)
+            self.store(frame, set_frame(records, frame))
+        self.write_manifest()
+
+    def store_by_frame(self, records_by_frame: dict[int, dict[str, list[dict]]]):
+        for frame, records in records_by_frame.items():
+            self.store(frame, records)
+        self.write_manifest()
+
+    def store_empty(self, frames: list[int]):
+        for frame in frames:
+            self.store(frame, {"interactions": [], "ligands": []})
+        self.write_manifest()
+
+    def store_represented(self, representatives: dict[int, int]):
+        """Gives the frames left out the records of their representative."""
+        records_by_frame = {}
+        for frame, representative in representatives.items():
+            if frame in self.completed or representative not in self.completed:
+                continue
+            if representative not in records_by_frame:
+                with open(self.frame_file(representative)) as f:
+                    records_by_frame[representative] = json.load(f)
+            self.store(frame, set_frame(records_by_frame[representative], frame))
+        self.write_manifest()
+
+    def collect_plip_results(self, plip_dir: Path, final: bool = False) -> int:
+        """Stores the reports PLIP has finished since the last call.
+        Returns the number of completed frames.
+        """
+        if not plip_dir.is_dir():
+            return len(self.completed)
+        collected = 0
+        for frame_dir in plip_dir.iterdir():
+            if not frame_dir.is_dir():
+                continue
+            frame = frame_from_dirname(frame_dir.name)
+            report_file = frame_dir / "report.xml"
+            if (
+                frame in self.completed
+                or frame not in self.selected
+                or not report_file.is_file()
+            ):
+                continue
+            try:
+                records = parse_plip_report(report_file, frame)
+            except ExpatError:
+                # plip might still be writing the report
+                if final:
+                    raise
+                continue
+            self.store(frame, records)
+            collected += 1
+        if collected > 0:
+            self.write_manifest()
+        return len(self.completed)
+
+    def load_dataframes(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        records_by_frame = {}
+        for frame in self.frames:
+            with open(self.frame_file(frame)) as f:
+                records_by_frame[frame] = json.load(f)
+        return records_to_dataframes(records_by_frame)
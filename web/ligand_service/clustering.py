@@ -0,0 +1,85 @@
+"""Clustering of frames by the geometry of the pocket, so PLIP only has to analyse
+a few representative frames of every cluster.
+"""
+
+import numpy as np
+
+KMEANS_ITERATIONS = 20
+# the same trajectory always gets the same representatives
+CLUSTERING_SEED = 0
+# largest difference of the contact fraction of a residue from the analysis of every
+# frame, per interaction type, accepted by the validate_clusters command
+CONTACT_FRACTION_TOLERANCE = 0.05
+
+
+def squared_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    distances = (
+        (a * a).sum(axis=1)[:, None] - 2 * a @ b.T + (b * b).sum(axis=1)[None, :]
+    )
+    return np.maximum(distances, 0)
+
+
+def kmeans(
+    features: np.ndarray, cluster_count: int, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray]:
+    """Cluster of every row and the cluster centres, started with k-means++."""
+    centers = [features[rng.integers(len(features))]]
+    closest = squared_distances(features, centers[0][None, :])[:, 0]
+    while len(centers) < cluster_count:
+        total = closest.sum()
+        if total <= 0:
+            # fewer distinct frames than clusters
+            break
+        center = features[rng.choice(len(features), p=closest / total)]
+        centers.append(center)
+        closest = np.minimum(
+            closest, squared_distances(features, center[None, :])[:, 0]
+        )
+    centers = np.array(centers)
+    for _ in range(KMEANS_ITERATIONS):
+        labels = squared_distances(features, centers).argmin(axis=1)
+        new_centers = np.array(
+            [
+                (
+                    features[labels == cluster].mean(axis=0)
+                    if (labels == cluster).any()
+                    else centers[cluster]
+                )
+                for cluster in range(len(centers))
+            ]
+        )
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    return squared_distances(features, centers).argmin(axis=1), centers
+
+
+def choose_representatives(
+    features: np.ndarray, cluster_count: int, sample_size: int = 0
+) -> np.ndarray:
+    """Position of the frame standing in for every frame. The medoid of every
+    cluster and sample_size random other members are analysed, the rest of the
+    members get the results of the closest analysed frame of their cluster.
+    """
+    representatives = np.arange(len(features))
+    if len(features) <= cluster_count:
+        return representatives
+    # k-means++ needs the probabilities to sum up to one exactly
+    features = np.asarray(features, dtype=np.float64)
+    rng = np.random.default_rng(CLUSTERING_SEED)
+    labels, centers = kmeans(features, cluster_count, rng)
+    for cluster, center in enumerate(centers):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) == 0:
+            continue
+        medoid = members[squared_distances(features[members], center[None, :]).argmin()]
+        chosen = [medoid]
+        others = members[members != medoid]
+        if sample_size > 0 and len(others) > 0:
+            chosen.extend(
+                rng.choice(others, min(sample_size, len(others)), replace=False)
+            )
+        chosen = np.array(chosen)
+        nearest = squared_distances(features[members], features[chosen]).argmin(axis=1)
+        representatives[members] = chosen[nearest]
+    return representatives
@@ -2,18 +2,35 @@ import sys
 import os
 import subprocess as sb
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
 import tempfile
 import datetime
+import time
 import re
 import logging
+import math
 import shutil
 
+import numpy as np
 import requests
-from vmd import molecule, atomsel
+from vmd import molecule, atomsel, vmdnumpy
 from Bio import SearchIO
 
 from .models import GPCRdbResidueAPI
+from .cancellation import AnalysisCancelled
+from .plip_cache import PlipResultCache
+from .plip_engine import (
+    PLIP_ENGINE_POOL,
+    get_plip_options,
+    get_worker_pool,
+    stop_processes,
+)
+from .clustering import choose_representatives
+from .desmond import DESMOND_CHUNK_FRAMES, open_desmond
+from .frame_index import get_frame_index, write_frames
+from .mapped_trajectory import map_trajectory
+from .selection import FRAME_SELECTION, FrameSelector, index_selection
+from .utils import choose_scratch_dir, chunked
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -23,12 +40,12 @@ BLASTDB_PATH = Path("blast/blast_db").absolute()
 
 DYNAMIC_CONTACTS_PATH = os.path.abspath("getcontacts/get_dynamic_contacts.py")
 CURRENT_INTERPRETER_PATH = sys.executable
-CORES_AVAILABLE = "12"
 GPCRDB_NUMBERING_ENDPOINT = (
     "https://gpcrdb.org/services/structure/assign_generic_numbers"
 )
 GPCRDB_RESIDUES_EXTENDED_ENDPOINT = "https://gpcrdb.org/services/residues/extended/"
 THREADS_FOR_PLIP = os.environ.get("THREADS_FOR_PLIP", "1")
+PLIP_POLL_INTERVAL_IN_SECONDS = 2
 
 THREE_TO_ONE = {
     "ALA": "A",
@@ -71,7 +88,15 @@ def get_sequence_chains(
     topology_file: Path, trajectory_file: Path
 ) -> dict[str, dict[int, str]]:
     molid = molecule.load(filetype(topology_file), str(topology_file))
-    molecule.read(molid, filetype(trajectory_file), str(trajectory_file))
+    # the sequence is the same in every frame
+    molecule.read(
+        molid,
+        filetype(trajectory_file),
+        str(trajectory_file),
+        first=0,
+        last=0,
+        waitfor=-1,
+    )
 
     protein = atomsel("protein", molid=molid)
     structure = {}
@@ -308,9 +333,27 @@ def create_translation_dict_by_blast(
     return (result_dict, alignment_scores) if len(result_dict) > 0 else None
 
 
+def count_plip_frames_done(plip_dir: Path) -> int:
+    # plip creates one directory per frame, as soon as it starts working on it
+    return len([x for x in plip_dir.iterdir() if x.is_dir()])
+
+
 def get_results_plip(
-    pdbfiles: list[Path], outdir: Path | None = None, worker_count: int = 1
+    pdbfiles: list[Path],
+    outdir: Path | None = None,
+    worker_count: int = 1,
+    on_progress: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+    result_cache: PlipResultCache | None = None,
+    on_records: Callable[[dict[str, dict]], None] | None = None,
 ):
+    if result_cache is not None:
+        cached = result_cache.lookup(pdbfiles)
+        if on_records is not None and len(cached) > 0:
+            on_records(cached)
+        pdbfiles = [pdbfile for pdbfile in pdbfiles if str(pdbfile) not in cached]
+    if len(pdbfiles) == 0:
+        return True
     if outdir is not None:
         prev_wd = os.getcwd()
         os.chdir(outdir)
@@ -326,17 +369,12 @@ def get_results_plip(
         if len(pdbfiles_part) == 0:
             continue
         process = sb.Popen(
-            [
-                "plip",
-                "-v",
-                "-x",
-                "-f",
-            ]
-            + pdbfiles_part,
+            ["plip"] + get_plip_options() + ["-f"] + pdbfiles_part,
             stdout=sb.PIPE,
             stderr=sb.STDOUT,
             text=True,
             bufsize=1,
+            start_new_session=True,
         )
         processes.append(process)
 
@@ -345,25 +383,59 @@ def get_results_plip(
 
     assert process.stdout is not None
 
-    [process.wait() for process in processes]
-    process.wait()
+    try:
+        while any(process.poll() is None for process in processes):
+            if should_stop is not None and should_stop():
+                print("PLIP: Stopping!", flush=True)
+                raise AnalysisCancelled()
+            if on_progress is not None and outdir is not None:
+                on_progress(count_plip_frames_done(outdir))
+            time.sleep(PLIP_POLL_INTERVAL_IN_SECONDS)
+    except BaseException:
+        # never leave plip running behind a failed or cancelled analysis
+        stop_processes(processes)
+        raise
+    if on_progress is not None and outdir is not None:
+        on_progress(count_plip_frames_done(outdir))
     print("PLIP: Done!")
-    return process.returncode == 0
-
-
-def get_trajectory_frame_count(topology_file: Path, trajectory_file: Path) -> int:
-    molid = molecule.load(filetype(topology_file), str(topology_file))
-    num_frames = molecule.numframes(molid)
-    print("Number of frames before loading trajectory", num_frames)
-    molecule.read(
-        molid=molid,
-        filetype=filetype(trajectory_file),
-        filename=str(trajectory_file),
-        waitfor=-1,
+    if result_cache is not None and outdir is not None:
+        result_cache.store_reports(pdbfiles, outdir)
+    return all(process.returncode == 0 for process in processes)
+
+
+def get_results_plip_pool(
+    frame_pdbs: Iterator[tuple[str, str]],
+    worker_count: int,
+    on_records: Callable[[dict[str, dict]], None],
+    on_progress: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+    result_cache: PlipResultCache | None = None,
+):
+    def store_records(records_by_pdbfile: dict[str, dict]):
+        if result_cache is not None:
+            for pdbfile, records in records_by_pdbfile.items():
+                result_cache.put(pdbfile, records)
+        on_records(records_by_pdbfile)
+
+    def uncached_frame_pdbs():
+        for pdbfile, pdb in frame_pdbs:
+            records = result_cache.get(pdbfile, pdb) if result_cache else None
+            if records is not None:
+                on_records({pdbfile: records})
+                continue
+            yield pdbfile, pdb
+
+    print("Starting plip worker pool", flush=True)
+    failed = get_worker_pool(worker_count).run(
+        uncached_frame_pdbs(),
+        store_records,
+        on_progress=on_progress,
+        should_stop=should_stop,
     )
-    count = molecule.numframes(molid) - num_frames
-    molecule.delete(molid)
-    return count
+    if result_cache is not None:
+        result_cache.evict()
+    print("PLIP: Done!")
+    return len(failed) == 0
 
 
 WATER_SYNONYMS = [
@@ -398,72 +470,438 @@ residue_map = {
 }
 
 
-def get_frames_from_trajectory(
-    topology_file: Path, trajectory_file: Path, outdir: Path, frames: list[int]
-) -> list[Path]:
-    molid = molecule.load(filetype(topology_file), str(topology_file))
-    num_frames = molecule.numframes(molid)
-    print("Number of frames before loading trajectory", num_frames)
+# anything PLIP could take for a ligand, it decides itself which ones really are
+LIGAND_SELECTION = f"(not (protein or lipid or ion or {WATER_SELECTION}))"
 
-    if num_frames > 0:
-        frames = [frame + num_frames for frame in frames]
 
+def get_pocket_atom_count(topology_file: Path, trajectory_file: Path) -> int:
+    # atoms written out for the first frame, used by the cost model
+    molid = molecule.load(filetype(topology_file), str(topology_file))
+    num_frames = molecule.numframes(molid)
     molecule.read(
         molid=molid,
         filetype=filetype(trajectory_file),
         filename=str(trajectory_file),
-        first=min(frames),
-        last=max(frames),
+        first=0,
+        last=0,
         waitfor=-1,
     )
+    count = len(atomsel(FRAME_SELECTION, molid=molid, frame=num_frames))
+    molecule.delete(molid)
+    return count
 
-    print("Number of frames after loading trajectory", molecule.numframes(molid))
 
-    offset = min(frames)
-    outfiles = []
-    water = atomsel(f"{WATER_SELECTION}", molid=molid)
-    water.resname = "WAT"
-
-    for nonstandard_name, standard_name in residue_map.items():
-        residues = atomsel(f"resname {nonstandard_name}", molid=molid)
-        residues.resname = standard_name
-
-    for frame in frames:
-        protein = atomsel(
-            "(not lipid) and (same fragment as (within 7 of protein))",
-            molid=molid,
-            frame=frame - offset,
+# roughly the size of one ATOM record, used to estimate the size of written frames
+PDB_BYTES_PER_ATOM = 81
+# atom serial numbers have five digits
+PDB_MAX_SERIAL = 99999
+# residues clustered by their distance to the ligands, further distances are cut off
+CLUSTERING_POCKET_RADIUS = 8
+
+
+def conect_records(bonds: np.ndarray, written: np.ndarray) -> str:
+    """CONECT records of the bonds between written atoms, bonds are pairs of atom
+    indices both ways and sorted. VMD numbers the written atoms from 1 in the
+    order of their indices.
+    """
+    if len(written) > PDB_MAX_SERIAL:
+        return ""
+    bonds = bonds[np.isin(bonds, written).all(axis=1)]
+    serials = np.searchsorted(written, bonds) + 1
+    records = []
+    for serial in np.unique(serials[:, 0]):
+        bonded = serials[serials[:, 0] == serial, 1]
+        # at most four bonded atoms fit on a line
+        for start in range(0, len(bonded), 4):
+            records.append(
+                f"CONECT{serial:5d}"
+                + "".join(f"{other:5d}" for other in bonded[start : start + 4])
+            )
+    return "".join(record + "\n" for record in records)
+
+
+class TrajectoryFrames:
+    """The requested frames of a trajectory loaded into VMD, written out one by one."""
+
+    def __init__(
+        self,
+        topology_file: Path,
+        trajectory_file: Path,
+        frames: list[int],
+        pocket_radius: int | None = None,
+        water_shell_distance: int | None = None,
+        keep_waters: bool = True,
+        topology_bonds: bool = False,
+    ) -> None:
+        self.molid = molecule.load(filetype(topology_file), str(topology_file))
+        num_frames = molecule.numframes(self.molid)
+        print("Number of frames before loading trajectory", num_frames)
+        self.frames = sorted(frames)
+        offsets = get_frame_index(trajectory_file)
+        self.mapped = map_trajectory(trajectory_file)
+        atom_count = molecule.numatoms(self.molid)
+        if self.mapped is not None and self.mapped.atom_count != atom_count:
+            self.mapped = None
+        if offsets is not None:
+            # only the frames asked for are copied out and read
+            read_frames = self.frames
+            self.read_indexed(trajectory_file, offsets)
+        elif self.mapped is not None:
+            # VMD holds a single frame, the others are copied into it when needed
+            read_frames = self.frames[:1]
+            molecule.read(
+                molid=self.molid,
+                filetype=filetype(trajectory_file),
+                filename=str(trajectory_file),
+                first=self.frames[0],
+                last=self.frames[0],
+                waitfor=-1,
+            )
+            self.slot = num_frames
+            self.current_frame = self.frames[0]
+        else:
+            # frames left out by a common stride are not even read
+            stride = (
+                math.gcd(*[b - a for a, b in zip(self.frames, self.frames[1:])]) or 1
+            )
+            read_frames = list(range(self.frames[0], self.frames[-1] + 1, stride))
+            chunks = [read_frames]
+            desmond = open_desmond(trajectory_file)
+            if desmond is not None:
+                chunks = desmond.stream(chunked(read_frames, DESMOND_CHUNK_FRAMES))
+            for chunk in chunks:
+                molecule.read(
+                    molid=self.molid,
+                    filetype=filetype(trajectory_file),
+                    filename=str(trajectory_file),
+                    first=chunk[0],
+                    last=chunk[-1],
+                    stride=stride,
+                    waitfor=-1,
+                )
+        print(
+            "Number of frames after loading trajectory", molecule.numframes(self.molid)
         )
-        outfile = str(outdir / f"frame{frame}.pdb")
+        # the frames of the topology come first
+        self.loaded_frames = {
+            frame: num_frames + position for position, frame in enumerate(read_frames)
+        }
+
+        # waters are still under their original names here
+        self.selector = FrameSelector(self.molid, LIGAND_SELECTION, WATER_SELECTION)
+        self.water_shell_distance = water_shell_distance
+        self.keep_waters = keep_waters
+        self.ligand_bonds = self.get_ligand_bonds() if topology_bonds else None
+        # the pocket is the same for every frame, otherwise the selection is redone
+        self.pocket = None
+        self.pocket_mask = None
+        if pocket_radius:
+            self.pocket_mask = self.get_pocket_mask(pocket_radius)
+        # the water shell moves with every frame, the pocket does not
+        if self.pocket_mask is not None and (
+            water_shell_distance is None or not keep_waters
+        ):
+            pocket = self.pocket_mask
+            if not keep_waters:
+                pocket = pocket & ~self.selector.water
+            self.pocket = atomsel(
+                index_selection(np.flatnonzero(pocket)), molid=self.molid
+            )
+
+        water = atomsel(f"{WATER_SELECTION}", molid=self.molid)
+        water.resname = "WAT"
+
+        for nonstandard_name, standard_name in residue_map.items():
+            residues = atomsel(f"resname {nonstandard_name}", molid=self.molid)
+            residues.resname = standard_name
+
+    def read_indexed(self, trajectory_file: Path, offsets: np.ndarray):
+        frame_bytes = int(sum(offsets[f + 1] - offsets[f] for f in self.frames))
+        with tempfile.TemporaryDirectory(
+            prefix="frames_", dir=choose_scratch_dir(frame_bytes)
+        ) as tmp_dir:
+            frames_file = Path(tmp_dir) / f"frames{trajectory_file.suffix}"
+            write_frames(trajectory_file, offsets, self.frames, frames_file)
+            molecule.read(
+                molid=self.molid,
+                filetype=filetype(trajectory_file),
+                filename=str(frames_file),
+                waitfor=-1,
+            )
+
+    def loaded_frame(self, frame: int) -> int:
+        if self.mapped is None:
+            return self.loaded_frames[frame]
+        if frame != self.current_frame:
+            self.mapped.read_into(frame, vmdnumpy.timestep(self.molid, self.slot))
+            self.current_frame = frame
+        return self.slot
+
+    def coordinates(self, frame: int, atoms: slice = slice(None)) -> np.ndarray:
+        """Atoms by xyz coordinates of a range of atoms of the frame, a view that
+        mapped frames do not have to be copied to VMD for.
+        """
+        if self.mapped is not None:
+            return self.mapped.frame_view(frame, atoms)
+        return vmdnumpy.timestep(self.molid, self.loaded_frames[frame])[atoms]
+
+    def get_pocket_mask(self, radius: int) -> np.ndarray | None:
+        """Residues and waters within radius of the ligands in any of the frames."""
+        pocket = np.zeros(0, dtype=np.int64)
+        for frame in self.frames:
+            pocket = np.union1d(
+                pocket, self.selector.pocket_atoms(self.loaded_frame(frame), radius)
+            )
+        if len(pocket) == 0:
+            print("No ligand found, writing whole frames", flush=True)
+            return None
+        print(
+            f"Pocket of {len(pocket)} atoms within {radius} A of the ligands",
+            flush=True,
+        )
+        mask = np.zeros(len(self.selector.residue), dtype=bool)
+        mask[pocket] = True
+        return mask
+
+    def trim_waters(self, loaded_frame: int, selected: np.ndarray) -> np.ndarray:
+        """Only the waters that could bridge a ligand and the protein,
+        none of them without water bridges.
+        """
+        if not self.keep_waters:
+            return selected & ~self.selector.water
+        if self.water_shell_distance is None:
+            return selected
+        return self.selector.water_shell(
+            loaded_frame, selected, self.water_shell_distance
+        )
+
+    def get_selection(self, frame: int) -> Any:
+        if self.pocket is not None:
+            return self.pocket
+        loaded_frame = self.loaded_frame(frame)
+        selected = self.pocket_mask
+        if selected is None:
+            selected = self.selector.frame_mask(loaded_frame)
+        atoms = np.flatnonzero(self.trim_waters(loaded_frame, selected))
+        return atomsel(index_selection(atoms), molid=self.molid, frame=loaded_frame)
+
+    def skip_frames_without_ligand(self, distance: int) -> list[int]:
+        """Drops the frames without a ligand near the protein, PLIP would find
+        no contacts in them. Returns the dropped frames.
+        """
+        kept, skipped = [], []
+        for frame in self.frames:
+            if self.selector.ligand_near_protein(self.loaded_frame(frame), distance):
+                kept.append(frame)
+            else:
+                skipped.append(frame)
+        self.frames = kept
+        if len(skipped) > 0:
+            print(
+                f"Skipping {len(skipped)} frames without a ligand within {distance} A of the protein",
+                flush=True,
+            )
+        return skipped
+
+    def choose_representative_frames(
+        self, cluster_count: int, sample_size: int
+    ) -> dict[int, int]:
+        """Clusters the frames by the distances of the pocket residues to the ligands
+        and keeps only the representatives of every cluster.
+        Returns the representative of every frame that was dropped.
+        """
+        pocket = np.zeros(0, dtype=np.int64)
+        for frame in self.frames:
+            pocket = np.union1d(
+                pocket,
+                self.selector.pocket_atoms(
+                    self.loaded_frame(frame), CLUSTERING_POCKET_RADIUS
+                ),
+            )
+        if len(pocket) == 0:
+            return {}
+        features = np.stack(
+            [
+                self.selector.residue_ligand_distances(
+                    self.loaded_frame(frame), pocket, CLUSTERING_POCKET_RADIUS
+                )
+                for frame in self.frames
+            ]
+        )
+        positions = choose_representatives(features, cluster_count, sample_size)
+        deviation = np.sqrt(((features - features[positions]) ** 2).mean())
+        representatives = {
+            frame: self.frames[position]
+            for frame, position in zip(self.frames, positions)
+            if self.frames[position] != frame
+        }
+        self.frames = sorted(set(self.frames[position] for position in positions))
+        print(
+            f"Analysing {len(self.frames)} representative frames, "
+            f"pocket distances deviate from them by {deviation:.2f} A on average",
+            flush=True,
+        )
+        return representatives
+
+    def estimate_frame_bytes(self) -> int:
+        return len(self.get_selection(self.frames[0])) * PDB_BYTES_PER_ATOM
+
+    def get_ligand_bonds(self) -> np.ndarray:
+        """Bonds of the ligand atoms in the topology, both ways, sorted."""
+        ligand_atoms = np.flatnonzero(self.selector.ligand)
+        bonds = atomsel(index_selection(ligand_atoms), molid=self.molid).bonds
+        pairs = [
+            (atom, other)
+            for atom, bonded in zip(ligand_atoms, bonds)
+            for other in bonded
+            if self.selector.ligand[other]
+        ]
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    def write(self, frame: int, outfile: Path):
+        selection = self.get_selection(frame)
         molecule.write(
-            molid=molid,
+            molid=self.molid,
             filetype="pdb",
-            filename=str(outdir / f"frame{frame}.pdb"),
-            first=frame - offset,
-            last=frame - offset,
-            selection=protein,
+            filename=str(outfile),
+            first=self.loaded_frame(frame),
+            last=self.loaded_frame(frame),
+            selection=selection,
         )
+        if self.ligand_bonds is None or len(self.ligand_bonds) == 0:
+            return
+        pdb = Path(outfile).read_text()
+        if pdb.endswith("END\n"):
+            pdb = pdb[: -len("END\n")]
+        conect = conect_records(self.ligand_bonds, np.asarray(selection.index))
+        Path(outfile).write_text(pdb + conect + "END\n")
+
+    def close(self):
+        molecule.delete(self.molid)
+
+
+def get_frames_from_trajectory(
+    trajectory_frames: TrajectoryFrames,
+    outdir: Path,
+    on_progress: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+) -> list[str]:
+    outfiles = []
+    for frame_idx, frame in enumerate(trajectory_frames.frames):
+        if should_stop is not None and should_stop():
+            raise AnalysisCancelled()
+        if on_progress is not None:
+            on_progress(frame_idx)
+        outfile = str(outdir / f"frame{frame}.pdb")
+        trajectory_frames.write(frame, outfile)
         outfiles.append(outfile)
     return outfiles
 
 
+def iter_frame_pdbs(
+    trajectory_frames: TrajectoryFrames, scratch_dir: Path
+) -> Iterator[tuple[str, str]]:
+    """Yields the name and the pdb text of every frame. VMD can only write files,
+    each frame is kept in the scratch directory just until it is read back.
+    """
+    for frame in trajectory_frames.frames:
+        outfile = scratch_dir / f"frame{frame}.pdb"
+        trajectory_frames.write(frame, outfile)
+        pdb = outfile.read_text()
+        outfile.unlink()
+        yield str(outfile), pdb
+
+
 def get_interactions_from_trajectory(
     topology_file: Path,
     trajectory_file: Path,
     plip_dir: Path,
     frames_dir: Path,
     frames: list[int],
-):
-    frames_dir.mkdir(parents=True)
-    plip_dir.mkdir(parents=True)
+    on_progress: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+    on_extract_progress: Callable[[int], None] | None = None,
+    result_cache: PlipResultCache | None = None,
+    on_records: Callable[[dict[str, dict]], None] | None = None,
+    on_skipped: Callable[[list[int]], None] | None = None,
+) -> dict[int, int]:
+    """Runs PLIP on the frames. With representative frames enabled, returns the
+    frames left out by the frame whose results stand in for them.
+    """
+    # might be left over by an interrupted run, only the given frames are redone
+    plip_dir.mkdir(parents=True, exist_ok=True)
     tick = datetime.datetime.now()
-    pdbs = get_frames_from_trajectory(
-        topology_file, trajectory_file, frames_dir, frames
+    trajectory_frames = TrajectoryFrames(
+        topology_file,
+        trajectory_file,
+        frames,
+        pocket_radius=settings.POCKET_RADIUS,
+        water_shell_distance=settings.WATER_SHELL_DISTANCE,
+        keep_waters=settings.WATER_BRIDGES,
+        topology_bonds=settings.TOPOLOGY_HYDROGENS,
+    )
+    if settings.LIGAND_DISTANCE_CUTOFF is not None and on_skipped is not None:
+        skipped = trajectory_frames.skip_frames_without_ligand(
+            settings.LIGAND_DISTANCE_CUTOFF
+        )
+        if len(skipped) > 0:
+            on_skipped(skipped)
+        if len(trajectory_frames.frames) == 0:
+            trajectory_frames.close()
+            return {}
+    representatives = {}
+    if settings.REPRESENTATIVE_FRAME_CLUSTERS is not None:
+        representatives = trajectory_frames.choose_representative_frames(
+            settings.REPRESENTATIVE_FRAME_CLUSTERS,
+            settings.REPRESENTATIVE_FRAME_SAMPLE,
+        )
+    use_pool = settings.PLIP_ENGINE == PLIP_ENGINE_POOL and on_records is not None
+    # the pool streams the frames, only one per worker exists at a time,
+    # the plip command line tool needs all of them written out first
+    frames_in_flight = (
+        settings.MAX_THREADS_PER_WORKER + 1
+        if use_pool
+        else len(trajectory_frames.frames)
+    )
+    scratch_dir = choose_scratch_dir(
+        trajectory_frames.estimate_frame_bytes() * frames_in_flight
     )
+    if scratch_dir is not None:
+        frames_dir = Path(tempfile.mkdtemp(prefix="frames_", dir=scratch_dir))
+    else:
+        frames_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Writing frames to: {frames_dir}", flush=True)
     try:
-        get_results_plip(pdbs, plip_dir, settings.MAX_THREADS_PER_WORKER)
+        if use_pool:
+            assert on_records is not None
+            get_results_plip_pool(
+                iter_frame_pdbs(trajectory_frames, frames_dir),
+                settings.MAX_THREADS_PER_WORKER,
+                on_records,
+                on_progress=on_progress,
+                should_stop=should_stop,
+                result_cache=result_cache,
+            )
+        else:
+            pdbs = get_frames_from_trajectory(
+                trajectory_frames,
+                frames_dir,
+                on_progress=on_extract_progress,
+                should_stop=should_stop,
+            )
+            get_results_plip(
+                pdbs,
+                plip_dir,
+                settings.MAX_THREADS_PER_WORKER,
+                on_progress=on_progress,
+                should_stop=should_stop,
+                result_cache=result_cache,
+                on_records=on_records,
+            )
     finally:
-        shutil.rmtree(frames_dir)
+        trajectory_frames.close()
+        shutil.rmtree(frames_dir, ignore_errors=True)
     tock = datetime.datetime.now()
     print("Done...")
     print("Running time: ", (tock - tick))
+    return representatives
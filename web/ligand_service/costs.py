@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from statistics import median
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AnalysisStatus, InteractionEngine, Simulation
+
+SECONDS_PER_ATOM_FRAME_KEY = "seconds_per_atom_frame"
+SECONDS_PER_ATOM_FRAME_TIMEOUT_IN_SECONDS = 5 * 60
+# used until enough analyses have finished, roughly 2 s per frame of a 5000 atom pocket
+DEFAULT_SECONDS_PER_ATOM_FRAME = 4e-4
+# share of the PLIP time the other engines take, a rough guess
+ENGINE_RELATIVE_COSTS = {
+    InteractionEngine.QUICK: 0.01,
+    InteractionEngine.GETCONTACTS: 0.1,
+}
+# number of recently finished analyses the rate is learned from
+COST_MODEL_HISTORY_SIZE = 50
+
+
+def get_atom_frame_count(sim: Simulation) -> int:
+    # the frames are analysed in every replica
+    if sim.atom_count is None or sim.frame_count is None:
+        return 0
+    return sim.atom_count * len(sim.get_frames()) * sim.get_replica_count()
+
+
+def compute_seconds_per_atom_frame() -> float:
+    finished = Simulation.objects.filter(
+        status=AnalysisStatus.FINISHED,
+        engine=InteractionEngine.PLIP,
+        atom_count__isnull=False,
+        frame_count__isnull=False,
+        analysis_started_at__isnull=False,
+        analysis_finished_at__isnull=False,
+    ).order_by("-analysis_finished_at")[:COST_MODEL_HISTORY_SIZE]
+    rates = []
+    for sim in finished:
+        work = get_atom_frame_count(sim)
+        if work <= 0:
+            continue
+        # analyses from before the worker time was recorded ran their replicas in turn
+        seconds = (
+            sim.analysis_worker_seconds
+            or (sim.analysis_finished_at - sim.analysis_started_at).total_seconds()
+        )
+        rates.append(seconds / work)
+    if len(rates) == 0:
+        return DEFAULT_SECONDS_PER_ATOM_FRAME
+    # median, a single stuck or failed-fast analysis should not skew the estimates
+    return median(rates)
+
+
+def get_seconds_per_atom_frame() -> float:
+    return cache.get_or_set(
+        SECONDS_PER_ATOM_FRAME_KEY,
+        compute_seconds_per_atom_frame,
+        SECONDS_PER_ATOM_FRAME_TIMEOUT_IN_SECONDS,
+    )
+
+
+def estimate_cost(
+    sim: Simulation, seconds_per_atom_frame: float | None = None
+) -> float:
+    """Estimated worker time of the whole analysis, in seconds."""
+    if seconds_per_atom_frame is None:
+        seconds_per_atom_frame = get_seconds_per_atom_frame()
+    cost = get_atom_frame_count(sim) * seconds_per_atom_frame
+    return cost * ENGINE_RELATIVE_COSTS.get(sim.engine, 1)
+
+
+def estimate_remaining_seconds(
+    sim: Simulation, seconds_per_atom_frame: float | None = None, slots: int = 1
+) -> float:
+    """Wall time until the analysis ends, its worker time is shared by slots workers."""
+    cost = (
+        sim.estimated_cost
+        if sim.estimated_cost is not None
+        else estimate_cost(sim, seconds_per_atom_frame)
+    )
+    duration = cost / slots
+    if sim.analysis_started_at is None:
+        return duration
+    elapsed = (datetime.now(timezone.utc) - sim.analysis_started_at).total_seconds()
+    return max(duration - elapsed, 0.0)
+
+
+def is_large(sim: Simulation) -> bool:
+    return (
+        settings.LARGE_ANALYSIS_THRESHOLD_IN_HOURS is not None
+        and sim.estimated_cost is not None
+        and sim.estimated_cost > settings.LARGE_ANALYSIS_THRESHOLD_IN_HOURS * 3600
+    )
@@ -0,0 +1,108 @@
+"""Desmond trajectories, _trj directories of frame files listed in a timekeys file.
+VMD decodes the frames one after the other, the frame files of the next chunk are
+only read into the page cache meanwhile, so it does not wait on the disk.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator
+import functools
+import struct
+
+from django.conf import settings
+import numpy as np
+
+DESMOND_TIMEKEYS_MAGIC = 0x4445534B
+# magic, frames per file and the size of every key
+DESMOND_TIMEKEYS_PROLOGUE_BYTES = 12
+# frames VMD reads at once while the next ones are read ahead
+DESMOND_CHUNK_FRAMES = 1000
+DESMOND_READ_BLOCK_BYTES = 4 * 1024 * 1024
+DESMOND_LISTED_TRAJECTORIES = 32
+
+
+def read_file(path: Path):
+    # the data itself is not needed, only the pages it leaves in the cache
+    with open(path, "rb", buffering=0) as f:
+        while f.read(DESMOND_READ_BLOCK_BYTES):
+            pass
+
+
+@functools.lru_cache(maxsize=DESMOND_LISTED_TRAJECTORIES)
+def list_frame_files(trj_dir: Path, timekeys_stamp: tuple[int, int]) -> list[Path]:
+    """Frame files of the _trj directory, listed again once the timekeys change."""
+    # frame files are numbered, large trajectories spread them over subdirectories
+    return sorted(
+        (path for path in trj_dir.rglob("frame*") if path.is_file()),
+        key=lambda path: path.name,
+    )
+
+
+def kept_frames(times: np.ndarray) -> np.ndarray:
+    """Positions of the frames VMD reads, a restarted run overwrites the frames
+    at or after the time it restarts from, like the dtr plugin does.
+    """
+    # the earliest time of the frames after every frame
+    later = np.minimum.accumulate(np.r_[np.inf, times[:0:-1]])[::-1]
+    return np.flatnonzero(times < later[: len(times)])
+
+
+class DesmondTrajectory:
+    """Frame files of a _trj directory, in the order of the frames."""
+
+    def __init__(self, trj_dir: Path) -> None:
+        timekeys = trj_dir / "timekeys"
+        with open(timekeys, "rb") as f:
+            prologue = f.read(DESMOND_TIMEKEYS_PROLOGUE_BYTES)
+            magic, self.frames_per_file, key_bytes = struct.unpack(">3I", prologue)
+            if magic != DESMOND_TIMEKEYS_MAGIC or self.frames_per_file == 0:
+                raise ValueError("Not a desmond timekeys file")
+            words = np.fromfile(f, dtype=">u4")
+        key_words = key_bytes // 4
+        keys = words[: len(words) // key_words * key_words].reshape(-1, key_words)
+        # the time of a key is a double split into its low and high word
+        times = ((keys[:, 1].astype(np.uint64) << np.uint64(32)) | keys[:, 0]).view(
+            np.float64
+        )
+        # frames of the timekeys by the frame numbers of VMD
+        self.keys = kept_frames(times)
+        self.frame_count = len(self.keys)
+        stat = timekeys.stat()
+        self.files = list_frame_files(trj_dir, (stat.st_size, stat.st_mtime_ns))
+        if len(self.files) * self.frames_per_file < len(keys):
+            raise ValueError("Frame files are missing")
+        self.read = set()
+
+    def prefetch(self, pool: ThreadPoolExecutor, frames: list[int]) -> list[Future]:
+        """Starts reading the files of the frames that were not read yet."""
+        files = sorted(
+            {int(self.keys[frame]) // self.frames_per_file for frame in frames}
+            - self.read
+        )
+        self.read.update(files)
+        return [pool.submit(read_file, self.files[file]) for file in files]
+
+    def stream(self, chunks: list[list[int]]) -> Iterator[list[int]]:
+        """Yields every chunk of frames once its files are read, the files of
+        the next chunk are read meanwhile.
+        """
+        with ThreadPoolExecutor(settings.MAX_THREADS_PER_WORKER) as pool:
+            pending = self.prefetch(pool, chunks[0]) if len(chunks) > 0 else []
+            for position, chunk in enumerate(chunks):
+                wait(pending)
+                if position + 1 < len(chunks):
+                    pending = self.prefetch(pool, chunks[position + 1])
+                yield chunk
+
+
+def open_desmond(trajectory_file: Path) -> DesmondTrajectory | None:
+    """The Desmond trajectory of the clickme.dtr stub, None for other formats."""
+    if trajectory_file.suffix != ".dtr":
+        return None
+    try:
+        return DesmondTrajectory(trajectory_file.parent)
+    except (OSError, ValueError, ZeroDivisionError, struct.error) as e:
+        print(
+            f"Can not list the frames of {trajectory_file.parent.name}: {e}", flush=True
+        )
+        return None
@@ -0,0 +1,124 @@
+"""Byte offsets of the frames of xtc and trr trajectories, kept beside the trajectory.
+Both formats can not be seeked, every frame is compressed or sized on its own,
+with the offsets any frames are copied into a small trajectory VMD reads whole.
+The frames of a trajectory are still extracted by a single worker, only replicas
+are spread over workers.
+"""
+
+from pathlib import Path
+import os
+import struct
+
+import numpy as np
+
+XTC_MAGIC = 1995
+TRR_MAGIC = 1993
+# magic, atoms, step, time, box and atoms again
+XTC_HEADER_BYTES = 56
+# precision, smallest and largest coordinates and the smallest index
+XTC_COMPRESSION_BYTES = 32
+# up to this many atoms the coordinates are not compressed
+XTC_UNCOMPRESSED_ATOMS = 9
+# ir, e, box, vir, pres, top, sym, x, v and f sizes, atoms, step and energies
+TRR_HEADER_INTS = 13
+INDEX_SUFFIX = ".offsets.npy"
+
+
+def padded(size: int) -> int:
+    # xdr pads everything to four bytes
+    return (size + 3) // 4 * 4
+
+
+def read_ints(f, count: int) -> tuple[int, ...] | None:
+    data = f.read(4 * count)
+    if len(data) < 4 * count:
+        return None
+    return struct.unpack(f">{count}i", data)
+
+
+def xtc_frame_bytes(f) -> int | None:
+    header = f.read(XTC_HEADER_BYTES)
+    if len(header) < XTC_HEADER_BYTES:
+        return None
+    magic, atom_count = struct.unpack(">2i", header[:8])
+    if magic != XTC_MAGIC:
+        raise ValueError("Not an xtc frame")
+    if atom_count <= XTC_UNCOMPRESSED_ATOMS:
+        return XTC_HEADER_BYTES + atom_count * 3 * 4
+    f.seek(XTC_COMPRESSION_BYTES, os.SEEK_CUR)
+    (compressed_bytes,) = read_ints(f, 1)
+    return XTC_HEADER_BYTES + XTC_COMPRESSION_BYTES + 4 + padded(compressed_bytes)
+
+
+def trr_frame_bytes(f) -> int | None:
+    start = f.tell()
+    ints = read_ints(f, 3)
+    if ints is None:
+        return None
+    magic, _, version_bytes = ints
+    if magic != TRR_MAGIC:
+        raise ValueError("Not a trr frame")
+    f.seek(padded(version_bytes), os.SEEK_CUR)
+    sizes = read_ints(f, TRR_HEADER_INTS)
+    box, x, v, force, atom_count = sizes[2], sizes[7], sizes[8], sizes[9], sizes[10]
+    # time and lambda are single or double precision, like the coordinates
+    if box > 0:
+        real_bytes = box // 9
+    else:
+        real_bytes = max(x, v, force) // (atom_count * 3)
+    header_bytes = f.tell() - start + 2 * real_bytes
+    return header_bytes + sum(sizes[:10])
+
+
+FRAME_BYTES = {"xtc": xtc_frame_bytes, "trr": trr_frame_bytes}
+
+
+def index_path(trajectory_file: Path) -> Path:
+    return trajectory_file.with_name(trajectory_file.name + INDEX_SUFFIX)
+
+
+def build_frame_index(trajectory_file: Path) -> np.ndarray:
+    """Offset of every frame and the end of the last one."""
+    frame_bytes = FRAME_BYTES[trajectory_file.suffix[1:]]
+    offsets = [0]
+    with open(trajectory_file, "rb") as f:
+        while (size := frame_bytes(f)) is not None:
+            offsets.append(offsets[-1] + size)
+            f.seek(offsets[-1])
+    # an incomplete last frame is left out, like VMD does
+    if offsets[-1] > trajectory_file.stat().st_size:
+        offsets.pop()
+    return np.array(offsets, dtype=np.int64)
+
+
+def get_frame_index(trajectory_file: Path) -> np.ndarray | None:
+    """Frame offsets of the trajectory, built once and stored beside it.
+    None for formats that can not be indexed or broken trajectories.
+    """
+    if trajectory_file.suffix[1:] not in FRAME_BYTES:
+        return None
+    path = index_path(trajectory_file)
+    # a trajectory uploaded again under the same name is indexed again
+    if path.is_file() and path.stat().st_mtime >= trajectory_file.stat().st_mtime:
+        return np.load(path)
+    try:
+        offsets = build_frame_index(trajectory_file)
+    except (ValueError, TypeError, ZeroDivisionError) as e:
+        print(f"Can not index {trajectory_file.name}: {e}", flush=True)
+        return None
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, offsets)
+    os.replace(tmp_path, path)
+    print(f"Indexed {len(offsets) - 1} frames of {trajectory_file.name}", flush=True)
+    return offsets
+
+
+def write_frames(
+    trajectory_file: Path, offsets: np.ndarray, frames: list[int], outfile: Path
+):
+    """Copies the frames into a trajectory of the same format."""
+    with open(trajectory_file, "rb") as src, open(outfile, "wb") as dst:
+        for frame in frames:
+            src.seek(offsets[frame])
+            dst.write(src.read(offsets[frame + 1] - offsets[frame]))
@@ -0,0 +1,204 @@
+"""Interactions of the whole trajectory found by getcontacts in a single run,
+with its own worker processes, instead of writing out every frame for PLIP.
+"""
+
+from pathlib import Path
+from typing import Callable
+import math
+import subprocess as sb
+import time
+
+from django.conf import settings
+from vmd import atomsel, molecule
+
+from .cancellation import AnalysisCancelled
+from .contacts import (
+    CURRENT_INTERPRETER_PATH,
+    DYNAMIC_CONTACTS_PATH,
+    LIGAND_SELECTION,
+    TrajectoryFrames,
+    filetype,
+    residue_map,
+)
+from .plip_engine import stop_processes
+from .plip_report import interaction_record
+from .quick_engine import get_ligand_residues, ligand_identity, read_ligand
+
+GETCONTACTS_POLL_INTERVAL_IN_SECONDS = 2
+# interaction types getcontacts looks for
+GETCONTACTS_ITYPES = ["hp", "hb", "sb", "ps", "ts", "pc"]
+# PLIP report type of every getcontacts type, ligand hydrogen bonds
+# come split by the side chain or backbone they bind to
+GETCONTACTS_INTERACTION_TYPES = {
+    "hp": "hydrophobic_interactions",
+    "hbls": "hydrogen_bonds",
+    "hblb": "hydrogen_bonds",
+    "sb": "salt_bridges",
+    "ps": "pi_stacks",
+    "ts": "pi_stacks",
+    "pc": "pi_cation_interactions",
+}
+
+
+def get_ligands(
+    topology_file: Path, trajectory_file: Path, frame: int
+) -> dict[tuple[str, str, str], dict]:
+    """Identity of every ligand residue, by its chain, name and number."""
+    trajectory_frames = TrajectoryFrames(topology_file, trajectory_file, [frame])
+    try:
+        molid = trajectory_frames.molid
+        everything = atomsel("all", molid=molid)
+        chains = everything.chain
+        resnames = everything.resname
+        resids = everything.resid
+        ligands = {}
+        for atoms in get_ligand_residues(trajectory_frames):
+            atom = atoms[0]
+            ligands[(chains[atom], resnames[atom], str(resids[atom]))] = (
+                ligand_identity(
+                    read_ligand(molid, atoms),
+                    chains[atom],
+                    resnames[atom],
+                    resids[atom],
+                )
+            )
+        return ligands
+    finally:
+        trajectory_frames.close()
+
+
+def write_topology_pdb(topology_file: Path, outfile: Path):
+    # getcontacts picks the VMD plugin by the file extension, maestro files
+    # need another one, their structure is handed over as a pdb
+    molid = molecule.load(filetype(topology_file), str(topology_file))
+    molecule.write(molid=molid, filetype="pdb", filename=str(outfile), first=0, last=0)
+    molecule.delete(molid)
+
+
+def atom_residue(label: str) -> tuple[str, str, str]:
+    # getcontacts atoms are written as chain:resname:resid:name:index
+    chain, resname, resid = label.split(":")[:3]
+    return chain, residue_map.get(resname, resname), resid
+
+
+def parse_dynamic_contacts(
+    output: Path, frames: list[int], ligands: dict[tuple[str, str, str], dict]
+) -> dict[int, dict[str, list[dict]]]:
+    """Interaction records of every frame, one per interaction type, residue
+    and ligand, as getcontacts lists every pair of atoms.
+    """
+    records_by_frame = {frame: {"interactions": [], "ligands": []} for frame in frames}
+    seen = set()
+    # frames are numbered from 0 in the output, the header tells where they start
+    beg, stride = 0, 1
+    with open(output) as f:
+        for line in f:
+            if line.startswith("#"):
+                header = dict(
+                    token.split(":", 1) for token in line[1:].split() if ":" in token
+                )
+                beg = int(header.get("beg", beg))
+                stride = int(header.get("stride", stride))
+                continue
+            columns = line.rstrip("\n").split("\t")
+            interaction_type = GETCONTACTS_INTERACTION_TYPES.get(columns[1], None)
+            frame = beg + int(columns[0]) * stride
+            if interaction_type is None or frame not in records_by_frame:
+                continue
+            residues = [atom_residue(label) for label in columns[2:]]
+            ligand = next((r for r in residues if r in ligands), None)
+            residue = next((r for r in residues if r not in ligands), None)
+            if ligand is None or residue is None:
+                continue
+            key = (frame, interaction_type, residue, ligand)
+            if key in seen:
+                continue
+            seen.add(key)
+            records = records_by_frame[frame]
+            records["interactions"].append(
+                interaction_record(
+                    frame,
+                    interaction_type,
+                    {
+                        "reschain": residue[0],
+                        "restype": residue[1],
+                        "resnr": residue[2],
+                        "reschain_lig": ligand[0],
+                        "restype_lig": ligand[1],
+                        "resnr_lig": ligand[2],
+                    },
+                )
+            )
+            if ligands[ligand] not in records["ligands"]:
+                records["ligands"].append(ligands[ligand])
+    return records_by_frame
+
+
+def get_interactions_getcontacts(
+    topology_file: Path,
+    trajectory_file: Path,
+    work_dir: Path,
+    frames: list[int],
+    on_records: Callable[[dict[int, dict]], None],
+    should_stop: Callable[[], bool] | None = None,
+):
+    """Runs getcontacts over the frames of the trajectory, between the protein
+    and the ligands, and hands over the records of every frame.
+    """
+    frames = sorted(frames)
+    stride = math.gcd(*[b - a for a, b in zip(frames, frames[1:])]) or 1
+    ligands = get_ligands(topology_file, trajectory_file, frames[0])
+    print(f"getcontacts: {len(ligands)} ligands", flush=True)
+    if len(ligands) == 0:
+        on_records({frame: {"interactions": [], "ligands": []} for frame in frames})
+        return
+    work_dir.mkdir(parents=True, exist_ok=True)
+    topology = topology_file
+    if filetype(topology_file) != topology_file.suffix[1:]:
+        topology = work_dir / "topology.pdb"
+        write_topology_pdb(topology_file, topology)
+    output = work_dir / "contacts.tsv"
+    # getcontacts logs to the worker output, it is never read here
+    process = sb.Popen(
+        [
+            CURRENT_INTERPRETER_PATH,
+            DYNAMIC_CONTACTS_PATH,
+            "--topology",
+            str(topology),
+            "--trajectory",
+            str(trajectory_file),
+            "--output",
+            str(output),
+            "--cores",
+            str(settings.MAX_THREADS_PER_WORKER),
+            "--beg",
+            str(frames[0]),
+            "--end",
+            str(frames[-1]),
+            "--stride",
+            str(stride),
+            "--sele",
+            "protein",
+            "--sele2",
+            LIGAND_SELECTION,
+            "--ligand",
+            LIGAND_SELECTION,
+            "--itypes",
+            *GETCONTACTS_ITYPES,
+        ],
+        stderr=sb.STDOUT,
+        start_new_session=True,
+    )
+    try:
+        while process.poll() is None:
+            if should_stop is not None and should_stop():
+                print("getcontacts: Stopping!", flush=True)
+                raise AnalysisCancelled()
+            time.sleep(GETCONTACTS_POLL_INTERVAL_IN_SECONDS)
+    except BaseException:
+        stop_processes([process])
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"getcontacts failed with exit code {process.returncode}")
+    print("getcontacts: Done!", flush=True)
+    on_records(parse_dynamic_contacts(output, frames, ligands))
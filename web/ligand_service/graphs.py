@@ -3,6 +3,8 @@ import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
 
+from .plip_report import REPLICA_COLUMN
+
 PAGE_BG_COLOR = "#e5e7eb"
 COMMON_LAYOUT = dict(margin=dict(l=0, r=0, t=0, b=0), paper_bgcolor=PAGE_BG_COLOR)
 COMMON_LAYOUT_TABLE = dict(
@@ -42,13 +44,28 @@ def create_getcontacts_table(get_contacts_df: pd.DataFrame) -> str:
     return table
 
 
-def create_interaction_area_graph(contacts_df: pd.DataFrame) -> str:
+def create_interaction_area_graph(
+    contacts_df: pd.DataFrame, frames: list[int] | None = None
+) -> str:
     print(contacts_df.columns.values, flush=True)
     interaction_count = (
         contacts_df.groupby(["Frame", "Interaction type"])
         .agg(Count=("Residue number", "count"))
         .reset_index()
     )
+    if frames is not None:
+        # analysed frames without contacts are drawn as zero, not interpolated over
+        interaction_count = (
+            interaction_count.set_index(["Frame", "Interaction type"])
+            .reindex(
+                pd.MultiIndex.from_product(
+                    [frames, interaction_count["Interaction type"].unique()],
+                    names=["Frame", "Interaction type"],
+                ),
+                fill_value=0,
+            )
+            .reset_index()
+        )
     print(interaction_count, flush=True)
     fig = px.area(
         interaction_count,
@@ -72,7 +89,9 @@ def hex2rgba(hexcol, a):
     return f"rgba({int(hexcol[1:3], 16)},{int(hexcol[3:5], 16)},{int(hexcol[5:7], 16)},{a})"
 
 
-def create_time_resolved_map(contacts_df: pd.DataFrame) -> str:
+def create_time_resolved_map(
+    contacts_df: pd.DataFrame, frames: list[int] | None = None
+) -> str:
     sub_df = contacts_df[
         ["Frame", "Residue name", "Residue number", "Interaction type"]
     ]
@@ -83,7 +102,10 @@ def create_time_resolved_map(contacts_df: pd.DataFrame) -> str:
     residues = sorted(
         sub_df["residue_label"].unique(), key=lambda s: int(s.split("-")[-1])
     )
-    frames = np.arange(sub_df["Frame"].min(), sub_df["Frame"].max() + 1)
+    # only the analysed frames, they do not have to be consecutive
+    if frames is None:
+        frames = np.arange(sub_df["Frame"].min(), sub_df["Frame"].max() + 1)
+    frames = np.asarray(sorted(frames))
 
     types = [
         "Water bridge",
@@ -211,21 +233,32 @@ def _resnum_key(label):
 
 
 def contact_fraction_matrix(
-    group_df: pd.DataFrame, itype: str | None = None
+    group_df: pd.DataFrame,
+    itype: str | None = None,
+    frame_counts: dict[str, int] | None = None,
 ) -> pd.DataFrame:
     df = group_df.copy()
 
     df["ResidueLabel"] = [
         _reslabel(rn, rr) for rn, rr in zip(df["Residue name"], df["Residue number"])
     ]
+    df["Frame"] = pd.to_numeric(df["Frame"], errors="coerce")
+    if REPLICA_COLUMN in df.columns:
+        # the same frame of another replica is another sample
+        df["Frame"] = df["Frame"].mask(
+            df["Frame"].notna(),
+            df[REPLICA_COLUMN].astype(str) + ":" + df["Frame"].astype(str),
+        )
     total_frames = (
         df.groupby("Simulation name")["Frame"].nunique().rename("total_frames")
     )
+    if frame_counts:
+        # frames without any contact are not in the interactions
+        total_frames.update(pd.Series(frame_counts))
 
     if itype is not None:
         df = df[df["Interaction type"] == itype]
 
-    df["Frame"] = pd.to_numeric(df["Frame"], errors="coerce")
     df = df.dropna(subset=["Frame", "Simulation name", "ResidueLabel"])
 
     pres = (
@@ -251,15 +284,16 @@ def contact_fraction_matrix(
 
 def plot_contact_fraction_heatmap(
     group_df: pd.DataFrame,
+    frame_counts: dict[str, int] | None = None,
     title_prefix: str = "Contact fraction per residue",
     colorscale: str = "magma_r",
 ):
     types = [t for t in pd.unique(group_df["Interaction type"]) if pd.notna(t)]
     types_sorted = sorted(types)
 
-    mats = {"All types": contact_fraction_matrix(group_df, None)}
+    mats = {"All types": contact_fraction_matrix(group_df, None, frame_counts)}
     for t in types_sorted:
-        mats[t] = contact_fraction_matrix(group_df, t)
+        mats[t] = contact_fraction_matrix(group_df, t, frame_counts)
 
     all_sims = sorted(set().union(*[set(m.index) for m in mats.values()]))
     all_res = sorted(
@@ -345,6 +379,7 @@ IDENTIFIER_COLUMN = "Simulation name"
 
 def plot_correlation_covariance_heatmaps(
     df: pd.DataFrame,
+    frame_counts: dict[str, int] | None = None,
     colorscale: str = "magma_r",
 ):
     sims_exp_data = df[df.columns[-3:]].drop_duplicates().reset_index(drop=True)
@@ -373,6 +408,17 @@ def plot_correlation_covariance_heatmaps(
         .reset_index()
     )
 
+    # simulations analysed with different numbers of frames are compared per frame
+    per_frame = frame_counts is not None and set(
+        sims_frame_data[IDENTIFIER_COLUMN]
+    ).issubset(frame_counts)
+    if per_frame:
+        for counts in [interactions_by_sim_residue, interactions_by_sim_residue_type]:
+            counts["Frame"] = counts["Frame"] / counts[IDENTIFIER_COLUMN].map(
+                frame_counts
+            )
+    counted = "interactions per frame" if per_frame else "number of interactions"
+
     interactions_with_exp = interactions_by_sim.merge(sims_exp_data.iloc[:, :-1])
     EXP_DATA_COLUMN = interactions_with_exp.columns.to_list()[-1]
 
@@ -428,7 +474,7 @@ def plot_correlation_covariance_heatmaps(
 
     fig_corr.update_layout(
         paper_bgcolor=PAGE_BG_COLOR,
-        title=f"Correlation between number of interactions and {EXP_DATA_COLUMN}",
+        title=f"Correlation between {counted} and {EXP_DATA_COLUMN}",
         xaxis_title="Residue",
         yaxis_title="Interaction type",
         xaxis=dict(tickangle=270),
@@ -490,7 +536,7 @@ def plot_correlation_covariance_heatmaps(
 
     fig_cov.update_layout(
         paper_bgcolor=PAGE_BG_COLOR,
-        title=f"Covariance between number of interactions and {EXP_DATA_COLUMN}",
+        title=f"Covariance between {counted} and {EXP_DATA_COLUMN}",
         xaxis_title="Residue",
         yaxis_title="Interaction type",
         xaxis=dict(tickangle=270),
@@ -0,0 +1,116 @@
+"""Leases of the analyses handed to huey. A dispatched simulation holds a lease for
+STALLED_ANALYSIS_TIMEOUT_IN_MINUTES after its last renewal, the worker renews it
+from a process of its own on a timer, whatever stage the analysis is in. Only a
+simulation whose lease ran out is queued again, and a worker that lost the lease
+stops, so two workers never analyse the same simulation.
+"""
+
+from datetime import timedelta
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.utils.timezone import now as django_now
+from huey.contrib.djhuey import HUEY as huey
+
+from .models import AnalysisStatus, Simulation, get_task_ids
+
+LEASE_RENEWAL_IN_SECONDS = 60
+LEASED_STATUSES = [AnalysisStatus.QUEUED, AnalysisStatus.RUNNING]
+
+
+def get_lease_duration() -> timedelta | None:
+    if settings.STALLED_ANALYSIS_TIMEOUT_IN_MINUTES is None:
+        return None
+    return timedelta(minutes=settings.STALLED_ANALYSIS_TIMEOUT_IN_MINUTES)
+
+
+def get_lease_expiry():
+    duration = get_lease_duration()
+    if duration is None:
+        return None
+    return django_now() + duration
+
+
+def get_renewal_interval() -> float:
+    # a few renewals fit in every lease, one failing does not lose it
+    return min(LEASE_RENEWAL_IN_SECONDS, get_lease_duration().total_seconds() / 3)
+
+
+def renew_lease(sim_id, dispatch_id) -> bool:
+    """Extends the lease while the dispatch still holds it, False once it is lost."""
+    now = django_now()
+    renewed = Simulation.objects.filter(
+        sim_id=sim_id,
+        analysis_task_id=dispatch_id,
+        status__in=LEASED_STATUSES,
+        lease_expires_at__gt=now,
+    ).update(lease_expires_at=now + get_lease_duration())
+    return renewed > 0
+
+
+def grant_missing_lease(sim_id, dispatch_id) -> bool:
+    """Gives a full lease to a dispatch made before the leases or while they were
+    off, its worker may still be running, so it is not requeued right away.
+    """
+    granted = Simulation.objects.filter(
+        sim_id=sim_id,
+        analysis_task_id=dispatch_id,
+        status__in=LEASED_STATUSES,
+        lease_expires_at__isnull=True,
+    ).update(lease_expires_at=get_lease_expiry())
+    return granted > 0
+
+
+def expire_lease(sim_id, dispatch_id) -> bool:
+    """Puts the simulation back in the queue if the lease of the dispatch ran out."""
+    requeued = Simulation.objects.filter(
+        sim_id=sim_id,
+        lease_expires_at__lte=django_now(),
+        analysis_task_id=dispatch_id,
+        status__in=LEASED_STATUSES,
+    ).update(
+        analysis_task_id=None,
+        status=AnalysisStatus.QUEUED,
+        analysis_started_at=None,
+        lease_expires_at=None,
+    )
+    if requeued == 0:
+        return False
+    print(f"Requeueing analysis of {sim_id}, its lease ran out", flush=True)
+    # in case tasks of the replicas are still waiting in huey
+    sim = Simulation.objects.get(sim_id=sim_id)
+    for task_id in get_task_ids(dispatch_id, sim.get_replica_count()):
+        huey.revoke_by_id(task_id)
+    return True
+
+
+class LeaseKeeper:
+    """Renews the lease from a keep_lease process, long VMD reads holding the
+    interpreter of the worker do not delay it. The process ends when the lease
+    is lost or the worker is gone.
+    """
+
+    def __init__(self, sim_id, dispatch_id) -> None:
+        self.process = None
+        if get_lease_duration() is None:
+            return
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                str(settings.BASE_DIR / "manage.py"),
+                "keep_lease",
+                str(sim_id),
+                str(dispatch_id),
+                str(os.getpid()),
+            ]
+        )
+
+    def is_lost(self) -> bool:
+        return self.process is not None and self.process.poll() is not None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
@@ -0,0 +1,177 @@
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vmd import atomsel
+
+from ligand_service.contacts import (
+    FRAME_SELECTION,
+    TrajectoryFrames,
+    get_frames_from_trajectory,
+    iter_frame_pdbs,
+)
+from ligand_service.models import get_trajectory_frame_count
+from ligand_service.plip_engine import get_worker_pool
+from ligand_service.utils import choose_scratch_dir
+
+
+class Command(BaseCommand):
+    help = "Compares frames written to disk with frames streamed through memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("topology", type=Path)
+        parser.add_argument("trajectory", type=Path)
+        parser.add_argument("--frames", type=int, default=50)
+        parser.add_argument(
+            "--disk-dir",
+            type=Path,
+            default=settings.BASE_DIR / "user_uploads",
+            help="where frames are written in the disk mode, the upload volume by default",
+        )
+        parser.add_argument(
+            "--pocket-radius",
+            type=int,
+            default=settings.POCKET_RADIUS,
+            help="crop frames to the ligand pocket, the POCKET_RADIUS setting by default, 0 for whole frames",
+        )
+        parser.add_argument(
+            "--water-shell-distance",
+            type=int,
+            default=settings.WATER_SHELL_DISTANCE,
+            help="keep only waters this close to a ligand and the protein, the WATER_SHELL_DISTANCE setting by default, 0 for every water",
+        )
+        parser.add_argument(
+            "--selection",
+            action="store_true",
+            help="also compare the frame selection of VMD with the numpy one",
+        )
+        parser.add_argument(
+            "--plip",
+            action="store_true",
+            help="also run the frames through the PLIP worker pool",
+        )
+
+    def handle(self, *args, **options):
+        topology, trajectory = options["topology"], options["trajectory"]
+        frame_count = min(
+            get_trajectory_frame_count(topology, trajectory), options["frames"]
+        )
+        if frame_count <= 0:
+            raise CommandError("The trajectory has no frames!")
+        frames = list(range(frame_count))
+        trajectory_frames = TrajectoryFrames(
+            topology,
+            trajectory,
+            frames,
+            pocket_radius=options["pocket_radius"],
+            water_shell_distance=options["water_shell_distance"] or None,
+            keep_waters=settings.WATER_BRIDGES,
+            topology_bonds=settings.TOPOLOGY_HYDROGENS,
+        )
+        run_plip = options["plip"]
+        try:
+            frame_bytes = trajectory_frames.estimate_frame_bytes()
+            scratch_dir = choose_scratch_dir(
+                frame_bytes * (settings.MAX_THREADS_PER_WORKER + 1)
+            )
+            if options["selection"]:
+                self.compare_selections(trajectory_frames)
+            if run_plip:
+                self.warm_up(trajectory_frames, options["disk_dir"])
+            results = [
+                (
+                    f"disk ({options['disk_dir']})",
+                    self.run_disk(trajectory_frames, options["disk_dir"], run_plip),
+                ),
+            ]
+            if scratch_dir is None:
+                self.stdout.write("No scratch directory with enough space available")
+            else:
+                results.append(
+                    (
+                        f"memory ({scratch_dir})",
+                        self.run_memory(trajectory_frames, scratch_dir, run_plip),
+                    )
+                )
+        finally:
+            trajectory_frames.close()
+
+        self.stdout.write(
+            f"{frame_count} frames, about {frame_bytes / 1e6:.1f} MB each"
+            + (", with PLIP" if run_plip else "")
+        )
+        for name, seconds in results:
+            self.stdout.write(
+                f"{name:<40} {seconds:8.2f} s {frame_count / seconds:8.1f} frames/s"
+            )
+
+    def run_disk(self, trajectory_frames: TrajectoryFrames, disk_dir: Path, run_plip):
+        frames_dir = Path(tempfile.mkdtemp(prefix="benchmark_frames_", dir=disk_dir))
+        try:
+            tick = time.perf_counter()
+            pdbfiles = get_frames_from_trajectory(trajectory_frames, frames_dir)
+            frame_pdbs = ((pdbfile, Path(pdbfile).read_text()) for pdbfile in pdbfiles)
+            self.consume(frame_pdbs, run_plip)
+            return time.perf_counter() - tick
+        finally:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+
+    def run_memory(
+        self, trajectory_frames: TrajectoryFrames, scratch_dir: Path, run_plip
+    ):
+        frames_dir = Path(tempfile.mkdtemp(prefix="benchmark_frames_", dir=scratch_dir))
+        try:
+            tick = time.perf_counter()
+            self.consume(iter_frame_pdbs(trajectory_frames, frames_dir), run_plip)
+            return time.perf_counter() - tick
+        finally:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+
+    def compare_selections(self, trajectory_frames: TrajectoryFrames):
+        vmd_seconds = numpy_seconds = 0.0
+        differing = []
+        for frame in trajectory_frames.frames:
+            loaded_frame = trajectory_frames.loaded_frame(frame)
+            tick = time.perf_counter()
+            vmd_atoms = atomsel(
+                FRAME_SELECTION, molid=trajectory_frames.molid, frame=loaded_frame
+            ).index
+            vmd_seconds += time.perf_counter() - tick
+            tick = time.perf_counter()
+            numpy_atoms = trajectory_frames.selector.frame_atoms(loaded_frame)
+            numpy_seconds += time.perf_counter() - tick
+            if list(vmd_atoms) != numpy_atoms.tolist():
+                differing.append(frame)
+        self.stdout.write(
+            f"selection: VMD {vmd_seconds:.2f} s, numpy {numpy_seconds:.2f} s, "
+            f"{len(differing)} frames differ {differing[:10]}"
+        )
+
+    def warm_up(self, trajectory_frames: TrajectoryFrames, disk_dir: Path):
+        # every worker imports PLIP before the timed runs, otherwise the first run pays for it
+        frames_dir = Path(tempfile.mkdtemp(prefix="benchmark_frames_", dir=disk_dir))
+        try:
+            pdbfile = frames_dir / f"frame{trajectory_frames.frames[0]}.pdb"
+            trajectory_frames.write(trajectory_frames.frames[0], pdbfile)
+            pdb = pdbfile.read_text()
+            worker_count = settings.MAX_THREADS_PER_WORKER
+            get_worker_pool(worker_count).run(
+                iter([(str(pdbfile), pdb)] * worker_count), lambda records: None
+            )
+        finally:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+
+    def consume(self, frame_pdbs, run_plip):
+        if not run_plip:
+            for _ in frame_pdbs:
+                pass
+            return
+        failed = get_worker_pool(settings.MAX_THREADS_PER_WORKER).run(
+            frame_pdbs, lambda records: None
+        )
+        if len(failed) > 0:
+            self.stdout.write(f"PLIP failed on {len(failed)} frames")
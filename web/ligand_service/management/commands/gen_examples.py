@@ -8,9 +8,15 @@ from pathlib import Path
 
 
 from django.core.management.base import BaseCommand, CommandError
-from ligand_service import tasks, views
-from ligand_service.contacts import get_trajectory_frame_count
-from ligand_service.models import GroupAnalysis, Simulation
+from ligand_service import tasks
+from ligand_service.contacts import get_pocket_atom_count
+from ligand_service.models import (
+    AnalysisPriority,
+    GroupAnalysis,
+    Simulation,
+    get_replica_frame_count,
+)
+from ligand_service.scheduler import queue_simulation
 
 from ligand_service.utils import (
     get_user_results_dir,
@@ -63,17 +69,18 @@ class Command(BaseCommand):
             )
             files = sim.get_trajectory_files()
             if files is None:
-                sim.delete()
                 raise CommandError("Incorrect files were supplied!")
-            sim.frame_count = get_trajectory_frame_count(
-                files.topology, files.trajectory
-            )
+            # the same frames are analysed in every replica
+            sim.frame_count = get_replica_frame_count(sim.get_replicas())
+            if sim.frame_count is None:
+                raise CommandError("Replicas of different lengths were supplied!")
+            sim.atom_count = get_pocket_atom_count(files.topology, files.trajectory)
             sim.save()
             (get_user_work_dir(EXAMPLE_USER_UUID) / str(sim.sim_id)).mkdir(
                 exist_ok=True, parents=True
             )
             (get_user_results_dir(sim.results_id)).mkdir(exist_ok=True, parents=True)
-            views.start_sim_task(sim, EXAMPLE_USER_UUID)
+            queue_simulation(sim, priority=AnalysisPriority.EXAMPLE)
 
         sims = Simulation.objects.filter(user_key=EXAMPLE_USER_UUID)
 
@@ -0,0 +1,30 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from ligand_service.lease import expire_lease, get_renewal_interval, renew_lease
+
+
+class Command(BaseCommand):
+    help = "Renews the lease of a running analysis, started by the worker running it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sim_id")
+        parser.add_argument("dispatch_id")
+        parser.add_argument("worker_pid", type=int)
+
+    def handle(self, *args, **options):
+        interval = get_renewal_interval()
+        # a killed worker leaves the keeper to init
+        while os.getppid() == options["worker_pid"]:
+            try:
+                if not renew_lease(options["sim_id"], options["dispatch_id"]):
+                    # requeued here, so the stopping worker does not fail it
+                    expire_lease(options["sim_id"], options["dispatch_id"])
+                    self.stdout.write(f"Lost the lease of {options['sim_id']}")
+                    return
+            except Exception as e:
+                # the lease outlasts a few failed renewals
+                self.stdout.write(f"Failed to renew the lease: {e}")
+            time.sleep(interval)
@@ -0,0 +1,190 @@
+from pathlib import Path
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import pandas as pd
+
+from ligand_service.clustering import CONTACT_FRACTION_TOLERANCE
+from ligand_service.contacts import (
+    TrajectoryFrames,
+    iter_frame_pdbs,
+)
+from ligand_service.models import (
+    get_files_dir,
+    get_files_maestro,
+    get_trajectory_frame_count,
+)
+from ligand_service.plip_engine import get_worker_pool
+from ligand_service.plip_report import (
+    frame_from_pdbfile,
+    records_to_dataframes,
+    set_frame,
+)
+from ligand_service.utils import select_frames
+
+RESIDUE_COLUMNS = ["Residue chain", "Residue name", "Residue number"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the contact fractions of PLIP on representative frames with PLIP "
+        "on every frame, fails above the tolerance of the clustering"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sim_dirs",
+            type=Path,
+            nargs="*",
+            help="simulation directories, the example simulations by default",
+        )
+        parser.add_argument(
+            "--frames",
+            type=int,
+            default=200,
+            help="frames compared per simulation, evenly spread over the trajectory",
+        )
+        parser.add_argument(
+            "--clusters",
+            type=int,
+            default=settings.REPRESENTATIVE_FRAME_CLUSTERS,
+            help="the REPRESENTATIVE_FRAME_CLUSTERS setting by default",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=settings.REPRESENTATIVE_FRAME_SAMPLE,
+            help="the REPRESENTATIVE_FRAME_SAMPLE setting by default",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=CONTACT_FRACTION_TOLERANCE,
+            help="largest difference of a residue contact fraction accepted",
+        )
+
+    def handle(self, *args, **options):
+        if options["clusters"] is None:
+            raise CommandError(
+                "Pass --clusters or set REPRESENTATIVE_FRAME_CLUSTERS to validate!"
+            )
+        sim_dirs = options["sim_dirs"]
+        if len(sim_dirs) == 0:
+            sim_dirs = sorted(
+                dir
+                for dir in Path("./example_sims").absolute().iterdir()
+                if dir.is_dir()
+            )
+        if len(sim_dirs) == 0:
+            raise CommandError("No simulations to compare!")
+        failed = []
+        for sim_dir in sim_dirs:
+            files = get_files_maestro(sim_dir) or get_files_dir(sim_dir)
+            if files is None:
+                self.stdout.write(f"{sim_dir.name}: no topology and trajectory found")
+                continue
+            frame_count = get_trajectory_frame_count(files.topology, files.trajectory)
+            frames = select_frames(frame_count, None, None, 1, options["frames"])
+            full_df, represented_df, analysed = self.run_plip(
+                files.topology,
+                files.trajectory,
+                frames,
+                options["clusters"],
+                options["sample"],
+            )
+            self.stdout.write(
+                f"{sim_dir.name}: {len(frames)} frames, "
+                f"{analysed} representative frames"
+            )
+            difference = self.compare(full_df, represented_df, len(frames))
+            if difference > options["tolerance"]:
+                failed.append(sim_dir.name)
+        if len(failed) > 0:
+            raise CommandError(
+                f"Contact fractions differ by more than {options['tolerance']} in: "
+                f"{', '.join(failed)}, use more clusters or analyse every frame"
+            )
+        self.stdout.write(
+            f"Contact fractions are within {options['tolerance']} of the full analysis"
+        )
+
+    def run_plip(
+        self,
+        topology: Path,
+        trajectory: Path,
+        frames: list[int],
+        cluster_count: int,
+        sample_size: int,
+    ) -> tuple[pd.DataFrame, pd.DataFrame, int]:
+        """Interactions of PLIP on every frame and of the representatives standing
+        in for the frames clustered with them, the representatives come from the
+        same PLIP run.
+        """
+        trajectory_frames = TrajectoryFrames(
+            topology,
+            trajectory,
+            frames,
+            pocket_radius=settings.POCKET_RADIUS,
+            water_shell_distance=settings.WATER_SHELL_DISTANCE,
+            keep_waters=settings.WATER_BRIDGES,
+            topology_bonds=settings.TOPOLOGY_HYDROGENS,
+        )
+        frames_dir = Path(tempfile.mkdtemp(prefix="validate_clusters_"))
+        records_by_frame = {}
+
+        def on_records(records_by_pdbfile):
+            for pdbfile, records in records_by_pdbfile.items():
+                frame = frame_from_pdbfile(pdbfile)
+                records_by_frame[frame] = set_frame(records, frame)
+
+        try:
+            failed = get_worker_pool(settings.MAX_THREADS_PER_WORKER).run(
+                iter_frame_pdbs(trajectory_frames, frames_dir), on_records
+            )
+            representatives = trajectory_frames.choose_representative_frames(
+                cluster_count, sample_size
+            )
+            analysed = len(trajectory_frames.frames)
+        finally:
+            trajectory_frames.close()
+            shutil.rmtree(frames_dir, ignore_errors=True)
+        if len(failed) > 0:
+            self.stdout.write(f"PLIP failed on {len(failed)} frames")
+        represented_by_frame = {}
+        for frame in records_by_frame:
+            representative = representatives.get(frame, frame)
+            if representative in records_by_frame:
+                represented_by_frame[frame] = set_frame(
+                    records_by_frame[representative], frame
+                )
+        return (
+            records_to_dataframes(records_by_frame)[0],
+            records_to_dataframes(represented_by_frame)[0],
+            analysed,
+        )
+
+    def compare(
+        self, full_df: pd.DataFrame, represented_df: pd.DataFrame, frame_count: int
+    ) -> float:
+        """Prints the largest contact fraction difference of every interaction type,
+        returns the largest one of all.
+        """
+        full = self.contact_fractions(full_df, frame_count)
+        represented = self.contact_fractions(represented_df, frame_count)
+        # a residue only one of them has counts with 0 for the other
+        differences = represented.sub(full, fill_value=0).abs()
+        if len(differences) == 0:
+            return 0.0
+        self.stdout.write(f"{'type':<16} {'max fraction difference':>24}")
+        by_type = differences.groupby(level="Interaction type").max()
+        for interaction_type, difference in by_type.items():
+            self.stdout.write(f"{interaction_type:<16} {difference:>24.3f}")
+        return by_type.max()
+
+    def contact_fractions(self, df: pd.DataFrame, frame_count: int) -> pd.Series:
+        """Share of the frames every residue has each type of interaction in."""
+        residue_frames = df.groupby(["Interaction type"] + RESIDUE_COLUMNS)
+        return residue_frames["Frame"].nunique() / frame_count
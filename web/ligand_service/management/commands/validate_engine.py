@@ -0,0 +1,172 @@
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import pandas as pd
+
+from ligand_service.contacts import (
+    TrajectoryFrames,
+    iter_frame_pdbs,
+)
+from ligand_service.models import (
+    get_files_dir,
+    get_files_maestro,
+    get_trajectory_frame_count,
+)
+from ligand_service.plip_engine import get_worker_pool
+from ligand_service.plip_report import (
+    INTERACTION_TYPE_RENAME,
+    frame_from_pdbfile,
+    records_to_dataframes,
+    set_frame,
+)
+from ligand_service.getcontacts_engine import get_interactions_getcontacts
+from ligand_service.quick_engine import get_interactions_quick
+from ligand_service.utils import select_frames
+
+# an interaction is the same if its type, residue and ligand residue are
+CONTACT_COLUMNS = [
+    "Frame",
+    "Interaction type",
+    "Residue chain",
+    "Residue name",
+    "Residue number",
+    "Ligand residue chain",
+    "Ligand residue number",
+]
+
+
+class Command(BaseCommand):
+    help = "Compares the interactions of the quick or getcontacts engine with PLIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sim_dirs",
+            type=Path,
+            nargs="*",
+            help="simulation directories, the example simulations by default",
+        )
+        parser.add_argument(
+            "--frames",
+            type=int,
+            default=20,
+            help="frames compared per simulation, evenly spread over the trajectory",
+        )
+        parser.add_argument(
+            "--engine", choices=["quick", "getcontacts"], default="quick"
+        )
+
+    def handle(self, *args, **options):
+        sim_dirs = options["sim_dirs"]
+        if len(sim_dirs) == 0:
+            sim_dirs = sorted(
+                dir
+                for dir in Path("./example_sims").absolute().iterdir()
+                if dir.is_dir()
+            )
+        if len(sim_dirs) == 0:
+            raise CommandError("No simulations to compare!")
+        for sim_dir in sim_dirs:
+            files = get_files_maestro(sim_dir) or get_files_dir(sim_dir)
+            if files is None:
+                self.stdout.write(f"{sim_dir.name}: no topology and trajectory found")
+                continue
+            frame_count = get_trajectory_frame_count(files.topology, files.trajectory)
+            frames = select_frames(frame_count, None, None, 1, options["frames"])
+            tick = time.perf_counter()
+            plip_df = self.run_plip(files.topology, files.trajectory, frames)
+            plip_seconds = time.perf_counter() - tick
+            tick = time.perf_counter()
+            engine_df = self.run_engine(
+                options["engine"], files.topology, files.trajectory, frames
+            )
+            engine_seconds = time.perf_counter() - tick
+            self.stdout.write(
+                f"{sim_dir.name}: {len(frames)} frames, PLIP {plip_seconds:.1f} s, "
+                f"{options['engine']} {engine_seconds:.1f} s"
+            )
+            self.compare(plip_df, engine_df, len(frames))
+
+    def run_plip(self, topology: Path, trajectory: Path, frames: list[int]):
+        trajectory_frames = TrajectoryFrames(
+            topology,
+            trajectory,
+            frames,
+            pocket_radius=settings.POCKET_RADIUS,
+            water_shell_distance=settings.WATER_SHELL_DISTANCE,
+            keep_waters=settings.WATER_BRIDGES,
+            topology_bonds=settings.TOPOLOGY_HYDROGENS,
+        )
+        frames_dir = Path(tempfile.mkdtemp(prefix="validate_engine_"))
+        records_by_frame = {}
+
+        def on_records(records_by_pdbfile):
+            for pdbfile, records in records_by_pdbfile.items():
+                frame = frame_from_pdbfile(pdbfile)
+                records_by_frame[frame] = set_frame(records, frame)
+
+        try:
+            failed = get_worker_pool(settings.MAX_THREADS_PER_WORKER).run(
+                iter_frame_pdbs(trajectory_frames, frames_dir), on_records
+            )
+        finally:
+            trajectory_frames.close()
+            shutil.rmtree(frames_dir, ignore_errors=True)
+        if len(failed) > 0:
+            self.stdout.write(f"PLIP failed on {len(failed)} frames")
+        return records_to_dataframes(records_by_frame)[0]
+
+    def run_engine(
+        self, engine: str, topology: Path, trajectory: Path, frames: list[int]
+    ):
+        records_by_frame = {}
+        if engine == "getcontacts":
+            work_dir = Path(tempfile.mkdtemp(prefix="validate_engine_"))
+            try:
+                get_interactions_getcontacts(
+                    topology, trajectory, work_dir, frames, records_by_frame.update
+                )
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            get_interactions_quick(
+                topology, trajectory, frames, records_by_frame.update
+            )
+        return records_to_dataframes(records_by_frame)[0]
+
+    def compare(self, plip_df: pd.DataFrame, engine_df: pd.DataFrame, frame_count):
+        plip_contacts = set(plip_df[CONTACT_COLUMNS].itertuples(index=False))
+        engine_contacts = set(engine_df[CONTACT_COLUMNS].itertuples(index=False))
+        self.stdout.write(
+            f"{'type':<16} {'PLIP':>7} {'engine':>7} {'precision':>10} {'recall':>7} "
+            f"{'max fraction difference':>24}"
+        )
+        for interaction_type in INTERACTION_TYPE_RENAME.values():
+            plip_typed = {c for c in plip_contacts if c[1] == interaction_type}
+            engine_typed = {c for c in engine_contacts if c[1] == interaction_type}
+            if len(plip_typed) == 0 and len(engine_typed) == 0:
+                continue
+            shared = len(plip_typed & engine_typed)
+            precision = shared / len(engine_typed) if engine_typed else float("nan")
+            recall = shared / len(plip_typed) if plip_typed else float("nan")
+            # a residue only one engine found counts with 0 for the other
+            difference = (
+                self.contact_fractions(engine_typed, frame_count)
+                .sub(self.contact_fractions(plip_typed, frame_count), fill_value=0)
+                .abs()
+                .max()
+            )
+            self.stdout.write(
+                f"{interaction_type:<16} {len(plip_typed):>7} {len(engine_typed):>7} "
+                f"{precision:>10.2f} {recall:>7.2f} {difference:>24.2f}"
+            )
+
+    def contact_fractions(self, contacts: set, frame_count: int) -> pd.Series:
+        """Share of the frames every residue has the interaction in."""
+        df = pd.DataFrame(list(contacts), columns=CONTACT_COLUMNS)
+        residue_frames = df.groupby(["Residue chain", "Residue name", "Residue number"])
+        return residue_frames["Frame"].nunique() / frame_count
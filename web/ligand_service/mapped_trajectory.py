@@ -0,0 +1,146 @@
+"""Coordinates of dcd trajectories read straight from a memory map.
+Every frame has the same layout, so a frame is a view into the mapped file and
+workers reading the same trajectory share it through the page cache. Frames PLIP
+analyses are still copied into VMD, which writes them out.
+"""
+
+from pathlib import Path
+import struct
+
+import numpy as np
+
+# size of the first record, with the CORD magic and the 20 control numbers
+DCD_HEADER_RECORD_BYTES = 84
+# control numbers telling about fixed atoms, the unit cell, a fourth
+# dimension and the CHARMM version that wrote the file
+DCD_FIXED_ATOMS = 8
+DCD_UNIT_CELL = 10
+DCD_FOUR_DIMS = 11
+DCD_CHARMM_VERSION = 19
+# record markers around the six doubles of the unit cell
+DCD_UNIT_CELL_BYTES = 4 + 6 * 8 + 4
+# files written here look like CHARMM ones without a unit cell
+DCD_WRITER_CHARMM_VERSION = 24
+DCD_WRITER_TITLE = "CORAL-MD pocket cache"
+
+
+class MappedDcd:
+    """Frames of a dcd file without fixed atoms, the coordinates of every axis
+    are a record of float32 values.
+    """
+
+    def __init__(self, trajectory_file: Path) -> None:
+        with open(trajectory_file, "rb") as f:
+            head = f.read(4 + DCD_HEADER_RECORD_BYTES + 4 + 4)
+            # the first record marker tells the byte order
+            self.endian = "<" if struct.unpack("<i", head[:4])[0] == 84 else ">"
+            marker, magic = struct.unpack(f"{self.endian}i4s", head[:8])
+            if marker != DCD_HEADER_RECORD_BYTES or magic != b"CORD":
+                raise ValueError("Not a dcd file")
+            control = struct.unpack(f"{self.endian}20i", head[8:88])
+            if control[DCD_FIXED_ATOMS] != 0:
+                raise ValueError("Frames with fixed atoms are shorter than the first")
+            charmm = control[DCD_CHARMM_VERSION] != 0
+            # the title record
+            (title_bytes,) = struct.unpack(f"{self.endian}i", head[92:96])
+            f.seek(92 + 4 + title_bytes + 4)
+            _, self.atom_count, _ = struct.unpack(f"{self.endian}3i", f.read(12))
+            header_bytes = f.tell()
+        axis_bytes = 4 + self.atom_count * 4 + 4
+        self.axis_bytes = axis_bytes
+        cell_bytes = DCD_UNIT_CELL_BYTES if charmm and control[DCD_UNIT_CELL] else 0
+        axes = 4 if charmm and control[DCD_FOUR_DIMS] else 3
+        frame_bytes = cell_bytes + axes * axis_bytes
+        self.frame_count = (
+            trajectory_file.stat().st_size - header_bytes
+        ) // frame_bytes
+        if self.frame_count == 0:
+            raise ValueError("No complete frame")
+        self.frames = np.memmap(
+            trajectory_file,
+            dtype=f"{self.endian}i4",
+            mode="r",
+            offset=header_bytes,
+            shape=(self.frame_count, frame_bytes // 4),
+        )
+        # markers of every axis record, before and after the coordinates
+        starts = cell_bytes // 4 + np.arange(3) * (axis_bytes // 4)
+        self.coordinates = starts + 1
+        for frame in [0, self.frame_count - 1]:
+            markers = self.frames[frame, np.r_[starts, starts + self.atom_count + 1]]
+            if not (markers == self.atom_count * 4).all():
+                raise ValueError("Frames do not have the same layout")
+
+    def frame_view(self, frame: int, atoms: slice = slice(None)) -> np.ndarray:
+        """Read-only atoms by xyz view of a range of atoms of the frame in the
+        mapped file, nothing is copied.
+        """
+        atom_range = range(self.atom_count)[atoms]
+        row = self.frames[frame].view(f"{self.endian}f4")
+        # the axis records follow each other, an axis is a stride over the markers
+        return np.lib.stride_tricks.as_strided(
+            row[self.coordinates[0] + atom_range.start :],
+            shape=(len(atom_range), 3),
+            strides=(4 * atom_range.step, self.axis_bytes),
+            writeable=False,
+        )
+
+    def read_into(self, frame: int, out: np.ndarray):
+        """Copies the coordinates of the frame into an atoms by xyz array."""
+        out[:] = self.frame_view(frame)
+
+
+def map_trajectory(trajectory_file: Path) -> MappedDcd | None:
+    """The memory mapped trajectory, None for formats read by VMD."""
+    if trajectory_file.suffix != ".dcd":
+        return None
+    try:
+        return MappedDcd(trajectory_file)
+    except (ValueError, struct.error) as e:
+        print(f"Can not map {trajectory_file.name}: {e}", flush=True)
+        return None
+
+
+class DcdWriter:
+    """Writes frames of float32 coordinates as a dcd file MappedDcd can map.
+    Frames are written in any order, the ones never written have zero coordinates
+    and stay holes of a sparse file.
+    """
+
+    def __init__(self, path: Path, atom_count: int, frame_count: int) -> None:
+        self.atom_count = atom_count
+        self.file = open(path, "wb")
+        control = [0] * 20
+        control[0] = frame_count
+        control[2] = 1
+        control[3] = frame_count
+        control[DCD_CHARMM_VERSION] = DCD_WRITER_CHARMM_VERSION
+        self.record(b"CORD" + struct.pack("<20i", *control))
+        self.record(struct.pack("<i", 1) + DCD_WRITER_TITLE.ljust(80).encode())
+        self.record(struct.pack("<i", atom_count))
+        self.header_bytes = self.file.tell()
+        self.axis_bytes = 4 + atom_count * 4 + 4
+        self.file.truncate(self.header_bytes + frame_count * 3 * self.axis_bytes)
+        # every frame needs its record markers to be read, even without coordinates
+        marker = struct.pack("<i", atom_count * 4)
+        for axis in range(frame_count * 3):
+            start = self.header_bytes + axis * self.axis_bytes
+            self.file.seek(start)
+            self.file.write(marker)
+            self.file.seek(start + self.axis_bytes - 4)
+            self.file.write(marker)
+
+    def record(self, data: bytes):
+        marker = struct.pack("<i", len(data))
+        self.file.write(marker + data + marker)
+
+    def write(self, frame: int, coordinates: np.ndarray):
+        """Writes the atoms by xyz coordinates of the frame."""
+        self.file.seek(self.header_bytes + frame * 3 * self.axis_bytes)
+        for axis in range(3):
+            self.record(
+                np.ascontiguousarray(coordinates[:, axis], dtype="<f4").tobytes()
+            )
+
+    def close(self):
+        self.file.close()
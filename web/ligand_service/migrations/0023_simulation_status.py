@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+from huey.contrib.djhuey import HUEY as huey
+
+
+def get_task_status(sim, pending_ids):
+    task_id = str(sim.analysis_task_id)
+    try:
+        result = huey.result(task_id, preserve=True)
+    except Exception:
+        return "Failure"
+    results_dir = settings.BASE_DIR / "user_uploads" / str(sim.results_id)
+    if (results_dir / "run_data.json").is_file():
+        return "Finished"
+    if result is not None:
+        # the task ended without writing any results
+        return "Failure"
+    if task_id in pending_ids:
+        return "Queued"
+    # picked up by a worker, the huey signals record how it ends
+    return "Running"
+
+
+def backfill_status(apps, schema_editor):
+    Simulation = apps.get_model("ligand_service", "Simulation")
+    pending_ids = {task.id for task in huey.pending()}
+    for sim in Simulation.objects.filter(
+        analysis_task_id__isnull=False, was_deleted=False
+    ):
+        sim.status = get_task_status(sim, pending_ids)
+        sim.save(update_fields=["status"])
+    Simulation.objects.filter(was_deleted=True).update(status="Deleted")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0022_alter_simulation_topology_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='status',
+            field=models.CharField(choices=[('Queueing', 'Queueing'), ('Queued', 'Queued'), ('Running', 'Running'), ('Finished', 'Finished'), ('Failure', 'Failure'), ('Deleted', 'Deleted')], default='Queueing', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='simulation',
+            index=models.Index(fields=['user_key', 'status'], name='ligand_serv_user_ke_41f941_idx'),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
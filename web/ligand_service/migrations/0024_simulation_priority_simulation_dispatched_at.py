@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0023_simulation_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Small'), (1, 'Normal'), (2, 'Example')], default=1),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='dispatched_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0024_simulation_priority_simulation_dispatched_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='atom_count',
+            field=models.IntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='estimated_cost',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='analysis_started_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='analysis_finished_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0025_simulation_cost_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='frame_start',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='frame_end',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='frame_stride',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='target_frame_count',
+            field=models.PositiveIntegerField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0026_simulation_frame_selection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='engine',
+            field=models.CharField(choices=[('plip', 'Plip'), ('quick', 'Quick')], default='plip', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0027_simulation_engine'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='simulation',
+            name='engine',
+            field=models.CharField(choices=[('plip', 'PLIP'), ('quick', 'Quick'), ('getcontacts', 'getcontacts')], default='plip', max_length=16),
+        ),
+    ]
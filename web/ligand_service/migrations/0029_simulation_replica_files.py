@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0028_simulation_engine_getcontacts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='replica_files',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ligand_service', '0031_simulation_replicas_done'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='analysis_worker_seconds',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
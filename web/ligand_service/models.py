@@ -9,7 +9,28 @@ from vmd import molecule
 from django_prometheus.models import ExportModelOperationsMixin
 from huey.contrib.djhuey import HUEY as huey
 
-from .utils import get_user_uploads_dir, get_user_work_dir
+from .desmond import open_desmond
+from .frame_index import get_frame_index
+from .mapped_trajectory import map_trajectory
+from .utils import (
+    describe_frame_selection,
+    get_user_uploads_dir,
+    get_user_work_dir,
+    select_frames,
+)
+from .checkpoint import count_completed_frames
+from .progress import format_eta
+from .upload_manifest import (
+    DIRECTORY_TYPE,
+    TOPOLOGY_ROLE,
+    TOPOLOGY_TYPES,
+    TRAJECTORY_ROLE,
+    TRAJECTORY_TYPES,
+    find_entries,
+    get_upload_manifest,
+    manifest_path,
+    write_upload_manifest,
+)
 
 
 class TrajectoryFiles(NamedTuple):
@@ -25,7 +46,24 @@ def filetype(file: Path) -> str:
     return filetype
 
 
+def get_task_ids(dispatch_id, replica_count: int) -> list[str]:
+    """Huey task of every replica, the first one has the id of the dispatch."""
+    return [str(dispatch_id)] + [
+        str(uuid.uuid5(uuid.UUID(str(dispatch_id)), str(replica)))
+        for replica in range(1, replica_count)
+    ]
+
+
 def get_trajectory_frame_count(topology_file: Path, trajectory_file: Path) -> int:
+    offsets = get_frame_index(trajectory_file)
+    if offsets is not None:
+        return len(offsets) - 1
+    desmond = open_desmond(trajectory_file)
+    if desmond is not None:
+        return desmond.frame_count
+    mapped = map_trajectory(trajectory_file)
+    if mapped is not None:
+        return mapped.frame_count
     molid = molecule.load(filetype(topology_file), str(topology_file))
     num_frames = molecule.numframes(molid)
     print("Number of frames before loading trajectory", num_frames)
@@ -40,6 +78,47 @@ def get_trajectory_frame_count(topology_file: Path, trajectory_file: Path) -> in
     return count
 
 
+def get_replica_frame_count(replicas: list[TrajectoryFiles]) -> int | None:
+    """Frames of every replica, None when they are not equally long."""
+    counts = {
+        get_trajectory_frame_count(replica.topology, replica.trajectory)
+        for replica in replicas
+    }
+    if len(counts) != 1:
+        return None
+    return counts.pop()
+
+
+class AnalysisStatus(models.TextChoices):
+    QUEUEING = "Queueing"
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    FINISHED = "Finished"
+    FAILURE = "Failure"
+    DELETED = "Deleted"
+
+
+class AnalysisPriority(models.IntegerChoices):
+    SMALL = 0
+    NORMAL = 1
+    EXAMPLE = 2
+
+
+class InteractionEngine(models.TextChoices):
+    PLIP = "plip", "PLIP"
+    # numpy approximation of the geometric interactions, see quick_engine.py
+    QUICK = "quick", "Quick"
+    # whole trajectory in one run, see getcontacts_engine.py
+    GETCONTACTS = "getcontacts", "getcontacts"
+
+
+IN_QUEUE_STATUSES = [
+    AnalysisStatus.QUEUEING,
+    AnalysisStatus.QUEUED,
+    AnalysisStatus.RUNNING,
+]
+
+
 class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     dirname = models.CharField(max_length=128)
@@ -51,6 +130,36 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
     # shared, used to find and share results
     results_id = models.UUIDField(null=True, default=uuid.uuid4, unique=True)
     was_deleted = models.BooleanField(default=False)
+    # kept up to date by huey signals, so the queue can be inspected with a single query
+    status = models.CharField(
+        max_length=16,
+        choices=AnalysisStatus.choices,
+        default=AnalysisStatus.QUEUEING,
+    )
+    # lower values are dispatched first, see scheduler.py
+    priority = models.PositiveSmallIntegerField(
+        choices=AnalysisPriority.choices, default=AnalysisPriority.NORMAL
+    )
+    dispatched_at = models.DateTimeField(null=True, default=None)
+    # renewed by the worker while it analyses the simulation, see lease.py
+    lease_expires_at = models.DateTimeField(null=True, default=None)
+    # cost model inputs, see costs.py
+    atom_count = models.IntegerField(null=True, default=None)
+    estimated_cost = models.FloatField(null=True, default=None)
+    analysis_started_at = models.DateTimeField(null=True, default=None)
+    analysis_finished_at = models.DateTimeField(null=True, default=None)
+    # summed over the tasks of the replicas, they run side by side
+    analysis_worker_seconds = models.FloatField(default=0.0)
+    # frames to analyse, see utils.select_frames, all of them by default
+    frame_start = models.PositiveIntegerField(null=True, default=None)
+    frame_end = models.PositiveIntegerField(null=True, default=None)
+    frame_stride = models.PositiveIntegerField(default=1)
+    target_frame_count = models.PositiveIntegerField(null=True, default=None)
+    engine = models.CharField(
+        max_length=16,
+        choices=InteractionEngine.choices,
+        default=InteractionEngine.PLIP,
+    )
 
     topology_file = models.FilePathField(
         path=settings.BASE_DIR / "user_uploads",
@@ -64,10 +173,45 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
         default=None,
         max_length=1024,
     )
+    # trajectories of every replica sharing the topology, empty for a single one
+    replica_files = models.JSONField(default=list)
+    # replicas of the current dispatch whose shard is analysed
+    replicas_done = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [models.Index(fields=["user_key", "status"])]
 
     def __str__(self):
         return self.dirname
 
+    def get_frames(self) -> list[int]:
+        return select_frames(
+            self.frame_count or 0,
+            self.frame_start,
+            self.frame_end,
+            self.frame_stride,
+            self.target_frame_count,
+        )
+
+    def get_replica_count(self) -> int:
+        return max(len(self.replica_files), 1)
+
+    def get_analysed_frame_count(self) -> int | None:
+        if self.frame_count is None:
+            return None
+        # the frames are analysed in every replica
+        return len(self.get_frames()) * self.get_replica_count()
+
+    def get_task_ids(self) -> list[str]:
+        if self.analysis_task_id is None:
+            return []
+        return get_task_ids(self.analysis_task_id, self.get_replica_count())
+
+    def describe_frame_selection(self) -> str:
+        if self.frame_count is None:
+            return ""
+        return describe_frame_selection(self.get_frames(), self.frame_count)
+
     def is_not_queued(self) -> bool:
         return self.analysis_task_id is None
 
@@ -103,22 +247,40 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
 
     # NOTE: Could be remade with huey signals, didn't notice them at the start!
     def get_analysis_status(self) -> str:
+        # final states never change, no need to ask huey about them
+        if self.status in [
+            AnalysisStatus.FINISHED,
+            AnalysisStatus.FAILURE,
+            AnalysisStatus.DELETED,
+        ]:
+            return self.status
         if self.is_not_queued():
+            # waiting in the fair-share queue, not yet handed to huey
+            if self.status == AnalysisStatus.QUEUED:
+                return self.describe_queue_position()
             return "Queueing"
-        elif self.is_running():
+        # the task of the first replica can end before the others
+        elif self.status == AnalysisStatus.RUNNING or self.is_running():
             # TODO: Add runinfo
             if self.was_deleted:
                 return "Deleted"
             files = self.get_trajectory_files()
             if files is None:
                 return "Failure"
-            plip_dir = get_user_work_dir(self.user_key) / str(self.sim_id) / "plip"
-            if not plip_dir.is_dir():
-                return "Queued"
-            frames_done = len([x for x in plip_dir.iterdir()])
+            work_dir = get_user_work_dir(self.user_key) / str(self.sim_id)
+            # every replica has a work directory of its own
+            checkpoint_dirs = [work_dir / "checkpoint"] + list(
+                work_dir.glob("replica*/checkpoint")
+            )
+            frames_done = sum(
+                count_completed_frames(checkpoint_dir)
+                for checkpoint_dir in checkpoint_dirs
+            )
             if frames_done == 0:
-                return "Queued"
-            return f"Running {frames_done} / {self.frame_count} frames"
+                if self.status == AnalysisStatus.RUNNING:
+                    return "Running: extracting frames"
+                return self.describe_queue_position()
+            return f"Running {frames_done} / {self.get_analysed_frame_count()} frames"
         elif self.has_failed():
             return "Failure"
         elif self.is_finished():
@@ -126,6 +288,15 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
         else:
             return "Unknown"
 
+    def describe_queue_position(self) -> str:
+        # set by scheduler.annotate_queue_estimates
+        estimate = getattr(self, "queue_estimate", None)
+        if estimate is None:
+            return "Queued"
+        if estimate.position == 0:
+            return f"Queued, ETA {format_eta(estimate.eta_seconds)}"
+        return f"Queued ({estimate.position}. in line), ETA {format_eta(estimate.eta_seconds)}"
+
     def get_sim_dir(self) -> Path:
         return get_user_uploads_dir(self.user_key) / str(self.sim_id)
 
@@ -135,6 +306,9 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
             return TrajectoryFiles(
                 topology=Path(self.topology_file), trajectory=Path(self.trajectory_file)
             )
+        if not manifest_path(dir).is_file():
+            # uploaded before the manifest was written on completion
+            write_upload_manifest(dir)
         files = get_files_maestro(dir)
         if files is None:
             files = get_files_dir(dir)
@@ -142,9 +316,28 @@ class Simulation(ExportModelOperationsMixin("simulation"), models.Model):
             return None
         self.topology_file = files.topology
         self.trajectory_file = files.trajectory
-        self.save()
+        replicas = get_replica_files_dir(dir)
+        if len(replicas) > 1 and files.trajectory in replicas:
+            self.replica_files = [str(trajectory) for trajectory in replicas]
+        # an upload is only stored once it is accepted
+        if not self._state.adding:
+            self.save()
         return files
 
+    def get_replicas(self) -> list[TrajectoryFiles]:
+        """Topology and trajectory of every replica, the simulation itself
+        when it has a single trajectory.
+        """
+        files = self.get_trajectory_files()
+        if files is None:
+            return []
+        if len(self.replica_files) == 0:
+            return [files]
+        return [
+            TrajectoryFiles(files.topology, Path(trajectory))
+            for trajectory in self.replica_files
+        ]
+
 
 class GroupAnalysis(ExportModelOperationsMixin("group_analysis"), models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -159,38 +352,36 @@ class GPCRdbResidueAPI(ExportModelOperationsMixin("GPCRdb_calls"), models.Model)
 
 
 def get_files_maestro(dir: Path) -> TrajectoryFiles | None:
-    subdirs = [x for x in dir.rglob("*") if x.is_dir()]
-    chosen_trj = None
-    chosen_top = None
-    for subdir in subdirs:
-        print(subdir, flush=True)
-        if subdir.name.endswith("_trj"):
-            trj_stump = subdir / "clickme.dtr"
-            # creating an empty file is needed, for vmd to load the trajectory
-            open(trj_stump, "w").close()
-            chosen_trj = trj_stump
-            print("chosen trj!", flush=True)
-            break
-    for file in dir.rglob("*"):
-        if file.is_file() and file.name.endswith("-out.cms"):
-            chosen_top = file
-            print("chosen top!", flush=True)
-            break
-
-    if chosen_top is None or chosen_trj is None:
+    entries = get_upload_manifest(dir)
+    trajectories = find_entries(entries, TRAJECTORY_ROLE, [DIRECTORY_TYPE])
+    topologies = find_entries(entries, TOPOLOGY_ROLE, ["cms"])
+    if len(topologies) == 0 or len(trajectories) == 0:
         return None
-
-    return TrajectoryFiles(chosen_top, chosen_trj)
+    trj_stump = dir / trajectories[0]["path"] / "clickme.dtr"
+    # creating an empty file is needed, for vmd to load the trajectory
+    open(trj_stump, "w").close()
+    print(f"Chosen {topologies[0]['path']} and {trajectories[0]['path']}", flush=True)
+    return TrajectoryFiles(dir / topologies[0]["path"], trj_stump)
 
 
 def get_files_dir(directory: Path) -> TrajectoryFiles | None:
-    top = None
-    trj = None
-    for file in directory.iterdir():
-        if file.suffix in [".pdb", ".psf"] and top is None:
-            top = file
-        elif file.suffix in [".dcd", ".xtc", ".trr"] and trj is None:
-            trj = file
-        if top is not None and trj is not None:
-            return TrajectoryFiles(top, trj)
-    return None
+    entries = get_upload_manifest(directory)
+    topologies = find_entries(entries, TOPOLOGY_ROLE, TOPOLOGY_TYPES, top_level=True)
+    trajectories = get_replica_files_dir(directory, entries)
+    if len(topologies) == 0 or len(trajectories) == 0:
+        return None
+    return TrajectoryFiles(directory / topologies[0]["path"], trajectories[0])
+
+
+def get_replica_files_dir(
+    directory: Path, entries: list[dict] | None = None
+) -> list[Path]:
+    """Every trajectory of the directory, replicas of the same topology."""
+    if entries is None:
+        entries = get_upload_manifest(directory)
+    return [
+        directory / entry["path"]
+        for entry in find_entries(
+            entries, TRAJECTORY_ROLE, TRAJECTORY_TYPES, top_level=True
+        )
+    ]
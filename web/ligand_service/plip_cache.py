@@ -0,0 +1,119 @@
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from django.conf import settings
+
+from .checkpoint import write_json_atomically
+from .plip_engine import get_plip_options
+from .plip_report import parse_plip_report
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_plip_version() -> str:
+    try:
+        return version("plip")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class PlipResultCache:
+    """Parsed PLIP records of single frames, addressed by the hash of the frame PDB,
+    so identical frames are analysed only once. Least recently used entries are
+    removed once the cache grows over its size limit.
+    """
+
+    def __init__(self, cache_dir: Path, max_size_in_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_in_bytes = max_size_in_bytes
+        # results depend on the plip version and the options it runs with
+        options = " ".join(get_plip_options())
+        self.salt = f"plip={get_plip_version()};options={options};"
+        self.keys = {}
+
+    def get_key(self, pdbfile, pdb: str | None = None) -> str:
+        """Hash of the frame, read from the pdb file unless its text is given."""
+        pdbfile = str(pdbfile)
+        if pdbfile not in self.keys:
+            digest = hashlib.sha256(self.salt.encode())
+            if pdb is not None:
+                digest.update(pdb.encode())
+            else:
+                with open(pdbfile, "rb") as f:
+                    while chunk := f.read(HASH_CHUNK_SIZE):
+                        digest.update(chunk)
+            self.keys[pdbfile] = digest.hexdigest()
+        return self.keys[pdbfile]
+
+    def entry_file(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, pdbfile, pdb: str | None = None) -> dict[str, list[dict]] | None:
+        entry = self.entry_file(self.get_key(pdbfile, pdb))
+        try:
+            with open(entry) as f:
+                records = json.load(f)
+            # modification time is the last use, for the eviction
+            os.utime(entry)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return records
+
+    def put(self, pdbfile, records: dict[str, list[dict]]):
+        entry = self.entry_file(self.get_key(pdbfile))
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomically(entry, records)
+
+    def lookup(self, pdbfiles: list) -> dict[str, dict[str, list[dict]]]:
+        """Returns the cached records of the given frames, by their pdb file."""
+        found = {}
+        for pdbfile in pdbfiles:
+            records = self.get(pdbfile)
+            if records is not None:
+                found[str(pdbfile)] = records
+        print(f"PLIP cache: {len(found)} of {len(pdbfiles)} frames cached", flush=True)
+        return found
+
+    def store_reports(self, pdbfiles: list, plip_dir: Path):
+        for pdbfile in pdbfiles:
+            report_file = plip_dir / Path(pdbfile).stem / "report.xml"
+            if not report_file.is_file():
+                continue
+            # the frame number is set again when the records are used
+            self.put(pdbfile, parse_plip_report(report_file, 0))
+        self.evict()
+
+    def evict(self):
+        if not self.cache_dir.is_dir():
+            return
+        entries = []
+        total_size = 0
+        for entry in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total_size += stat.st_size
+        if total_size <= self.max_size_in_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, entry in entries:
+            if total_size <= self.max_size_in_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total_size -= size
+            removed += 1
+        print(f"PLIP cache: removed {removed} least recently used frames", flush=True)
+
+
+def get_plip_result_cache() -> PlipResultCache | None:
+    if settings.PLIP_CACHE_SIZE_IN_MB is None:
+        return None
+    return PlipResultCache(
+        settings.PLIP_CACHE_DIR, settings.PLIP_CACHE_SIZE_IN_MB * 1024 * 1024
+    )
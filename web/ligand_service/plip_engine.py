@@ -0,0 +1,177 @@
+from typing import Callable, Iterator
+import json
+import os
+import selectors
+import signal
+import subprocess as sb
+import sys
+
+from django.conf import settings
+
+from .cancellation import AnalysisCancelled
+from .plip_report import NOHYDRO_OPTION, PLIP_OPTIONS, frame_from_pdbfile
+from .utils import choose_scratch_dir
+
+PLIP_ENGINE_CLI = "cli"
+PLIP_ENGINE_POOL = "pool"
+
+PLIP_WORKER_MODULE = "ligand_service.plip_worker"
+PLIP_POOL_POLL_INTERVAL_IN_SECONDS = 2
+PLIP_TERMINATE_TIMEOUT_IN_SECONDS = 10
+PLIP_WORKER_SCRATCH_BYTES = 64 * 1024 * 1024
+
+
+def get_plip_options() -> list[str]:
+    if settings.TOPOLOGY_HYDROGENS:
+        return PLIP_OPTIONS + [NOHYDRO_OPTION]
+    return PLIP_OPTIONS
+
+
+def stop_processes(processes: list[sb.Popen]):
+    # plip runs in its own session, so the whole process group can be stopped
+    for process in processes:
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    for process in processes:
+        try:
+            process.wait(timeout=PLIP_TERMINATE_TIMEOUT_IN_SECONDS)
+        except sb.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+class PlipWorker:
+    def __init__(self) -> None:
+        env = dict(os.environ)
+        # plip writes the protonated structure of every frame, keep it in memory if possible
+        scratch_dir = choose_scratch_dir(PLIP_WORKER_SCRATCH_BYTES)
+        if scratch_dir is not None:
+            env["TMPDIR"] = str(scratch_dir)
+        self.process = sb.Popen(
+            [sys.executable, "-m", PLIP_WORKER_MODULE, *get_plip_options()],
+            stdin=sb.PIPE,
+            stdout=sb.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=settings.BASE_DIR,
+            env=env,
+            start_new_session=True,
+        )
+        self.pdbfile = None
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def send(self, pdbfile: str, pdb: str):
+        assert self.process.stdin is not None
+        self.pdbfile = pdbfile
+        request = {"pdbfile": pdbfile, "frame": frame_from_pdbfile(pdbfile), "pdb": pdb}
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+
+    def receive(self) -> dict | None:
+        assert self.process.stdout is not None
+        line = self.process.stdout.readline()
+        self.pdbfile = None
+        if not line:
+            return None
+        return json.loads(line)
+
+
+class PlipWorkerPool:
+    """Workers with PLIP already imported, kept for every analysis
+    the huey worker runs. Frames are handed out one at a time.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.workers: list[PlipWorker] = []
+
+    def start_workers(self):
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        while len(self.workers) < self.size:
+            self.workers.append(PlipWorker())
+
+    def close(self):
+        stop_processes([worker.process for worker in self.workers])
+        self.workers = []
+
+    def run(
+        self,
+        frame_pdbs: Iterator[tuple[str, str]],
+        on_records: Callable[[dict[str, dict]], None],
+        on_progress: Callable[[int], None] | None = None,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> list[str]:
+        """Analyses the frames, given as their name and pdb text.
+        Records are passed to on_records by the frame name.
+        Returns the frames PLIP failed on.
+        """
+        self.start_workers()
+        failed = []
+        done = 0
+        selector = selectors.DefaultSelector()
+
+        def start_next(worker: PlipWorker):
+            # frames are only produced when a worker is free to take them
+            frame_pdb = next(frame_pdbs, None)
+            if frame_pdb is not None:
+                worker.send(*frame_pdb)
+                selector.register(worker.process.stdout, selectors.EVENT_READ, worker)
+
+        try:
+            for worker in self.workers:
+                start_next(worker)
+            while len(selector.get_map()) > 0:
+                if should_stop is not None and should_stop():
+                    print("PLIP: Stopping!", flush=True)
+                    raise AnalysisCancelled()
+                found = {}
+                for key, _ in selector.select(PLIP_POOL_POLL_INTERVAL_IN_SECONDS):
+                    worker = key.data
+                    pdbfile = worker.pdbfile
+                    selector.unregister(key.fileobj)
+                    answer = worker.receive()
+                    done += 1
+                    if answer is None:
+                        # openbabel can take the whole worker down, replace it
+                        print(f"PLIP worker died on {pdbfile}", flush=True)
+                        failed.append(pdbfile)
+                        worker.process.wait()
+                        self.workers.remove(worker)
+                        worker = PlipWorker()
+                        self.workers.append(worker)
+                    elif "error" in answer:
+                        print(
+                            f"PLIP failed on {pdbfile}: {answer['error']}", flush=True
+                        )
+                        failed.append(pdbfile)
+                    else:
+                        found[pdbfile] = answer["records"]
+                    start_next(worker)
+                if len(found) > 0:
+                    on_records(found)
+                if on_progress is not None:
+                    on_progress(done)
+        except BaseException:
+            # a worker in the middle of a frame can not be reused
+            self.close()
+            raise
+        finally:
+            selector.close()
+        return failed
+
+
+worker_pool = None
+
+
+def get_worker_pool(size: int) -> PlipWorkerPool:
+    global worker_pool
+    if worker_pool is None or worker_pool.size != size:
+        if worker_pool is not None:
+            worker_pool.close()
+        worker_pool = PlipWorkerPool(size)
+    return worker_pool
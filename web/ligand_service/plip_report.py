@@ -0,0 +1,204 @@
+from pathlib import Path
+import logging
+
+import pandas as pd
+import xmltodict
+
+INTERACTION_TYPE_RENAME = {
+    "hydrophobic_interactions": "Hydrophobic",
+    "hydrogen_bonds": "Hydrogen bond",
+    "water_bridges": "Water bridge",
+    "salt_bridges": "Salt bridge",
+    "pi_stacks": "Pi-pi stacking",
+    "pi_cation_interactions": "Pi-cation",
+    "halogen_bonds": "Halogen bond",
+    "metal_complexes": "Metal complex",
+}
+
+# options of every plip run, the xml report is parsed afterwards
+PLIP_OPTIONS = ["-v", "-x"]
+# frames written with the hydrogens of the topology, plip adds none itself
+NOHYDRO_OPTION = "--nohydro"
+
+INTERACTION_COLUMNS = [
+    "Frame",
+    "Interaction type",
+    "Residue chain",
+    "Residue name",
+    "Residue number",
+    "Ligand residue chain",
+    "Ligand residue name",
+    "Ligand residue number",
+]
+
+# trajectory the rows of a simulation with several replicas come from
+REPLICA_COLUMN = "Replica"
+
+LIGAND_COLUMNS = [
+    "frames_seen",
+    "name",
+    "ligtype",
+    "smiles",
+    "inchikey",
+    # "img",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def frame_from_dirname(dirname: str) -> int:
+    # plip names the output directories after the input files, frame<N>
+    return int(dirname[5:])
+
+
+def frame_from_pdbfile(pdbfile) -> int:
+    return frame_from_dirname(Path(pdbfile).stem)
+
+
+def parse_plip_report(report_file: Path, frame: int) -> dict[str, list[dict]]:
+    """Reads a single PLIP report.xml.
+    Returns the interaction rows of the frame and the ligands
+    of every binding site with interactions.
+    """
+    records = {"interactions": [], "ligands": []}
+    with open(report_file) as f:
+        out = xmltodict.parse(f.read())
+    # frames without any ligand have no binding site at all
+    binding_sites = out["report"].get("bindingsite") or []
+    # handling of instance, where there is only one binding site
+    if not isinstance(binding_sites, list):
+        binding_sites = [binding_sites]
+    for binding_site in binding_sites:
+        if binding_site["@has_interactions"] == "False":
+            logger.info(f"Skipping binding_site: {binding_site}")
+            continue
+        ident = binding_site["identifiers"]
+        interactions = binding_site["interactions"]
+        records["ligands"].append(
+            {
+                "name": ident["longname"],
+                "ligtype": ident["ligtype"],
+                "smiles": ident["smiles"],
+                "inchikey": ident["inchikey"],
+                "residue": ligand_residue(
+                    ident["chain"], ident["hetid"], ident["position"]
+                ),
+            }
+        )
+
+        # mol = Chem.MolFromSmiles(ident["smiles"])
+        # logger.info(f"Molecule created from SMILES")
+        # if mol is not None:
+        #     img = Draw.MolToImage(mol, size=(300, 300))
+        #     logger.info(f"Image created from mol")
+        #     buffer = BytesIO()
+        #     img.save(buffer, format="PNG")
+        #     img_str = base64.b64encode(buffer.getvalue()).decode()
+        #     inlined_image = (
+        #         f'<img src="data:image/png;base64,{img_str}">'
+        #     )
+        #     ligand_info["img"].append(inlined_image)
+        # else:
+        #     ligand_info["img"].append("")
+
+        for interaction_type in interactions:
+            for contacts_lists in interactions[interaction_type] or []:
+                contacts = interactions[interaction_type][contacts_lists]
+                # handling of instance where there is only one interaction of given type,
+                # xmltodict doesn't make a list in this case, it just provides the value
+                if not isinstance(contacts, list):
+                    contacts = [contacts]
+                for value in contacts:
+                    records["interactions"].append(
+                        interaction_record(frame, interaction_type, value)
+                    )
+    return records
+
+
+def interaction_record(frame: int, interaction_type: str, value: dict) -> dict:
+    """A single interaction row, value holds the lowercase plip report features."""
+    return {
+        "Frame": frame,
+        "Interaction type": INTERACTION_TYPE_RENAME[interaction_type],
+        "Residue chain": str(value["reschain"]),
+        "Residue name": str(value["restype"]),
+        "Residue number": str(value["resnr"]),
+        "Ligand residue chain": str(value["reschain_lig"]),
+        "Ligand residue name": str(value["restype_lig"]),
+        "Ligand residue number": str(value["resnr_lig"]),
+    }
+
+
+def ligand_residue(chain: str, name: str, number) -> str:
+    """Key of a ligand residue, the same in every frame."""
+    return f"{chain}:{name}:{number}"
+
+
+class LigandIdentities:
+    """Identity of every ligand residue, taken from the first frame it is seen in
+    and reused for all the others, so it stays the same when the protonation
+    of the ligand changes between frames. Only the naming is cached, PLIP still
+    perceives the ligand in every frame.
+    """
+
+    def __init__(self) -> None:
+        self.by_residue = {}
+
+    def identify(self, ligand: dict) -> dict:
+        # records of older checkpoints do not know their residue
+        if "residue" not in ligand:
+            return ligand
+        return self.by_residue.setdefault(ligand["residue"], ligand)
+
+
+def set_frame(records: dict[str, list[dict]], frame: int) -> dict[str, list[dict]]:
+    return {
+        "interactions": [
+            {**interaction, "Frame": frame} for interaction in records["interactions"]
+        ],
+        "ligands": records["ligands"],
+    }
+
+
+def records_to_dataframes(
+    records_by_frame: dict[int, dict[str, list[dict]]],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    frames_data = {column: [] for column in INTERACTION_COLUMNS}
+    ligand_info = {column: [] for column in LIGAND_COLUMNS}
+    identities = LigandIdentities()
+    for frame in sorted(records_by_frame):
+        records = records_by_frame[frame]
+        for ligand in map(identities.identify, records["ligands"]):
+            inchikey = ligand["inchikey"]
+            if inchikey in ligand_info["inchikey"]:
+                idx = ligand_info["inchikey"].index(inchikey)
+                ligand_info["frames_seen"][idx] += 1
+            else:
+                logger.info(f"Adding new ligand: {inchikey}")
+                ligand_info["frames_seen"].append(1)
+                for column in LIGAND_COLUMNS[1:]:
+                    ligand_info[column].append(ligand[column])
+        for interaction in records["interactions"]:
+            for column in INTERACTION_COLUMNS:
+                frames_data[column].append(interaction[column])
+    frame_df = pd.DataFrame(frames_data)
+    ligand_df = pd.DataFrame(ligand_info)
+    ligand_df.drop_duplicates(inplace=True)
+    return frame_df, ligand_df
+
+
+def merge_replicas(
+    shards: dict[str, tuple[pd.DataFrame, pd.DataFrame]],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Interactions and ligands of every replica in one table each,
+    told apart by the replica column.
+    """
+    frame_dfs = []
+    ligand_dfs = []
+    for replica, (frame_df, ligand_df) in shards.items():
+        frame_dfs.append(frame_df.assign(**{REPLICA_COLUMN: replica}))
+        ligand_dfs.append(ligand_df.assign(**{REPLICA_COLUMN: replica}))
+    return (
+        pd.concat(frame_dfs, ignore_index=True),
+        pd.concat(ligand_dfs, ignore_index=True),
+    )
@@ -0,0 +1,109 @@
+"""PLIP worker kept running by the plip engine pool.
+Reads one JSON request per line from stdin and answers each with one JSON line,
+so PLIP and openbabel are imported only once per worker.
+"""
+
+from operator import itemgetter
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+
+from plip.basic import config
+from plip.exchange.report import BindingSiteReport
+from plip.structure.preparation import PDBComplex
+
+from ligand_service.plip_report import (
+    NOHYDRO_OPTION,
+    interaction_record,
+    ligand_residue,
+)
+
+# report element of every interaction type, with the BindingSiteReport
+# attributes holding its feature names and values
+REPORT_INTERACTIONS = {
+    "hydrophobic_interactions": ("hydrophobic_features", "hydrophobic_info"),
+    "hydrogen_bonds": ("hbond_features", "hbond_info"),
+    "water_bridges": ("waterbridge_features", "waterbridge_info"),
+    "salt_bridges": ("saltbridge_features", "saltbridge_info"),
+    "pi_stacks": ("pistacking_features", "pistacking_info"),
+    "pi_cation_interactions": ("pication_features", "pication_info"),
+    "halogen_bonds": ("halogen_features", "halogen_info"),
+    "metal_complexes": ("metal_features", "metal_info"),
+}
+
+
+def analyse_frame(pdb: str, frame: int, output_path: str) -> dict[str, list[dict]]:
+    mol = PDBComplex()
+    mol.output_path = output_path
+    # plip takes the corrected pdb for a path when it equals the input,
+    # without the trailing newline it never does
+    mol.load_pdb(pdb.rstrip("\n"), as_string=True)
+    for ligand in mol.ligands:
+        mol.characterize_complex(ligand)
+    records = {"interactions": [], "ligands": []}
+    # same binding sites, in the same order, as the xml report
+    for site in sorted(mol.interaction_sets):
+        interaction_set = mol.interaction_sets[site]
+        if interaction_set.no_interactions:
+            continue
+        report = BindingSiteReport(interaction_set)
+        records["ligands"].append(
+            {
+                "name": report.longname,
+                "ligtype": report.ligtype,
+                "smiles": report.ligand.smiles,
+                "inchikey": report.ligand.inchikey,
+                "residue": ligand_residue(
+                    report.ligand.chain, report.ligand.hetid, report.ligand.position
+                ),
+            }
+        )
+        for interaction_type, (features_attr, info_attr) in REPORT_INTERACTIONS.items():
+            features = [feature.lower() for feature in getattr(report, features_attr)]
+            contacts = sorted(getattr(report, info_attr), key=itemgetter(0, 2, -2))
+            for contact in contacts:
+                records["interactions"].append(
+                    interaction_record(
+                        frame, interaction_type, dict(zip(features, contact))
+                    )
+                )
+    return records
+
+
+def stop(signum, frame):
+    # lets the scratch directory be removed
+    sys.exit(0)
+
+
+def main():
+    signal.signal(signal.SIGTERM, stop)
+    # plip and openbabel print to stdout, answers go through a private copy of it
+    answers = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    # the corrected pdb is only kept in memory
+    config.NOFIXFILE = True
+    # started with the options of the plip command line tool
+    config.NOHYDRO = NOHYDRO_OPTION in sys.argv[1:]
+    # the protonated structure is still written, the next frame overwrites it
+    output_path = tempfile.mkdtemp(prefix="plip_worker_")
+    try:
+        for line in sys.stdin:
+            request = json.loads(line)
+            answer = {"pdbfile": request["pdbfile"]}
+            try:
+                answer["records"] = analyse_frame(
+                    request["pdb"], request["frame"], output_path
+                )
+            except Exception as e:
+                answer["error"] = repr(e)
+            answers.write(json.dumps(answer) + "\n")
+            answers.flush()
+    finally:
+        shutil.rmtree(output_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""The atoms of a simulation any analysis looks at, extracted from the trajectory once.
+The protein, the ligands and whatever comes close to the ligands in the analysed
+frames are written as a pdb and a float32 dcd beside the upload, so analysing the
+simulation again does not read all the solvent and membrane of the trajectory again.
+The dcd keeps the frame numbers of the trajectory, frames no analysis asked for
+are holes of a sparse file until one does.
+"""
+
+from pathlib import Path
+from typing import Callable, Iterator
+import json
+import math
+import os
+import tempfile
+
+from django.conf import settings
+import numpy as np
+from vmd import atomsel, molecule, vmdnumpy
+
+from .cancellation import AnalysisCancelled
+from .contacts import LIGAND_SELECTION, WATER_SELECTION, conect_records, filetype
+from .desmond import open_desmond
+from .frame_index import get_frame_index, write_frames
+from .mapped_trajectory import DcdWriter
+from .models import TrajectoryFiles
+from .selection import FrameSelector, index_selection
+from .utils import choose_scratch_dir, chunked
+
+POCKET_CACHE_DIRNAME = "pocket_cache"
+# waters and ions this close to a ligand in any frame are kept, further than
+# the binding site of PLIP and the pocket the frames are clustered by
+POCKET_CACHE_DISTANCE = 10
+POCKET_CACHE_CHUNK_FRAMES = 100
+POCKET_CACHE_MANIFEST = "manifest.json"
+
+
+def file_stamp(file: Path) -> list[int]:
+    stat = file.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_cache_distance() -> int:
+    """POCKET_CACHE_DISTANCE, or the pocket radius or the water shell when they
+    reach further, the cache holds every atom they select.
+    """
+    return max(
+        POCKET_CACHE_DISTANCE,
+        settings.POCKET_RADIUS or 0,
+        settings.WATER_SHELL_DISTANCE or 0,
+    )
+
+
+def read_chunks(
+    molid: int, trajectory_file: Path, frames: list[int]
+) -> Iterator[list[tuple[int, int]]]:
+    """Loads the frames of the trajectory a chunk at a time, yields every frame
+    of the chunk with where it is loaded.
+    """
+    num_frames = molecule.numframes(molid)
+    offsets = get_frame_index(trajectory_file)
+    chunks = chunked(frames, POCKET_CACHE_CHUNK_FRAMES)
+    desmond = open_desmond(trajectory_file)
+    if desmond is not None:
+        chunks = desmond.stream(chunks)
+    for chunk in chunks:
+        if offsets is not None:
+            chunk_bytes = int(sum(offsets[f + 1] - offsets[f] for f in chunk))
+            with tempfile.TemporaryDirectory(
+                prefix="frames_", dir=choose_scratch_dir(chunk_bytes)
+            ) as tmp_dir:
+                frames_file = Path(tmp_dir) / f"frames{trajectory_file.suffix}"
+                write_frames(trajectory_file, offsets, chunk, frames_file)
+                molecule.read(
+                    molid=molid,
+                    filetype=filetype(trajectory_file),
+                    filename=str(frames_file),
+                    waitfor=-1,
+                )
+            # only the frames of the chunk are in the file, one after the other
+            positions = list(range(len(chunk)))
+        else:
+            # frames left out by a common stride are not even read
+            stride = math.gcd(*[b - a for a, b in zip(chunk, chunk[1:])]) or 1
+            molecule.read(
+                molid=molid,
+                filetype=filetype(trajectory_file),
+                filename=str(trajectory_file),
+                first=chunk[0],
+                last=chunk[-1],
+                stride=stride,
+                waitfor=-1,
+            )
+            positions = [(frame - chunk[0]) // stride for frame in chunk]
+        yield [
+            (frame, num_frames + position) for frame, position in zip(chunk, positions)
+        ]
+        molecule.delframe(molid, first=num_frames, last=-1)
+
+
+def get_pocket_atoms(
+    molid: int,
+    trajectory_file: Path,
+    frames: list[int],
+    distance: int,
+    should_stop: Callable[[], bool] | None = None,
+) -> np.ndarray:
+    """Indices of the protein, the ligands and the other residues within
+    distance of the ligands in any of the frames, without lipids.
+    """
+    selector = FrameSelector(molid, LIGAND_SELECTION, WATER_SELECTION)
+    protein = np.zeros(len(selector.residue), dtype=bool)
+    protein[selector.protein] = True
+    ligands = np.flatnonzero(selector.ligand)
+    others = np.flatnonzero(~(protein | selector.ligand | selector.lipid))
+    near = np.zeros(selector.residue.max() + 1, dtype=bool)
+    for chunk in read_chunks(molid, trajectory_file, frames):
+        if should_stop is not None and should_stop():
+            raise AnalysisCancelled()
+        for _, loaded_frame in chunk:
+            near |= selector.near_residues(loaded_frame, others, ligands, distance)
+    return np.flatnonzero(protein | selector.ligand | near[selector.residue])
+
+
+def write_pocket_topology(
+    molid: int, loaded_frame: int, atoms: np.ndarray, outfile: Path
+):
+    """The atoms as a pdb with the bonds of the topology as CONECT records,
+    fragments and ligand bonds are the same as in the full topology.
+    """
+    selection = atomsel(index_selection(atoms), molid=molid)
+    molecule.write(
+        molid=molid,
+        filetype="pdb",
+        filename=str(outfile),
+        first=loaded_frame,
+        last=loaded_frame,
+        selection=selection,
+    )
+    bonds = np.array(
+        sorted(
+            (atom, other)
+            for atom, bonded in zip(atoms, selection.bonds)
+            for other in bonded
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    conect = conect_records(bonds, atoms)
+    if conect == "" and len(bonds) > 0:
+        print(
+            "Pocket cache: too many atoms for CONECT records, VMD guesses the bonds",
+            flush=True,
+        )
+    pdb = outfile.read_text()
+    if pdb.endswith("END\n"):
+        pdb = pdb[: -len("END\n")]
+    outfile.write_text(pdb + conect + "END\n")
+
+
+def write_pocket_cache(
+    files: TrajectoryFiles,
+    cached: TrajectoryFiles,
+    frames: list[int],
+    frame_count: int,
+    distance: int,
+    should_stop: Callable[[], bool] | None = None,
+):
+    molid = molecule.load(filetype(files.topology), str(files.topology))
+    try:
+        atoms = get_pocket_atoms(molid, files.trajectory, frames, distance, should_stop)
+        print(
+            f"Pocket cache: {len(atoms)} of {molecule.numatoms(molid)} atoms "
+            f"within {distance} A of the ligands in {len(frames)} frames",
+            flush=True,
+        )
+        writer = DcdWriter(cached.trajectory, len(atoms), frame_count)
+        try:
+            for chunk in read_chunks(molid, files.trajectory, frames):
+                if should_stop is not None and should_stop():
+                    raise AnalysisCancelled()
+                for frame, loaded_frame in chunk:
+                    if frame == frames[0]:
+                        write_pocket_topology(
+                            molid, loaded_frame, atoms, cached.topology
+                        )
+                    writer.write(frame, vmdnumpy.timestep(molid, loaded_frame)[atoms])
+        finally:
+            writer.close()
+    finally:
+        molecule.delete(molid)
+
+
+def get_pocket_cache(
+    files: TrajectoryFiles,
+    frames: list[int],
+    frame_count: int,
+    should_stop: Callable[[], bool] | None = None,
+) -> TrajectoryFiles:
+    """The pocket of the simulation as a topology and a trajectory with the same
+    frame numbers, extracted again when frames are asked for it does not have.
+    """
+    # replicas share the topology, every trajectory has a cache of its own
+    cache_dir = files.topology.parent / POCKET_CACHE_DIRNAME / files.trajectory.name
+    cached = TrajectoryFiles(cache_dir / "pocket.pdb", cache_dir / "pocket.dcd")
+    manifest = {
+        "topology": file_stamp(files.topology),
+        "trajectory": file_stamp(files.trajectory),
+        "frame_count": frame_count,
+        "distance": get_cache_distance(),
+    }
+    frames = sorted(frames)
+    manifest_path = cache_dir / POCKET_CACHE_MANIFEST
+    if manifest_path.is_file():
+        with open(manifest_path) as f:
+            stored = json.load(f)
+        cached_frames = stored.pop("frames", [])
+        if stored == manifest:
+            if set(frames) <= set(cached_frames):
+                print("Reading the pocket cache", flush=True)
+                return cached
+            # the frames of earlier analyses stay, so analyses of different
+            # windows do not extract the cache in turns
+            frames = sorted(set(frames) | set(cached_frames))
+        manifest_path.unlink()
+    print(f"Extracting the pocket cache of {len(frames)} frames", flush=True)
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    write_pocket_cache(
+        files, cached, frames, frame_count, manifest["distance"], should_stop
+    )
+    manifest["frames"] = frames
+    # the manifest is written last, an interrupted extraction starts over
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    return cached
@@ -0,0 +1,159 @@
+from datetime import datetime, timezone
+import time
+
+from django.core.cache import cache
+
+PROGRESS_KEY_PREFIX = "sim_progress:"
+# progress entries are only useful while the dashboard can show them
+PROGRESS_TIMEOUT_IN_SECONDS = 60 * 60 * 24
+# updates within the same stage are dropped when they come faster than this
+PROGRESS_PUBLISH_INTERVAL_IN_SECONDS = 1
+
+STAGE_EXTRACTING = "extracting"
+STAGE_PLIP = "plip"
+STAGE_ANALYSING = "analysing"
+STAGE_FINISHED = "finished"
+STAGE_FAILED = "failed"
+
+FINAL_STAGES = [STAGE_FINISHED, STAGE_FAILED]
+
+
+def progress_key(sim_id) -> str:
+    return PROGRESS_KEY_PREFIX + str(sim_id)
+
+
+def shard_key(sim_id, shard: int) -> str:
+    return f"{progress_key(sim_id)}:{shard}"
+
+
+def describe_progress(progress: dict) -> str:
+    stage = progress["stage"]
+    if stage == STAGE_EXTRACTING:
+        return "Running: extracting frames"
+    if stage == STAGE_ANALYSING:
+        return "Running: preparing results"
+    if stage == STAGE_FINISHED:
+        return "Finished"
+    if stage == STAGE_FAILED:
+        return "Failure"
+    status = f"Running {progress['frames_done']} / {progress['frame_count']} frames"
+    eta = progress.get("eta_seconds")
+    if eta is not None:
+        status += f" (ETA {format_eta(eta)})"
+    return status
+
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return "<1 min"
+    if seconds < 60 * 60:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h {(seconds % 3600) // 60} min"
+
+
+class ProgressPublisher:
+    """Publishes per-simulation progress for the dashboard stream.
+    Workers write, the ASGI stream only reads from the cache. The task of a
+    replica publishes its shard, and the progress of the simulation summed over
+    the shards published so far.
+    """
+
+    def __init__(
+        self, sim_id, frame_count: int, shard: int | None = None, shard_count: int = 1
+    ) -> None:
+        self.sim_id = str(sim_id)
+        self.frame_count = frame_count
+        self.shard = shard
+        self.shard_count = shard_count
+        self.stage_started_at = time.monotonic()
+        self.published_at = None
+        self.frames_done = 0
+        # frames a resumed analysis had already done when the stage started
+        self.stage_frames_done = 0
+        self.stage = None
+
+    def publish(self, stage: str, frames_done: int | None = None) -> None:
+        now = time.monotonic()
+        if (
+            stage == self.stage
+            and stage not in FINAL_STAGES
+            and self.published_at is not None
+            and now - self.published_at < PROGRESS_PUBLISH_INTERVAL_IN_SECONDS
+        ):
+            return
+        self.published_at = now
+        if frames_done is not None:
+            self.frames_done = frames_done
+        if stage != self.stage:
+            self.stage = stage
+            self.stage_started_at = now
+            self.stage_frames_done = self.frames_done
+        progress = {
+            "sim_id": self.sim_id,
+            "stage": stage,
+            "frames_done": self.frames_done,
+            "frame_count": self.frame_count,
+            "eta_seconds": self.estimate_remaining_seconds(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        progress["status"] = describe_progress(progress)
+        try:
+            if self.shard is not None:
+                cache.set(
+                    shard_key(self.sim_id, self.shard),
+                    progress,
+                    PROGRESS_TIMEOUT_IN_SECONDS,
+                )
+                progress = self.combine_shards(progress)
+            cache.set(progress_key(self.sim_id), progress, PROGRESS_TIMEOUT_IN_SECONDS)
+        except Exception as e:
+            # progress is informative only, never fail the analysis because of it
+            print(f"Failed to publish progress: {e}", flush=True)
+
+    def combine_shards(self, progress: dict) -> dict:
+        found = cache.get_many(
+            [shard_key(self.sim_id, shard) for shard in range(self.shard_count)]
+        )
+        found[shard_key(self.sim_id, self.shard)] = progress
+        shards = list(found.values())
+        stages = {shard["stage"] for shard in shards}
+        if STAGE_FAILED in stages:
+            stage = STAGE_FAILED
+        elif stages == {STAGE_FINISHED} and len(shards) == self.shard_count:
+            # the last replica merges them
+            stage = STAGE_ANALYSING
+        elif STAGE_PLIP in stages or STAGE_FINISHED in stages:
+            stage = STAGE_PLIP
+        else:
+            stage = STAGE_EXTRACTING
+        etas = [shard["eta_seconds"] for shard in shards if shard["eta_seconds"]]
+        combined = {
+            "sim_id": self.sim_id,
+            "stage": stage,
+            "frames_done": sum(shard["frames_done"] for shard in shards),
+            "frame_count": self.frame_count * self.shard_count,
+            # the shards run side by side, the slowest one ends the analysis
+            "eta_seconds": max(etas) if len(etas) > 0 else None,
+            "updated_at": progress["updated_at"],
+        }
+        combined["status"] = describe_progress(combined)
+        return combined
+
+    def estimate_remaining_seconds(self) -> float | None:
+        frames_done_in_stage = self.frames_done - self.stage_frames_done
+        if self.stage != STAGE_PLIP or frames_done_in_stage <= 0:
+            return None
+        elapsed = time.monotonic() - self.stage_started_at
+        remaining_frames = max(self.frame_count - self.frames_done, 0)
+        return elapsed / frames_done_in_stage * remaining_frames
+
+
+def get_progress(sim_ids: list[str]) -> dict[str, dict]:
+    found = cache.get_many([progress_key(sim_id) for sim_id in sim_ids])
+    return {key[len(PROGRESS_KEY_PREFIX) :]: value for key, value in found.items()}
+
+
+async def aget_progress(sim_ids: list[str]) -> dict[str, dict]:
+    found = await cache.aget_many([progress_key(sim_id) for sim_id in sim_ids])
+    return {key[len(PROGRESS_KEY_PREFIX) :]: value for key, value in found.items()}
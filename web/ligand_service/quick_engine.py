@@ -0,0 +1,525 @@
+"""Interactions found with numpy straight from the trajectory coordinates, no PLIP.
+Atoms are typed once from the bonds of the topology, every frame then only takes
+distances and angles, with the limits PLIP uses. Only hydrophobic contacts,
+hydrogen bonds, salt bridges and pi-stacking are detected, an approximation
+of the full analysis.
+"""
+
+from pathlib import Path
+from typing import Callable, NamedTuple
+import tempfile
+
+import numpy as np
+from openbabel import pybel
+from plip.basic import config
+from vmd import atomsel, molecule
+
+from .cancellation import AnalysisCancelled
+from .contacts import TrajectoryFrames
+from .plip_report import interaction_record, ligand_residue
+from .selection import index_selection, within
+
+# frames stored at once, the checkpoint is written after every batch
+QUICK_RECORDS_BATCH = 100
+
+# aromatic side chain rings, tryptophan has two of them
+PROTEIN_RINGS = {
+    "PHE": [("CG", "CD1", "CD2", "CE1", "CE2", "CZ")],
+    "TYR": [("CG", "CD1", "CD2", "CE1", "CE2", "CZ")],
+    "TRP": [
+        ("CG", "CD1", "NE1", "CE2", "CD2"),
+        ("CD2", "CE2", "CE3", "CZ2", "CZ3", "CH2"),
+    ],
+    "HIS": [("CG", "ND1", "CD2", "CE1", "NE2")],
+}
+# charged side chain atoms, the centre of them is the charge
+PROTEIN_CHARGES = {
+    "ARG": (1, ("NE", "NH1", "NH2")),
+    "LYS": (1, ("NZ",)),
+    "HIS": (1, ("ND1", "NE2")),
+    "ASP": (-1, ("OD1", "OD2")),
+    "GLU": (-1, ("OE1", "OE2")),
+}
+
+
+class InteractionGroups(NamedTuple):
+    """Atoms of one side of the interactions, by the part they can play in them."""
+
+    hydrophobic: np.ndarray
+    donors: np.ndarray
+    # bonded to the donor in the same position
+    hydrogens: np.ndarray
+    acceptors: np.ndarray
+    charges: list[tuple[int, np.ndarray]]
+    rings: list[np.ndarray]
+
+    def near(self, site: np.ndarray) -> "InteractionGroups":
+        """Only the atoms and groups touching the site mask."""
+        return InteractionGroups(
+            self.hydrophobic[site[self.hydrophobic]],
+            self.donors[site[self.donors]],
+            self.hydrogens[site[self.donors]],
+            self.acceptors[site[self.acceptors]],
+            [(charge, atoms) for charge, atoms in self.charges if site[atoms].any()],
+            [ring for ring in self.rings if site[ring].any()],
+        )
+
+
+class Ligand(NamedTuple):
+    atoms: np.ndarray
+    groups: InteractionGroups
+    identity: dict
+
+
+def guess_elements(everything) -> np.ndarray:
+    elements = np.array([element.upper() for element in everything.element])
+    # psf and some pdb topologies have no elements, the atom names start with them
+    guessed = np.array(
+        [name.lstrip("0123456789")[:1].upper() for name in everything.name]
+    )
+    return np.where(np.isin(elements, ["", "X"]), guessed, elements)
+
+
+def pair_distances(coordinates: np.ndarray, a: np.ndarray, b: np.ndarray):
+    delta = coordinates[a][:, None, :] - coordinates[b][None, :, :]
+    return np.sqrt((delta * delta).sum(axis=2))
+
+
+def ring_geometry(coordinates: np.ndarray, ring: np.ndarray):
+    """Centre and normal of a ring, the normal taken like PLIP does."""
+    points = coordinates[ring].astype(np.float64)
+    normal = np.cross(points[2] - points[0], points[0] - points[4])
+    return points.mean(axis=0), normal / np.linalg.norm(normal)
+
+
+def plane_offset(normal: np.ndarray, center: np.ndarray, point: np.ndarray) -> float:
+    """Distance of the centre to the point projected onto the plane."""
+    delta = point - center
+    return float(np.linalg.norm(delta - normal * np.dot(normal, delta)))
+
+
+def get_ligand_residues(trajectory_frames: TrajectoryFrames) -> list[np.ndarray]:
+    """Atoms of every residue PLIP would take for a ligand."""
+    everything = atomsel("all", molid=trajectory_frames.molid)
+    residues = np.asarray(everything.residue)
+    resnames = np.array(everything.resname)
+    elements = guess_elements(everything)
+    # the ligand mask was taken before waters were renamed
+    ligand_atoms = np.flatnonzero(trajectory_frames.selector.ligand)
+    ligands = []
+    for residue in np.unique(residues[ligand_atoms]):
+        atoms = ligand_atoms[residues[ligand_atoms] == residue]
+        heavy = (elements[atoms] != "H").sum()
+        # PLIP leaves out single atoms and crystallisation artifacts too
+        if heavy < 2 or resnames[atoms[0]] in config.biolip_list:
+            continue
+        ligands.append(atoms)
+    return ligands
+
+
+def read_ligand(molid: int, atoms: np.ndarray) -> pybel.Molecule:
+    """The ligand atoms of the first loaded frame, read by openbabel."""
+    with tempfile.TemporaryDirectory(prefix="ligand_") as tmp_dir:
+        pdbfile = Path(tmp_dir) / "ligand.pdb"
+        molecule.write(
+            molid=molid,
+            filetype="pdb",
+            filename=str(pdbfile),
+            first=0,
+            last=0,
+            selection=atomsel(index_selection(atoms), molid=molid),
+        )
+        return next(pybel.readfile("pdb", str(pdbfile)))
+
+
+def ligand_identity(mol: pybel.Molecule, chain: str, name: str, number) -> dict:
+    """The ligand fields of a PLIP binding site."""
+    return {
+        "name": name,
+        "ligtype": "SMALLMOLECULE",
+        "smiles": mol.write("can").split()[0],
+        "inchikey": mol.write("inchikey").strip(),
+        "residue": ligand_residue(chain, name, number),
+    }
+
+
+class QuickEngine:
+    """Interactions of the protein with every ligand in the loaded frames."""
+
+    def __init__(self, trajectory_frames: TrajectoryFrames) -> None:
+        self.molid = trajectory_frames.molid
+        everything = atomsel("all", molid=self.molid)
+        self.names = np.array(everything.name)
+        self.resnames = np.array(everything.resname)
+        self.chains = np.array(everything.chain)
+        self.resids = np.array(everything.resid)
+        self.residues = np.asarray(everything.residue)
+        self.elements = guess_elements(everything)
+        self.bonds = everything.bonds
+
+        selector = trajectory_frames.selector
+        self.protein = selector.protein
+        self.protein_groups = self.get_protein_groups()
+        self.ligands = [
+            self.get_ligand(atoms) for atoms in get_ligand_residues(trajectory_frames)
+        ]
+        # atoms after the last protein or ligand atom, mostly solvent, are never read
+        last_atom = max(
+            [self.protein.max(initial=-1)]
+            + [ligand.atoms.max() for ligand in self.ligands]
+        )
+        self.atoms = slice(0, int(last_atom) + 1)
+        print(f"Quick engine: {len(self.ligands)} ligands", flush=True)
+
+    def neighbours(self, atom: int) -> list[str]:
+        return [self.elements[other] for other in self.bonds[atom]]
+
+    def hydrogens_of(self, atom: int) -> list[int]:
+        return [other for other in self.bonds[atom] if self.elements[other] == "H"]
+
+    def get_groups(
+        self,
+        atoms: np.ndarray,
+        charges: list[tuple[int, np.ndarray]],
+        rings: list[np.ndarray],
+    ) -> InteractionGroups:
+        hydrophobic, donors, hydrogens, acceptors = [], [], [], []
+        for atom in atoms:
+            element = self.elements[atom]
+            neighbours = self.neighbours(atom)
+            if element == "C" and all(other in ["C", "H"] for other in neighbours):
+                hydrophobic.append(atom)
+            if element not in ["N", "O"]:
+                continue
+            atom_hydrogens = self.hydrogens_of(atom)
+            for hydrogen in atom_hydrogens:
+                donors.append(atom)
+                hydrogens.append(hydrogen)
+            # amide and amine nitrogens have no free electron pair
+            if element == "O" or (len(atom_hydrogens) == 0 and len(neighbours) < 3):
+                acceptors.append(atom)
+        return InteractionGroups(
+            np.array(hydrophobic, dtype=np.int64),
+            np.array(donors, dtype=np.int64),
+            np.array(hydrogens, dtype=np.int64),
+            np.array(acceptors, dtype=np.int64),
+            charges,
+            rings,
+        )
+
+    def get_protein_groups(self) -> InteractionGroups:
+        names_by_residue = {}
+        for atom in self.protein:
+            if (
+                self.resnames[atom] in PROTEIN_RINGS
+                or self.resnames[atom] in PROTEIN_CHARGES
+            ):
+                names_by_residue.setdefault(self.residues[atom], {})[
+                    self.names[atom]
+                ] = atom
+        charges, rings = [], []
+        for names in names_by_residue.values():
+            resname = self.resnames[next(iter(names.values()))]
+            for ring_names in PROTEIN_RINGS.get(resname, []):
+                if all(name in names for name in ring_names):
+                    rings.append(np.array([names[name] for name in ring_names]))
+            if resname in PROTEIN_CHARGES:
+                charge, charge_names = PROTEIN_CHARGES[resname]
+                charged = [names[name] for name in charge_names if name in names]
+                if len(charged) > 0:
+                    charges.append((charge, np.array(charged)))
+        return self.get_groups(self.protein, charges, rings)
+
+    def get_ligand_charges(self, atoms: np.ndarray) -> list[tuple[int, np.ndarray]]:
+        """Ammonium and guanidinium cations,
+        carboxylate, phosphate and sulfonate anions.
+        """
+        charges = []
+        for atom in atoms:
+            element = self.elements[atom]
+            bonded = self.bonds[atom]
+            # oxygens bonded to nothing else carry the negative charge
+            terminal_oxygens = [
+                other
+                for other in bonded
+                if self.elements[other] == "O" and len(self.bonds[other]) == 1
+            ]
+            nitrogens = [other for other in bonded if self.elements[other] == "N"]
+            if element == "N" and len(bonded) == 4:
+                charges.append((1, np.array([atom])))
+            elif element == "C" and len(nitrogens) == 3:
+                charges.append((1, np.array(nitrogens)))
+            elif (element in ["C", "P"] and len(terminal_oxygens) >= 2) or (
+                element == "S" and len(terminal_oxygens) >= 3
+            ):
+                charges.append((-1, np.array(terminal_oxygens)))
+        return charges
+
+    def get_ligand(self, atoms: np.ndarray) -> Ligand:
+        """Types the ligand atoms, its aromatic rings and identity are perceived
+        by openbabel, the same way PLIP does.
+        """
+        mol = read_ligand(self.molid, atoms)
+        # openbabel keeps the atoms in the order VMD wrote them
+        rings = [
+            atoms[np.array(ring._path) - 1]
+            for ring in mol.sssr
+            if ring.IsAromatic() and ring.Size() in [5, 6]
+        ]
+        atom = atoms[0]
+        identity = ligand_identity(
+            mol, self.chains[atom], self.resnames[atom], self.resids[atom]
+        )
+        groups = self.get_groups(atoms, self.get_ligand_charges(atoms), rings)
+        return Ligand(atoms, groups, identity)
+
+    def features(self, protein_atom: int, ligand_atom: int) -> dict:
+        return {
+            "reschain": self.chains[protein_atom],
+            "restype": self.resnames[protein_atom],
+            "resnr": self.resids[protein_atom],
+            "reschain_lig": self.chains[ligand_atom],
+            "restype_lig": self.resnames[ligand_atom],
+            "resnr_lig": self.resids[ligand_atom],
+        }
+
+    def frame_records(
+        self, frame: int, coordinates: np.ndarray
+    ) -> dict[str, list[dict]]:
+        records = {"interactions": [], "ligands": []}
+        for ligand in self.ligands:
+            near = within(
+                coordinates[self.protein], coordinates[ligand.atoms], config.BS_DIST
+            )
+            if not near.any():
+                continue
+            site = np.zeros(len(self.names), dtype=bool)
+            site[self.protein[near]] = True
+            contacts = self.find_contacts(
+                coordinates, self.protein_groups.near(site), ligand.groups
+            )
+            if len(contacts) == 0:
+                continue
+            records["ligands"].append(ligand.identity)
+            for interaction_type, protein_atom, ligand_atom in contacts:
+                records["interactions"].append(
+                    interaction_record(
+                        frame,
+                        interaction_type,
+                        self.features(protein_atom, ligand_atom),
+                    )
+                )
+        return records
+
+    def find_contacts(
+        self,
+        coordinates: np.ndarray,
+        protein: InteractionGroups,
+        ligand: InteractionGroups,
+    ) -> list[tuple[str, int, int]]:
+        """Interactions by their PLIP report type, with an atom of either side."""
+        stacks = pi_stacks(coordinates, protein.rings, ligand.rings)
+        salt_bridges = find_salt_bridges(coordinates, protein.charges, ligand.charges)
+        # ring atoms of stacked rings have no hydrophobic contacts between them
+        stacked = {
+            (protein_atom, ligand_atom)
+            for protein_ring, ligand_ring in stacks
+            for protein_atom in protein_ring
+            for ligand_atom in ligand_ring
+        }
+        # neither do the atoms of salt bridges form hydrogen bonds
+        bridged = {
+            pair
+            for protein_group, ligand_group in salt_bridges
+            for protein_atom in protein_group[1]
+            for ligand_atom in ligand_group[1]
+            for pair in [(protein_atom, ligand_atom), (ligand_atom, protein_atom)]
+        }
+        contacts = [
+            ("hydrophobic_interactions", protein_atom, ligand_atom)
+            for protein_atom, ligand_atom in self.hydrophobic_contacts(
+                coordinates, protein, ligand, stacked
+            )
+        ]
+        contacts.extend(
+            ("hydrogen_bonds", acceptor, donor)
+            for donor, acceptor in hydrogen_bonds(
+                coordinates, ligand.donors, ligand.hydrogens, protein.acceptors, bridged
+            )
+        )
+        contacts.extend(
+            ("hydrogen_bonds", donor, acceptor)
+            for donor, acceptor in hydrogen_bonds(
+                coordinates,
+                protein.donors,
+                protein.hydrogens,
+                ligand.acceptors,
+                bridged,
+            )
+        )
+        contacts.extend(
+            ("salt_bridges", protein_group[1][0], ligand_group[1][0])
+            for protein_group, ligand_group in salt_bridges
+        )
+        contacts.extend(
+            ("pi_stacks", protein_ring[0], ligand_ring[0])
+            for protein_ring, ligand_ring in stacks
+        )
+        return contacts
+
+    def hydrophobic_contacts(
+        self,
+        coordinates: np.ndarray,
+        protein: InteractionGroups,
+        ligand: InteractionGroups,
+        stacked: set[tuple[int, int]],
+    ) -> list[tuple[int, int]]:
+        """Close carbons, reduced like PLIP to the closest one of every ligand atom
+        in a residue and then to the closest ligand atom of every protein atom.
+        """
+        distances = pair_distances(coordinates, protein.hydrophobic, ligand.hydrophobic)
+        close = (distances > config.MIN_DIST) & (distances < config.HYDROPH_DIST_MAX)
+        closest_in_residue = {}
+        for i, j in zip(*np.nonzero(close)):
+            protein_atom, ligand_atom = protein.hydrophobic[i], ligand.hydrophobic[j]
+            if (protein_atom, ligand_atom) in stacked:
+                continue
+            key = (ligand_atom, self.residues[protein_atom])
+            if (
+                key not in closest_in_residue
+                or distances[i, j] < closest_in_residue[key][0]
+            ):
+                closest_in_residue[key] = (distances[i, j], protein_atom)
+        closest_ligand_atom = {}
+        for (ligand_atom, _), (distance, protein_atom) in closest_in_residue.items():
+            if (
+                protein_atom not in closest_ligand_atom
+                or distance < closest_ligand_atom[protein_atom][0]
+            ):
+                closest_ligand_atom[protein_atom] = (distance, ligand_atom)
+        return [
+            (protein_atom, ligand_atom)
+            for protein_atom, (_, ligand_atom) in closest_ligand_atom.items()
+        ]
+
+
+def hydrogen_bonds(
+    coordinates: np.ndarray,
+    donors: np.ndarray,
+    hydrogens: np.ndarray,
+    acceptors: np.ndarray,
+    bridged: set[tuple[int, int]],
+) -> list[tuple[int, int]]:
+    """Donor and acceptor of every hydrogen bond, only the straightest one
+    of every donor is kept, like PLIP does.
+    """
+    if len(donors) == 0 or len(acceptors) == 0:
+        return []
+    distances = pair_distances(coordinates, donors, acceptors)
+    points = coordinates.astype(np.float64)
+    to_donor = points[donors] - points[hydrogens]
+    to_acceptor = points[acceptors][None, :, :] - points[hydrogens][:, None, :]
+    cosines = (to_donor[:, None, :] * to_acceptor).sum(axis=2) / (
+        np.linalg.norm(to_donor, axis=1)[:, None] * np.linalg.norm(to_acceptor, axis=2)
+    )
+    angles = np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+    found = (
+        (distances > config.MIN_DIST)
+        & (distances < config.HBOND_DIST_MAX)
+        & (angles > config.HBOND_DON_ANGLE_MIN)
+    )
+    straightest = {}
+    for i, j in zip(*np.nonzero(found)):
+        donor, acceptor = donors[i], acceptors[j]
+        if (donor, acceptor) in bridged:
+            continue
+        if donor not in straightest or angles[i, j] > straightest[donor][0]:
+            straightest[donor] = (angles[i, j], acceptor)
+    return [(donor, acceptor) for donor, (_, acceptor) in straightest.items()]
+
+
+def find_salt_bridges(
+    coordinates: np.ndarray,
+    protein_charges: list[tuple[int, np.ndarray]],
+    ligand_charges: list[tuple[int, np.ndarray]],
+) -> list[tuple[tuple[int, np.ndarray], tuple[int, np.ndarray]]]:
+    """Pairs of opposite charges of the protein and the ligand close to each other."""
+    salt_bridges = []
+    for protein_group in protein_charges:
+        protein_center = coordinates[protein_group[1]].mean(axis=0)
+        for ligand_group in ligand_charges:
+            if protein_group[0] == ligand_group[0]:
+                continue
+            distance = np.linalg.norm(
+                protein_center - coordinates[ligand_group[1]].mean(axis=0)
+            )
+            if config.MIN_DIST < distance < config.SALTBRIDGE_DIST_MAX:
+                salt_bridges.append((protein_group, ligand_group))
+    return salt_bridges
+
+
+def pi_stacks(
+    coordinates: np.ndarray,
+    protein_rings: list[np.ndarray],
+    ligand_rings: list[np.ndarray],
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Parallel and T-shaped stacked rings, by the distance, angle and offset
+    of their centres.
+    """
+    stacks = []
+    ligand_geometry = [ring_geometry(coordinates, ring) for ring in ligand_rings]
+    for protein_ring in protein_rings:
+        protein_center, protein_normal = ring_geometry(coordinates, protein_ring)
+        for ligand_ring, (ligand_center, ligand_normal) in zip(
+            ligand_rings, ligand_geometry
+        ):
+            distance = np.linalg.norm(protein_center - ligand_center)
+            if not config.MIN_DIST < distance < config.PISTACK_DIST_MAX:
+                continue
+            angle = np.degrees(
+                np.arccos(np.clip(np.dot(protein_normal, ligand_normal), -1, 1))
+            )
+            angle = min(angle, 180 - angle)
+            offset = min(
+                plane_offset(ligand_normal, ligand_center, protein_center),
+                plane_offset(protein_normal, protein_center, ligand_center),
+            )
+            if offset >= config.PISTACK_OFFSET_MAX:
+                continue
+            parallel = 0 < angle < config.PISTACK_ANG_DEV
+            t_shaped = abs(angle - 90) < config.PISTACK_ANG_DEV
+            if parallel or t_shaped:
+                stacks.append((protein_ring, ligand_ring))
+    return stacks
+
+
+def get_interactions_quick(
+    topology_file: Path,
+    trajectory_file: Path,
+    frames: list[int],
+    on_records: Callable[[dict[int, dict]], None],
+    on_progress: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+):
+    """Finds the interactions of the frames with the quick engine,
+    the records are handed over by frame in batches.
+    """
+    trajectory_frames = TrajectoryFrames(topology_file, trajectory_file, frames)
+    try:
+        engine = QuickEngine(trajectory_frames)
+        records_by_frame = {}
+        for frame_idx, frame in enumerate(trajectory_frames.frames):
+            if should_stop is not None and should_stop():
+                raise AnalysisCancelled()
+            records_by_frame[frame] = engine.frame_records(
+                frame, trajectory_frames.coordinates(frame, engine.atoms)
+            )
+            if len(records_by_frame) >= QUICK_RECORDS_BATCH:
+                on_records(records_by_frame)
+                records_by_frame = {}
+                if on_progress is not None:
+                    on_progress(frame_idx + 1)
+        if len(records_by_frame) > 0:
+            on_records(records_by_frame)
+    finally:
+        trajectory_frames.close()
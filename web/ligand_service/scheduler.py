@@ -0,0 +1,312 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import NamedTuple
+import heapq
+import uuid
+
+from django.conf import settings
+from django.db.models import Max
+from huey.contrib.djhuey import HUEY as huey
+
+from .costs import (
+    estimate_cost,
+    estimate_remaining_seconds,
+    get_seconds_per_atom_frame,
+    is_large,
+)
+from .models import (
+    AnalysisPriority,
+    AnalysisStatus,
+    InteractionEngine,
+    Simulation,
+    get_task_ids,
+)
+from .lease import (
+    expire_lease,
+    get_lease_duration,
+    get_lease_expiry,
+    grant_missing_lease,
+)
+from .utils import get_user_results_dir, get_user_work_dir
+
+
+class QueueEstimate(NamedTuple):
+    # 0 for analyses already handed to huey
+    position: int
+    # seconds until the analysis is expected to finish
+    eta_seconds: float
+
+
+NEVER_SERVED = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def get_priority(sim: Simulation) -> AnalysisPriority:
+    if sim.engine == InteractionEngine.QUICK:
+        return AnalysisPriority.SMALL
+    frame_count = sim.get_analysed_frame_count()
+    if frame_count is not None and frame_count <= settings.SMALL_ANALYSIS_FRAME_LIMIT:
+        return AnalysisPriority.SMALL
+    return AnalysisPriority.NORMAL
+
+
+def queue_simulation(sim: Simulation, priority: AnalysisPriority | None = None):
+    """Puts the simulation in the fair-share queue.
+    It is handed to huey once a worker slot is free and it is its turn.
+    """
+    if sim.status != AnalysisStatus.QUEUEING or not sim.is_not_queued():
+        return
+    if sim.get_trajectory_files() is None:
+        return
+    sim.priority = priority if priority is not None else get_priority(sim)
+    sim.estimated_cost = estimate_cost(sim)
+    sim.status = AnalysisStatus.QUEUED
+    sim.save()
+    dispatch_simulations()
+
+
+def get_slot_count(sim: Simulation) -> int:
+    # the replicas are analysed at the same time, one worker each
+    return min(sim.get_replica_count(), max(settings.ANALYSIS_WORKER_SLOTS, 1))
+
+
+def pick_simulations(
+    waiting: list[Simulation],
+    active_per_user: Counter,
+    last_served: dict[str, datetime],
+    free_slots: int,
+    large_in_flight: int = 0,
+) -> list[Simulation]:
+    per_user_limit = settings.MAXIMUM_RUNNING_ANALYSES_PER_USER
+    picked = []
+    remaining = list(waiting)
+    while free_slots > 0:
+        # very large analyses have their own lane, so they never take every worker
+        large_lane_full = large_in_flight >= settings.MAXIMUM_RUNNING_LARGE_ANALYSES
+        eligible = [
+            sim
+            for sim in remaining
+            if (
+                per_user_limit is None or active_per_user[sim.user_key] < per_user_limit
+            )
+            and not (large_lane_full and is_large(sim))
+        ]
+        if len(eligible) == 0:
+            break
+        best_priority = min(sim.priority for sim in eligible)
+        eligible = [sim for sim in eligible if sim.priority == best_priority]
+        # round robin between users: fewest analyses in flight first,
+        # then whoever was served the longest time ago
+        sim = min(
+            eligible,
+            key=lambda x: (
+                active_per_user[x.user_key],
+                last_served.get(x.user_key) or NEVER_SERVED,
+                x.created_at,
+            ),
+        )
+        # waits for enough workers rather than being overtaken by smaller ones
+        if get_slot_count(sim) > free_slots:
+            break
+        free_slots -= get_slot_count(sim)
+        picked.append(sim)
+        remaining.remove(sim)
+        active_per_user[sim.user_key] += 1
+        last_served[sim.user_key] = datetime.now(timezone.utc)
+        if is_large(sim):
+            large_in_flight += 1
+    return picked
+
+
+def get_in_flight_simulations() -> list[Simulation]:
+    return list(
+        Simulation.objects.filter(
+            status__in=[AnalysisStatus.QUEUED, AnalysisStatus.RUNNING],
+            analysis_task_id__isnull=False,
+            was_deleted=False,
+        )
+    )
+
+
+def get_waiting_simulations() -> list[Simulation]:
+    return list(
+        Simulation.objects.filter(
+            status=AnalysisStatus.QUEUED,
+            analysis_task_id__isnull=True,
+            was_deleted=False,
+        ).order_by("priority", "created_at")
+    )
+
+
+def get_last_served(user_keys: set[str]) -> dict[str, datetime]:
+    return {
+        row["user_key"]: row["last_dispatched_at"]
+        for row in Simulation.objects.filter(user_key__in=user_keys)
+        .values("user_key")
+        .annotate(last_dispatched_at=Max("dispatched_at"))
+    }
+
+
+def requeue_expired_simulations(in_flight: list[Simulation]) -> list[Simulation]:
+    """Puts analyses whose lease ran out back in the queue, their worker was most
+    likely killed. The next run resumes from the checkpoint.
+    Returns the analyses that are still in flight.
+    """
+    if get_lease_duration() is None:
+        return in_flight
+    now = datetime.now(timezone.utc)
+    for sim in in_flight:
+        if sim.lease_expires_at is None:
+            grant_missing_lease(sim.sim_id, sim.analysis_task_id)
+    expired = [
+        sim
+        for sim in in_flight
+        if sim.lease_expires_at is not None
+        and sim.lease_expires_at <= now
+        and expire_lease(sim.sim_id, sim.analysis_task_id)
+    ]
+    return [sim for sim in in_flight if sim not in expired]
+
+
+def dispatch_simulations():
+    # dispatchers can run at the same time, enqueue_analysis claims every
+    # simulation in the db, so none of them is handed to huey twice
+    in_flight = requeue_expired_simulations(get_in_flight_simulations())
+    free_slots = settings.ANALYSIS_WORKER_SLOTS - sum(
+        get_slot_count(sim) for sim in in_flight
+    )
+    if free_slots <= 0:
+        return
+    waiting = get_waiting_simulations()
+    if len(waiting) == 0:
+        return
+    active_per_user = Counter(sim.user_key for sim in in_flight)
+    last_served = get_last_served({sim.user_key for sim in waiting})
+    large_in_flight = len([sim for sim in in_flight if is_large(sim)])
+    for sim in pick_simulations(
+        waiting, active_per_user, last_served, free_slots, large_in_flight
+    ):
+        enqueue_analysis(sim)
+
+
+def enqueue_analysis(sim: Simulation):
+    # imported here, tasks use the scheduler when an analysis ends
+    from . import tasks
+
+    files = sim.get_trajectory_files()
+    if files is None:
+        sim.status = AnalysisStatus.FAILURE
+        sim.save()
+        return
+    dispatch_id = uuid.uuid4()
+    replica_files = [replica.trajectory for replica in sim.get_replicas()]
+    replica_tasks = []
+    for position, task_id in enumerate(
+        get_task_ids(dispatch_id, sim.get_replica_count())
+    ):
+        task = tasks.start_simulation.s(
+            files.topology,
+            files.trajectory,
+            get_user_work_dir(sim.user_key) / str(sim.sim_id),
+            get_user_results_dir(sim.results_id),
+            str(sim.sim_id),
+            sim.get_frames() if sim.frame_count is not None else None,
+            engine=sim.engine,
+            replica_files=replica_files,
+            replica=position,
+            dispatch_id=str(dispatch_id),
+        )
+        task.id = task_id
+        replica_tasks.append(task)
+    # the dispatch is stored before huey has its tasks, so the signals of a worker
+    # always find the row, and a simulation another dispatcher claimed is skipped
+    claimed = Simulation.objects.filter(
+        sim_id=sim.sim_id,
+        status=AnalysisStatus.QUEUED,
+        analysis_task_id__isnull=True,
+    ).update(
+        analysis_task_id=dispatch_id,
+        dispatched_at=datetime.now(timezone.utc),
+        lease_expires_at=get_lease_expiry(),
+        replicas_done=[],
+        analysis_worker_seconds=0.0,
+    )
+    if claimed == 0:
+        return
+    sim.analysis_task_id = dispatch_id
+    print(f"Dispatching simulation {sim.sim_id} of {sim.user_key}", flush=True)
+    try:
+        for task in replica_tasks:
+            huey.enqueue(task)
+    except Exception:
+        for task in replica_tasks:
+            huey.revoke_by_id(task.id)
+        Simulation.objects.filter(
+            sim_id=sim.sim_id, analysis_task_id=dispatch_id
+        ).update(analysis_task_id=None, dispatched_at=None, lease_expires_at=None)
+        raise
+
+
+def estimate_queue() -> dict[str, QueueEstimate]:
+    """Replays the scheduler with the cost model to get a position
+    and an ETA for every simulation that is queued or running.
+    """
+    rate = get_seconds_per_atom_frame()
+    in_flight = get_in_flight_simulations()
+    waiting = get_waiting_simulations()
+    estimates = {}
+    # (time the analysis ends, user_key, is large, worker slots)
+    running = []
+    for sim in in_flight:
+        remaining = estimate_remaining_seconds(sim, rate, get_slot_count(sim))
+        estimates[str(sim.sim_id)] = QueueEstimate(0, remaining)
+        heapq.heappush(
+            running, (remaining, sim.user_key, is_large(sim), get_slot_count(sim))
+        )
+    active_per_user = Counter(sim.user_key for sim in in_flight)
+    large_in_flight = len([sim for sim in in_flight if is_large(sim)])
+    last_served = get_last_served({sim.user_key for sim in waiting})
+    idle_slots = max(
+        settings.ANALYSIS_WORKER_SLOTS - sum(get_slot_count(sim) for sim in in_flight),
+        0,
+    )
+    now = 0.0
+    position = 0
+    while len(waiting) > 0:
+        for sim in pick_simulations(
+            waiting, active_per_user, last_served, idle_slots, large_in_flight
+        ):
+            waiting.remove(sim)
+            slots = get_slot_count(sim)
+            idle_slots -= slots
+            position += 1
+            end = now + estimate_remaining_seconds(sim, rate, slots)
+            estimates[str(sim.sim_id)] = QueueEstimate(position, end)
+            heapq.heappush(running, (end, sim.user_key, is_large(sim), slots))
+            if is_large(sim):
+                large_in_flight += 1
+        if len(running) == 0:
+            break
+        now, user_key, large, slots = heapq.heappop(running)
+        active_per_user[user_key] -= 1
+        if large:
+            large_in_flight -= 1
+        idle_slots += slots
+    return estimates
+
+
+def get_backlog_seconds() -> float:
+    """Worker time needed to clear the queue, spread over all worker slots."""
+    rate = get_seconds_per_atom_frame()
+    # an analysis takes its remaining wall time on every slot it holds
+    total = sum(
+        estimate_remaining_seconds(sim, rate, get_slot_count(sim)) * get_slot_count(sim)
+        for sim in get_in_flight_simulations() + get_waiting_simulations()
+    )
+    return total / max(settings.ANALYSIS_WORKER_SLOTS, 1)
+
+
+def annotate_queue_estimates(sims):
+    estimates = estimate_queue()
+    for sim in sims:
+        sim.queue_estimate = estimates.get(str(sim.sim_id), None)
+    return sims
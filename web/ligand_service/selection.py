@@ -0,0 +1,209 @@
+"""Atom selections of single frames evaluated with numpy.
+Protein, lipids, ligands, residues and bonded fragments are the same in every frame,
+they are looked up in VMD once, only the distances are computed again for every frame.
+"""
+
+import numpy as np
+from vmd import atomsel, vmdnumpy
+
+# distance to the protein of anything written out with it
+PROTEIN_DISTANCE = 7
+# protein with everything attached to it, ligands and waters close to it, no membrane
+FRAME_SELECTION = (
+    f"(not lipid) and (same fragment as (within {PROTEIN_DISTANCE} of protein))"
+)
+
+# the 27 cells around every cell, itself included
+NEIGHBOUR_CELLS = np.array(
+    [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)]
+)
+
+
+def cell_keys(cells: np.ndarray, shape: np.ndarray) -> np.ndarray:
+    return (cells[:, 0] * shape[1] + cells[:, 1]) * shape[2] + cells[:, 2]
+
+
+def within(points: np.ndarray, reference: np.ndarray, cutoff: float) -> np.ndarray:
+    """Mask of the points at most cutoff away from any of the reference points,
+    the within keyword of VMD. Reference points are sorted into cells as wide
+    as the cutoff, so every point is only compared to the 27 cells around it.
+    """
+    found = np.zeros(len(points), dtype=bool)
+    if len(points) == 0 or len(reference) == 0:
+        return found
+    # single precision like VMD, so atoms right at the cutoff are selected the same way
+    points = np.asarray(points, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    cutoff = np.float32(cutoff)
+    cutoff2 = cutoff * cutoff
+
+    lower = reference.min(axis=0)
+    upper = reference.max(axis=0)
+    # points outside the box around the reference can not be close to it
+    remaining = np.flatnonzero(
+        np.all((points >= lower - cutoff) & (points <= upper + cutoff), axis=1)
+    )
+    if len(remaining) == 0:
+        return found
+
+    reference_cells = np.floor((reference - lower) / cutoff).astype(np.int64)
+    shape = reference_cells.max(axis=0) + 1
+    order = np.argsort(cell_keys(reference_cells, shape), kind="stable")
+    sorted_keys = cell_keys(reference_cells[order], shape)
+    remaining_cells = np.floor((points[remaining] - lower) / cutoff).astype(np.int64)
+
+    for offset in NEIGHBOUR_CELLS:
+        cells = remaining_cells + offset
+        inside = np.all((cells >= 0) & (cells < shape), axis=1)
+        queries = remaining[inside]
+        keys = cell_keys(cells[inside], shape)
+        starts = np.searchsorted(sorted_keys, keys, side="left")
+        counts = np.searchsorted(sorted_keys, keys, side="right") - starts
+        total = counts.sum()
+        if total > 0:
+            # every point paired with every reference point of the cell
+            pair_points = np.repeat(queries, counts)
+            run_positions = np.arange(total) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            pair_reference = order[np.repeat(starts, counts) + run_positions]
+            delta = points[pair_points] - reference[pair_reference]
+            distance2 = (
+                delta[:, 0] * delta[:, 0]
+                + delta[:, 1] * delta[:, 1]
+                + delta[:, 2] * delta[:, 2]
+            )
+            found[pair_points[distance2 <= cutoff2]] = True
+        # points already found are not compared again
+        not_found = ~found[remaining]
+        remaining = remaining[not_found]
+        remaining_cells = remaining_cells[not_found]
+        if len(remaining) == 0:
+            break
+    return found
+
+
+def index_selection(indices: np.ndarray) -> str:
+    """VMD selection text of the atom indices, runs of indices written as ranges."""
+    if len(indices) == 0:
+        return "none"
+    indices = np.asarray(indices)
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.r_[0, breaks]]
+    ends = indices[np.r_[breaks - 1, len(indices) - 1]]
+    ranges = [
+        str(start) if start == end else f"{start} to {end}"
+        for start, end in zip(starts, ends)
+    ]
+    return "index " + " ".join(ranges)
+
+
+class FrameSelector:
+    """FRAME_SELECTION and the pocket around the ligands, for any loaded frame."""
+
+    def __init__(
+        self, molid: int, ligand_selection: str, water_selection: str = "water"
+    ) -> None:
+        self.molid = molid
+        everything = atomsel("all", molid=molid)
+        self.fragment = np.asarray(everything.fragment)
+        self.residue = np.asarray(everything.residue)
+        self.protein = np.flatnonzero(self.mask("protein"))
+        self.lipid = self.mask("lipid")
+        self.ligand = self.mask(ligand_selection)
+        self.water = self.mask(water_selection)
+
+        fragment_count = self.fragment.max() + 1
+        protein_fragments = np.zeros(fragment_count, dtype=bool)
+        protein_fragments[self.fragment[self.protein]] = True
+        written_fragments = np.zeros(fragment_count, dtype=bool)
+        written_fragments[self.fragment[~self.lipid]] = True
+        # fragments with protein are always within the distance of it,
+        # the others only matter if some of their atoms can be written
+        self.always = protein_fragments[self.fragment] & ~self.lipid
+        self.candidates = np.flatnonzero(
+            ~protein_fragments[self.fragment] & written_fragments[self.fragment]
+        )
+
+    def mask(self, selection: str) -> np.ndarray:
+        mask = np.zeros(len(self.fragment), dtype=bool)
+        mask[atomsel(selection, molid=self.molid).index] = True
+        return mask
+
+    def coordinates(self, frame: int) -> np.ndarray:
+        return vmdnumpy.timestep(self.molid, frame)
+
+    def frame_mask(self, frame: int) -> np.ndarray:
+        coordinates = self.coordinates(frame)
+        near = within(
+            coordinates[self.candidates],
+            coordinates[self.protein],
+            PROTEIN_DISTANCE,
+        )
+        near_fragments = np.zeros(self.fragment.max() + 1, dtype=bool)
+        near_fragments[self.fragment[self.candidates[near]]] = True
+        return self.always | (near_fragments[self.fragment] & ~self.lipid)
+
+    def frame_atoms(self, frame: int) -> np.ndarray:
+        """Indices of the atoms of FRAME_SELECTION in the frame."""
+        return np.flatnonzero(self.frame_mask(frame))
+
+    def ligand_near_protein(self, frame: int, distance: float) -> bool:
+        """Whether any ligand atom is at most distance away from the protein."""
+        coordinates = self.coordinates(frame)
+        return bool(
+            within(coordinates[self.ligand], coordinates[self.protein], distance).any()
+        )
+
+    def residue_ligand_distances(
+        self, frame: int, atoms: np.ndarray, cap: float
+    ) -> np.ndarray:
+        """Distance of every residue of the atoms to the closest ligand atom among
+        them, at most cap. The atoms have to be sorted.
+        """
+        coordinates = self.coordinates(frame)
+        residues = self.residue[atoms]
+        starts = np.flatnonzero(np.r_[True, residues[1:] != residues[:-1]])
+        ligand = coordinates[atoms[self.ligand[atoms]]]
+        if len(ligand) == 0:
+            return np.full(len(starts), cap, dtype=np.float32)
+        delta = coordinates[atoms][:, None, :] - ligand[None, :, :]
+        distances = np.sqrt((delta * delta).sum(axis=2)).min(axis=1)
+        return np.minimum(np.minimum.reduceat(distances, starts), cap)
+
+    def near_residues(
+        self, frame: int, atoms: np.ndarray, reference: np.ndarray, distance: float
+    ) -> np.ndarray:
+        """Mask of the residues of the atoms within distance of the reference."""
+        coordinates = self.coordinates(frame)
+        near = within(coordinates[atoms], coordinates[reference], distance)
+        residues = np.zeros(self.residue.max() + 1, dtype=bool)
+        residues[self.residue[atoms[near]]] = True
+        return residues
+
+    def water_shell(
+        self, frame: int, selected: np.ndarray, distance: float
+    ) -> np.ndarray:
+        """The selected atoms without the waters further than distance from either
+        the selected ligands or the protein, whole waters are kept or dropped.
+        """
+        waters = np.flatnonzero(selected & self.water)
+        if len(waters) == 0:
+            return selected
+        ligands = np.flatnonzero(selected & self.ligand)
+        near_ligand = self.near_residues(frame, waters, ligands, distance)
+        near_protein = self.near_residues(frame, waters, self.protein, distance)
+        bridging = (near_ligand & near_protein)[self.residue]
+        return selected & (~self.water | bridging)
+
+    def pocket_atoms(self, frame: int, radius: float) -> np.ndarray:
+        """Indices of the written residues within radius of the written ligands."""
+        selected = self.frame_mask(frame)
+        ligands = selected & self.ligand
+        if not ligands.any():
+            return np.zeros(0, dtype=np.int64)
+        coordinates = self.coordinates(frame)
+        near = within(coordinates, coordinates[ligands], radius)
+        near_residues = np.zeros(self.residue.max() + 1, dtype=bool)
+        near_residues[self.residue[near]] = True
+        return np.flatnonzero(selected & near_residues[self.residue])
@@ -115,6 +115,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "ligand_service.wsgi.application"
+ASGI_APPLICATION = "ligand_service.asgi.application"
 
 
 # Database
@@ -223,9 +224,12 @@ if RUNNING_IN_DOCKER:
         }
     }
 else:
+    # huey workers publish analysis progress through the cache,
+    # so it has to be shared between processes
     CACHES = {
         "default": {
-            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "django_cache",
         }
     }
 
@@ -285,6 +289,71 @@ else:
 
 MAX_THREADS_PER_WORKER = load_int_from_env("MAX_THREADS_PER_WORKER", 2)
 
+# analyses handed to huey at the same time, the rest waits in the fair-share queue
+ANALYSIS_WORKER_SLOTS = load_int_from_env(
+    "ANALYSIS_WORKER_SLOTS", os.environ.get("WORKER_COUNT", 1)
+)
+MAXIMUM_RUNNING_ANALYSES_PER_USER = load_int_from_env(
+    "MAXIMUM_RUNNING_ANALYSES_PER_USER"
+)
+# simulations with at most this many frames are dispatched before bigger ones
+SMALL_ANALYSIS_FRAME_LIMIT = load_int_from_env("SMALL_ANALYSIS_FRAME_LIMIT", 500)
+# analyses estimated to take longer than this run in a separate lane,
+# limited to MAXIMUM_RUNNING_LARGE_ANALYSES at a time
+LARGE_ANALYSIS_THRESHOLD_IN_HOURS = load_int_from_env(
+    "LARGE_ANALYSIS_THRESHOLD_IN_HOURS"
+)
+MAXIMUM_RUNNING_LARGE_ANALYSES = load_int_from_env("MAXIMUM_RUNNING_LARGE_ANALYSES", 1)
+# new uploads are refused while the estimated queue is longer than this
+MAXIMUM_QUEUE_BACKLOG_IN_HOURS = load_int_from_env("MAXIMUM_QUEUE_BACKLOG_IN_HOURS")
+
+# a failed analysis is run again this many times, resuming from its checkpoint
+ANALYSIS_RETRIES = load_int_from_env("ANALYSIS_RETRIES", 0)
+# lease of a dispatched analysis, renewed by its worker, it is requeued once it runs out
+STALLED_ANALYSIS_TIMEOUT_IN_MINUTES = load_int_from_env(
+    "STALLED_ANALYSIS_TIMEOUT_IN_MINUTES"
+)
+
+# "pool" keeps PLIP workers running between frames, "cli" runs the plip command for every batch
+PLIP_ENGINE = os.environ.get("PLIP_ENGINE", "cli")
+
+# parsed PLIP results of single frames, shared by identical frames of any simulation
+PLIP_CACHE_DIR = BASE_DIR / "plip_cache"
+PLIP_CACHE_SIZE_IN_MB = load_int_from_env("PLIP_CACHE_SIZE_IN_MB")
+
+# frames are cropped to residues and waters within this many angstroms of the ligands,
+# whole frames are written without it
+POCKET_RADIUS = load_int_from_env("POCKET_RADIUS")
+
+# frames without a ligand this close to the protein are stored without contacts,
+# PLIP is not run on them
+LIGAND_DISTANCE_CUTOFF = load_int_from_env("LIGAND_DISTANCE_CUTOFF")
+
+# frames are clustered by the geometry of the pocket and PLIP only analyses the medoid
+# and a sample of other frames of every cluster, the other frames get their results,
+# check the error on your trajectories with the validate_clusters command first
+REPRESENTATIVE_FRAME_CLUSTERS = load_int_from_env("REPRESENTATIVE_FRAME_CLUSTERS")
+REPRESENTATIVE_FRAME_SAMPLE = load_int_from_env("REPRESENTATIVE_FRAME_SAMPLE", 0)
+
+# only waters this close to both a ligand and the protein are written out with a frame,
+# the others can not take part in water bridges
+WATER_SHELL_DISTANCE = load_int_from_env("WATER_SHELL_DISTANCE")
+# without water bridges no waters are written out at all
+WATER_BRIDGES = os.environ.get("WATER_BRIDGES", "True") == "True"
+
+# frames keep the hydrogens of the topology and get CONECT records of the ligand bonds,
+# PLIP does not protonate them again
+TOPOLOGY_HYDROGENS = os.environ.get("TOPOLOGY_HYDROGENS", "False") == "True"
+
+# the protein, the ligands and the waters and ions near them are extracted from
+# the trajectory once, every analysis of the simulation reads only them
+POCKET_CACHE = os.environ.get("POCKET_CACHE", "False") == "True"
+
+# how long a single progress stream connection is kept open, browsers reconnect after it
+PROGRESS_STREAM_LIFETIME_IN_SECONDS = load_int_from_env(
+    "PROGRESS_STREAM_LIFETIME_IN_SECONDS", 300
+)
+
 DELETE_RESULTS_AFTER_N_DAYS = load_int_from_env("DELETE_RESULTS_AFTER_N_DAYS")
 
 MAXIMUM_UPLOAD_TIME_IN_MINUTES = load_int_from_env("MAXIMUM_UPLOAD_TIME_IN_MINUTES")
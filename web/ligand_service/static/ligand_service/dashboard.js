@@ -6,6 +6,13 @@ const selectedDirInfo = document.getElementById('filesInfo');
 const confirmButton = document.getElementById("confirmButton");
 const uploadStatusIndicator = document.getElementById("progressNumerical");
 const inputTypeSelect = document.getElementById("inputTypeSelect");
+const frameSelectionInputs = {
+	frameStart: document.getElementById("frameStartInput"),
+	frameEnd: document.getElementById("frameEndInput"),
+	frameStride: document.getElementById("frameStrideInput"),
+	targetFrameCount: document.getElementById("targetFrameCountInput"),
+};
+const engineSelect = document.getElementById("engineSelect");
 const cancelButton = document.getElementById("cancelButton");
 const browseButton = document.getElementById('browseButton');
 const clearButton = document.getElementById('clearButton');
@@ -348,12 +355,17 @@ var r = new Resumable({
 	target: 'api/sim/upload',
 	minFileSizeErrorCallback: function(file, errorCount) { },
 	// testChunks: false,
-	maxFilesErrorCallback: function(files, errorCount) {
-		alert('Choose two files: topology and trajectory');
-	},
 	testChunks: false,
 });
 
+// the types upload_manifest.py recognizes, every trajectory is a replica of the topology
+const TOPOLOGY_EXTENSIONS = ["pdb", "psf"];
+const TRAJECTORY_EXTENSIONS = ["dcd", "xtc", "trr"];
+
+function fileExtension(file) {
+	return file.fileName.split('.').at(-1).toLowerCase()
+}
+
 
 function getFileMainDirectory(file) {
 	return file.relativePath.split('/')[0]
@@ -384,11 +396,9 @@ function resetResumableFileUploaderState() {
 	if (selectedInput === "topTrj") {
 		selectedDirInfo.innerText = "Select files...";
 		r.assignBrowse(browseButton, false);
-		r.opts.maxFiles = 2
 	} else {
 		selectedDirInfo.innerText = "Select directory...";
 		r.assignBrowse(browseButton, true);
-		r.opts.maxFiles = undefined
 	}
 	r.files = []
 }
@@ -426,8 +436,10 @@ confirmButton.addEventListener("click", (event) => {
 		return;
 	}
 	if (selectedInput === "topTrj") {
-		if (fileCount < 2) {
-			alert('Choose two files: topology and trajectory');
+		const topologyCount = r.files.filter((file) => TOPOLOGY_EXTENSIONS.includes(fileExtension(file))).length;
+		const trajectoryCount = r.files.filter((file) => TRAJECTORY_EXTENSIONS.includes(fileExtension(file))).length;
+		if (topologyCount !== 1 || trajectoryCount < 1 || topologyCount + trajectoryCount !== fileCount) {
+			alert('Choose one topology and a trajectory for every replica');
 			return;
 		}
 	}
@@ -461,10 +473,21 @@ confirmButton.addEventListener("click", (event) => {
 	}
 	console.log(uuid4)
 	r.opts.query = { 'fileCount': fileCount, 'uploadUUID': uuid4, 'totalFileSizeInMB': totalFileSizeInMB };
+	// empty fields analyse every frame
+	for (const [key, input] of Object.entries(frameSelectionInputs)) {
+		if (input.value !== "") {
+			r.opts.query[key] = input.value;
+		}
+	}
+	r.opts.query['engine'] = engineSelect.value;
 	// naming the directory
 	if (selectedInput === "topTrj") {
-		fileNames = [r.files[0].fileName, r.files[1].fileName].sort()
+		fileNames = r.files.map((file) => file.fileName).sort()
+		// the names of all replicas would get too long for a directory
 		dirName = fileNames[0] + "-" + fileNames[1]
+		if (fileNames.length > 2) {
+			dirName += `-${fileNames.length - 1}-replicas`
+		}
 		r.files.forEach((file) => { file.relativePath = `${dirName}/${file.fileName}` })
 	}
 
@@ -517,7 +540,58 @@ async function prepareAnalysisContainers() {
 
 
 
+const POLLING_INTERVAL_MS = 10000;
+const POLLING_INTERVAL_WITH_STREAM_MS = 60000;
+let pollingIntervalId = setInterval(updateSimsData, POLLING_INTERVAL_MS);
+
+function setPollingInterval(interval) {
+	clearInterval(pollingIntervalId);
+	pollingIntervalId = setInterval(updateSimsData, interval);
+}
+
+// last stage of every simulation, a reconnected stream sends the same entries again
+const simStages = {};
+
+function applySimProgress(progress) {
+	const simContainer = simsContainer.querySelector(`.sim-data[data-sim-id="${progress.sim_id}"]`);
+	if (simContainer == null) {
+		return;
+	}
+	const statusNode = simContainer.querySelector(".sim-status");
+	const previousStage = simStages[progress.sim_id];
+	simStages[progress.sim_id] = progress.stage;
+	// finished / failed analyses change the available buttons, so those need a re-render
+	if (progress.stage === "finished" || progress.stage === "failed") {
+		const alreadyShown = previousStage === undefined
+			? statusNode != null && statusNode.innerText === progress.status
+			: previousStage === progress.stage;
+		if (!alreadyShown) {
+			updateSimsData();
+		}
+		return;
+	}
+	if (statusNode != null) {
+		statusNode.innerText = progress.status;
+	}
+}
+
+function connectProgressStream() {
+	if (typeof EventSource === "undefined") {
+		return;
+	}
+	const progressSource = new EventSource("api/sims-progress");
+	progressSource.addEventListener("open", () => {
+		setPollingInterval(POLLING_INTERVAL_WITH_STREAM_MS);
+	});
+	progressSource.addEventListener("error", () => {
+		setPollingInterval(POLLING_INTERVAL_MS);
+	});
+	progressSource.addEventListener("progress", (event) => {
+		applySimProgress(JSON.parse(event.data));
+	});
+}
+
 prepareSimContainers();
 prepareAnalysisContainers();
 resetResumableFileUploaderState();
-setInterval(updateSimsData, 10000)
+connectProgressStream();
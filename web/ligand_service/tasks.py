@@ -4,23 +4,67 @@ import json
 import logging
 import functools
 import shutil
+import time
 import pandas as pd
-import xmltodict
 
 from huey import crontab
-from huey.contrib.djhuey import periodic_task, task
+from huey.contrib.djhuey import on_startup, periodic_task, task, signal
+from huey.signals import (
+    SIGNAL_EXECUTING,
+    SIGNAL_COMPLETE,
+    SIGNAL_ERROR,
+    SIGNAL_CANCELED,
+    SIGNAL_EXPIRED,
+    SIGNAL_REVOKED,
+)
 
 from django.conf import settings
-
-from ligand_service.models import Simulation
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now as django_now
+
+from ligand_service.models import (
+    Simulation,
+    TrajectoryFiles,
+    AnalysisStatus,
+    IN_QUEUE_STATUSES,
+    InteractionEngine,
+    get_trajectory_frame_count,
+)
 
 from .contacts import (
-    get_trajectory_frame_count,
     create_translation_dict_by_blast,
     get_interactions_from_trajectory,
 )
 
+from .checkpoint import FrameCheckpoint
+from .plip_report import REPLICA_COLUMN, merge_replicas
+from .getcontacts_engine import get_interactions_getcontacts
+from .quick_engine import get_interactions_quick
+from .plip_cache import get_plip_result_cache
+from .pocket_cache import get_pocket_cache
+from .scheduler import dispatch_simulations
+from .cancellation import AnalysisCancelled, CancellationToken
+from .lease import (
+    LEASED_STATUSES,
+    LeaseKeeper,
+    get_lease_duration,
+    get_lease_expiry,
+    renew_lease,
+)
+from .utils import describe_frame_selection
+
+from .progress import (
+    ProgressPublisher,
+    STAGE_EXTRACTING,
+    STAGE_PLIP,
+    STAGE_ANALYSING,
+    STAGE_FINISHED,
+    STAGE_FAILED,
+)
+
 from .graphs import (
+    IDENTIFIER_COLUMN,
     plot_contact_fraction_heatmap,
     plot_correlation_covariance_heatmaps,
     create_getcontacts_table,
@@ -29,19 +73,10 @@ from .graphs import (
 )
 
 LIGAND_DETECTION_THRESHOLD = 0.7
+ALL_REPLICAS = "All replicas"
 INCHIKEY_TO_NAME_JSON_PATH = Path("./chebi/inchikey_to_name.json")
 INCHIKEY_TO_CHEBIID_JSON_PATH = Path("./chebi/inchikey_to_chebiID.json")
-
-INTERACTION_TYPE_RENAME = {
-    "hydrophobic_interactions": "Hydrophobic",
-    "hydrogen_bonds": "Hydrogen bond",
-    "water_bridges": "Water bridge",
-    "salt_bridges": "Salt bridge",
-    "pi_stacks": "Pi-pi stacking",
-    "pi_cation_interactions": "Pi-cation",
-    "halogen_bonds": "Halogen bond",
-    "metal_complexes": "Metal complex",
-}
+ANALYSIS_RETRY_DELAY_IN_SECONDS = 60
 
 logger = logging.getLogger(__name__)
 
@@ -64,101 +99,6 @@ def save_file(file_handle, path_to_save_location: Path):
             destination.write(chunk)
 
 
-def extract_data_from_plip_results(
-    results_dir: Path,
-) -> tuple[pd.DataFrame, pd.DataFrame] | None:
-    frames_data = {
-        "Frame": [],
-        "Interaction type": [],
-        "Residue chain": [],
-        "Residue name": [],
-        "Residue number": [],
-        "Ligand residue chain": [],
-        "Ligand residue name": [],
-        "Ligand residue number": [],
-    }
-    ligand_info = {
-        "frames_seen": [],
-        "name": [],
-        "ligtype": [],
-        "smiles": [],
-        "inchikey": [],
-        # "img": [],
-    }
-    logger.info("Extracting data from plip results...")
-    for dir in sorted(results_dir.iterdir(), key=lambda x: (len(str(x)), x)):
-        if not dir.is_dir():
-            continue
-        with open(dir / "report.xml") as f:
-            file_contents = f.read()
-            out = xmltodict.parse(file_contents)
-            binding_sites = out["report"]["bindingsite"]
-            # handling of instance, where there is only one binding site
-            if not isinstance(binding_sites, list):
-                binding_sites = [binding_sites]
-            for binding_site in binding_sites:
-                if binding_site["@has_interactions"] == "False":
-                    logger.info(f"Skipping binding_site: {binding_site}")
-                    continue
-                ident = binding_site["identifiers"]
-                interactions = binding_site["interactions"]
-                inchikey = ident["inchikey"]
-                if inchikey in ligand_info["inchikey"]:
-                    idx = ligand_info["inchikey"].index(inchikey)
-                    ligand_info["frames_seen"][idx] += 1
-                else:
-                    logger.info(f"Adding new ligand: {inchikey}")
-                    ligand_info["frames_seen"].append(1)
-                    ligand_info["name"].append(ident["longname"])
-                    ligand_info["ligtype"].append(ident["ligtype"])
-                    ligand_info["smiles"].append(ident["smiles"])
-                    ligand_info["inchikey"].append(inchikey)
-
-                # mol = Chem.MolFromSmiles(ident["smiles"])
-                # logger.info(f"Molecule created from SMILES")
-                # if mol is not None:
-                #     img = Draw.MolToImage(mol, size=(300, 300))
-                #     logger.info(f"Image created from mol")
-                #     buffer = BytesIO()
-                #     img.save(buffer, format="PNG")
-                #     img_str = base64.b64encode(buffer.getvalue()).decode()
-                #     inlined_image = (
-                #         f'<img src="data:image/png;base64,{img_str}">'
-                #     )
-                #     ligand_info["img"].append(inlined_image)
-                # else:
-                #     ligand_info["img"].append("")
-
-                for interaction_type in interactions:
-                    for contacts_lists in interactions[interaction_type] or []:
-                        contacts = interactions[interaction_type][contacts_lists]
-                        # handling of instance where there is only one interaction of given type,
-                        # xmltodict doesn't make a list in this case, it just provides the value
-                        if not isinstance(contacts, list):
-                            contacts = [contacts]
-                        for value in contacts:
-                            frames_data["Frame"].append(int(dir.stem[5:]))
-                            frames_data["Interaction type"].append(
-                                INTERACTION_TYPE_RENAME[interaction_type]
-                            )
-                            frames_data["Residue chain"].append(value["reschain"])
-                            frames_data["Residue number"].append(value["resnr"])
-                            frames_data["Residue name"].append(value["restype"])
-                            frames_data["Ligand residue chain"].append(
-                                value["reschain_lig"]
-                            )
-                            frames_data["Ligand residue number"].append(
-                                value["resnr_lig"]
-                            )
-                            frames_data["Ligand residue name"].append(
-                                value["restype_lig"]
-                            )
-    frame_df = pd.DataFrame(frames_data)
-    ligand_df = pd.DataFrame(ligand_info)
-    ligand_df.drop_duplicates(inplace=True)
-    return frame_df, ligand_df
-
-
 inchikey_to_name = {}
 inchikey_to_chebiID = {}
 
@@ -177,18 +117,31 @@ else:
 
 
 def analyse_simulation(
-    top_file: Path, traj_file: Path, plip_dir: Path, results_dir: Path
+    top_file: Path,
+    traj_file: Path,
+    df: pd.DataFrame,
+    ligand_df: pd.DataFrame,
+    results_dir: Path,
+    frames: list[int],
+    trajectory_frame_count: int,
+    engine: str = InteractionEngine.PLIP,
+    replicas: list[str] | None = None,
 ):
+    """replicas names the trajectories the rows of the replica column come from,
+    the frames were analysed in every one of them.
+    """
     run_data = {}
-    out = extract_data_from_plip_results(plip_dir)
-    if out is None:
-        return
-    shutil.rmtree(plip_dir)
-    df = out[0]
-    ligand_df = out[1]
     dic, scores = create_translation_dict_by_blast(top_file, traj_file)
     run_data["name"] = top_file.parent.name
     run_data["alignment_scores"] = scores
+    # frames without contacts are missing from the interactions
+    frame_count = len(frames) * max(len(replicas or []), 1)
+    run_data["frame_count"] = frame_count
+    run_data["frame_selection"] = describe_frame_selection(
+        frames, trajectory_frame_count
+    )
+    run_data["engine"] = engine
+    run_data["replicas"] = replicas or []
 
     def get_numbering_blast(row):
         assert dic is not None
@@ -201,22 +154,54 @@ def analyse_simulation(
             return dic[key]
 
     df["Aligned numbering"] = df.apply(get_numbering_blast, axis=1)
-    run_data["interaction_graph"] = create_interaction_area_graph(df)
+    timeline_df, timeline = df, frames
+    if replicas:
+        # the replicas are drawn one after another
+        offsets = {
+            replica: position * (frames[-1] + 1)
+            for position, replica in enumerate(replicas)
+        }
+        timeline_df = df.assign(Frame=df["Frame"] + df[REPLICA_COLUMN].map(offsets))
+        timeline = [offset + frame for offset in offsets.values() for frame in frames]
+    run_data["interaction_graph"] = create_interaction_area_graph(timeline_df, timeline)
     results_dir.mkdir(exist_ok=True, parents=True)
     df.to_csv(
         path_or_buf=(results_dir / "interactions.csv"),
         index=False,
     )
 
+    replica_frames_seen = {}
+    if replicas:
+        for ligand in ligand_df.to_dict(orient="records"):
+            replica_frames_seen.setdefault(ligand["inchikey"], {})[
+                ligand[REPLICA_COLUMN]
+            ] = ligand["frames_seen"]
+        by_ligand = ligand_df.groupby("inchikey", sort=False, dropna=False)
+        ligand_df = (
+            by_ligand.first()
+            .assign(frames_seen=by_ligand["frames_seen"].sum())
+            .reset_index()
+        )
+
     ligands_arr = []
     for ligand in ligand_df.to_dict(orient="records"):
-        simulation_frame_count = get_trajectory_frame_count(top_file, traj_file)
-        if ligand["frames_seen"] / simulation_frame_count < LIGAND_DETECTION_THRESHOLD:
+        # detected over the pooled frames of all replicas
+        if ligand["frames_seen"] / frame_count < LIGAND_DETECTION_THRESHOLD:
             print(
-                f"Skipping ligand below threshold, seen in {ligand['frames_seen']} out of {simulation_frame_count}",
+                f"Skipping ligand below threshold, seen in {ligand['frames_seen']} out of {frame_count}",
                 flush=True,
             )
             continue
+        replica_detections = []
+        for replica in replicas or []:
+            seen = replica_frames_seen.get(ligand["inchikey"], {}).get(replica, 0)
+            replica_detections.append(
+                {
+                    "name": replica,
+                    "frames_seen": seen,
+                    "detected": seen / len(frames) >= LIGAND_DETECTION_THRESHOLD,
+                }
+            )
         id = inchikey_to_chebiID.get(ligand["inchikey"], None)
         name = inchikey_to_name.get(ligand["inchikey"], None)
         ligands_arr = run_data.get("ligands", [])
@@ -228,13 +213,29 @@ def analyse_simulation(
                 "frames_seen": ligand["frames_seen"],
                 "smiles": ligand["smiles"],
                 "inchikey": ligand["inchikey"],
+                "replicas": replica_detections,
             }
         )
 
     run_data["ligands"] = ligands_arr
 
     run_data["table"] = create_getcontacts_table(df)
-    run_data["map"] = create_time_resolved_map(df)
+    run_data["map"] = create_time_resolved_map(timeline_df, timeline)
+    if replicas:
+        # contact fractions of every replica and of the pooled frames
+        replica_df = pd.concat(
+            [
+                df.assign(**{IDENTIFIER_COLUMN: df[REPLICA_COLUMN]}),
+                df.assign(**{IDENTIFIER_COLUMN: ALL_REPLICAS}),
+            ]
+        )
+        replica_frame_counts = {replica: len(frames) for replica in replicas}
+        replica_frame_counts[ALL_REPLICAS] = frame_count
+        run_data["replica_map"] = plot_contact_fraction_heatmap(
+            replica_df,
+            replica_frame_counts,
+            title_prefix="Contact fraction per replica",
+        )
 
     with open(results_dir / "run_data.json", "w") as f:
         json.dump(run_data, f)
@@ -265,11 +266,15 @@ def analyse_group(results_dirs: list[Path], group_result_dir: Path):
     with open(group_result_dir / "exp_data.csv") as f:
         exp_data = pd.read_csv(f)
 
+    frame_counts = {}
     prepared_dfs = []
-    for id, df in interactions:
+    for (id, df), data in zip(interactions, sims_data):
         sim_name = exp_data.loc[
             exp_data["Simulation ID"] == id, "Simulation name"
         ].iloc[0]
+        if REPLICA_COLUMN not in df.columns:
+            # the columns of the group stay the last ones when concatenated
+            df[REPLICA_COLUMN] = None
         if len(exp_data.columns.tolist()) > 2:
             value_name = exp_data.columns.tolist()[2]
             value = exp_data.loc[exp_data["Simulation ID"] == id, value_name].iloc[0]
@@ -277,11 +282,13 @@ def analyse_group(results_dirs: list[Path], group_result_dir: Path):
         df["Simulation name"] = sim_name
         df["Simulation ID"] = id
         prepared_dfs.append(df)
+        if "frame_count" in data:
+            frame_counts[sim_name] = data["frame_count"]
 
     group_df = pd.concat(prepared_dfs)
     group_df.to_csv(group_result_dir / "group.csv", index=False)
 
-    interaction_freq_map = plot_contact_fraction_heatmap(group_df)
+    interaction_freq_map = plot_contact_fraction_heatmap(group_df, frame_counts)
 
     group_data = {
         "exp_data": exp_data.to_dict(orient="split", index=False),
@@ -290,7 +297,7 @@ def analyse_group(results_dirs: list[Path], group_result_dir: Path):
 
     if len(exp_data.columns) > 2:
         interaction_correlation_map, interaction_covariance_map = (
-            plot_correlation_covariance_heatmaps(group_df)
+            plot_correlation_covariance_heatmaps(group_df, frame_counts)
         )
         group_data["interaction_correlation_map"] = interaction_correlation_map
         group_data["interaction_covariance_map"] = interaction_covariance_map
@@ -301,21 +308,329 @@ def analyse_group(results_dirs: list[Path], group_result_dir: Path):
     return None
 
 
-@task()
-def start_simulation(
-    top_file: Path, traj_file: Path, work_dir: Path, results_dir: Path
-):
-    # setup for using only specific frames
-    print("Starting the simulation!", flush=True)
-    frame_count = get_trajectory_frame_count(top_file, traj_file)
-    frames = [x for x in range(frame_count)]
+def analyse_replica(
+    files: TrajectoryFiles,
+    work_dir: Path,
+    frames: list[int],
+    frame_count: int,
+    engine: str,
+    progress: ProgressPublisher,
+    cancellation: CancellationToken,
+) -> FrameCheckpoint:
+    """Runs the engine on the frames of the trajectory its checkpoint is missing."""
     plip_dir = work_dir / "plip"
     frames_dir = work_dir / "frames"
-    get_interactions_from_trajectory(top_file, traj_file, plip_dir, frames_dir, frames)
-    analyse_simulation(top_file, traj_file, plip_dir, results_dir)
+    getcontacts_dir = work_dir / "getcontacts"
+    checkpoint = FrameCheckpoint(work_dir / "checkpoint", frames, engine)
+    # reports written by an interrupted run before it could store them
+    checkpoint.collect_plip_results(plip_dir)
+    missing = checkpoint.missing()
+    if len(missing) < len(frames):
+        print(
+            f"Resuming analysis, {len(frames) - len(missing)} frames already done",
+            flush=True,
+        )
+    if len(missing) > 0:
+        progress.publish(STAGE_EXTRACTING)
+        if settings.POCKET_CACHE:
+            files = get_pocket_cache(
+                files, frames, frame_count, should_stop=cancellation.is_cancelled
+            )
+        if engine == InteractionEngine.QUICK:
+            get_interactions_quick(
+                files.topology,
+                files.trajectory,
+                missing,
+                on_records=checkpoint.store_by_frame,
+                on_progress=lambda _: progress.publish(
+                    STAGE_PLIP, len(checkpoint.completed)
+                ),
+                should_stop=cancellation.is_cancelled,
+            )
+        elif engine == InteractionEngine.GETCONTACTS:
+            progress.publish(STAGE_PLIP, len(checkpoint.completed))
+            get_interactions_getcontacts(
+                files.topology,
+                files.trajectory,
+                getcontacts_dir,
+                missing,
+                on_records=checkpoint.store_by_frame,
+                should_stop=cancellation.is_cancelled,
+            )
+        else:
+            representatives = get_interactions_from_trajectory(
+                files.topology,
+                files.trajectory,
+                plip_dir,
+                frames_dir,
+                missing,
+                on_progress=lambda _: progress.publish(
+                    STAGE_PLIP,
+                    checkpoint.collect_plip_results(plip_dir),
+                ),
+                should_stop=cancellation.is_cancelled,
+                on_extract_progress=lambda _: progress.publish(STAGE_EXTRACTING),
+                result_cache=get_plip_result_cache(),
+                on_records=checkpoint.store_by_pdbfile,
+                on_skipped=checkpoint.store_empty,
+            )
+            checkpoint.collect_plip_results(plip_dir, final=True)
+            checkpoint.store_represented(representatives)
+            failed = checkpoint.missing()
+            if len(failed) > 0:
+                # plip gave up on these, running it again would not help
+                print(f"No PLIP report for frames: {failed}", flush=True)
+                checkpoint.store_empty(failed)
+    return checkpoint
+
+
+def clean_replica(work_dir: Path):
+    shutil.rmtree(work_dir / "plip", ignore_errors=True)
+    shutil.rmtree(work_dir / "getcontacts", ignore_errors=True)
+    shutil.rmtree(work_dir / "checkpoint", ignore_errors=True)
+
+
+@task(
+    retries=settings.ANALYSIS_RETRIES,
+    retry_delay=ANALYSIS_RETRY_DELAY_IN_SECONDS,
+    context=True,
+)
+def start_simulation(
+    top_file: Path,
+    traj_file: Path,
+    work_dir: Path,
+    results_dir: Path,
+    sim_id: str,
+    frames: list[int] | None = None,
+    engine: str = InteractionEngine.PLIP,
+    replica_files: list[Path] | None = None,
+    replica: int = 0,
+    dispatch_id: str | None = None,
+    task=None,
+):
+    print(f"Starting the simulation with the {engine} engine!", flush=True)
+    if dispatch_id is None and task is not None:
+        dispatch_id = task.id
+    lease = None
+    if task is not None and get_lease_duration() is not None:
+        # a task requeued while it waited in huey was dispatched again
+        if not renew_lease(sim_id, dispatch_id):
+            print(f"Analysis of {sim_id} was dispatched again", flush=True)
+            raise AnalysisCancelled()
+        lease = LeaseKeeper(sim_id, dispatch_id)
+    try:
+        return analyse_simulation_replica(
+            top_file,
+            traj_file,
+            work_dir,
+            results_dir,
+            sim_id,
+            frames,
+            engine,
+            replica_files,
+            replica,
+            dispatch_id,
+            CancellationToken(sim_id, lease),
+            task,
+        )
+    finally:
+        if lease is not None:
+            lease.stop()
+
+
+def get_replica_dirs(work_dir: Path, replica_count: int) -> list[Path]:
+    # a single trajectory keeps the layout of the work directory it always had
+    if replica_count == 1:
+        return [work_dir]
+    return [work_dir / f"replica{position}" for position in range(replica_count)]
+
+
+def finish_replica(
+    sim_id: str, dispatch_id: str | None, replica: int, seconds: float
+) -> bool:
+    """Records the replica as analysed in the worker seconds it took, True for the
+    last one of the dispatch.
+    """
+    if dispatch_id is None:
+        return True
+    with transaction.atomic():
+        sim = (
+            Simulation.objects.select_for_update()
+            .filter(sim_id=sim_id, analysis_task_id=dispatch_id)
+            .first()
+        )
+        if sim is None:
+            print(f"Analysis of {sim_id} was dispatched again", flush=True)
+            raise AnalysisCancelled()
+        replicas_done = sorted(set(sim.replicas_done) | {replica})
+        Simulation.objects.filter(sim_id=sim_id).update(
+            replicas_done=replicas_done,
+            analysis_worker_seconds=F("analysis_worker_seconds") + seconds,
+        )
+    return len(replicas_done) == sim.get_replica_count()
+
+
+def analyse_simulation_replica(
+    top_file: Path,
+    traj_file: Path,
+    work_dir: Path,
+    results_dir: Path,
+    sim_id: str,
+    frames: list[int] | None,
+    engine: str,
+    replica_files: list[Path] | None,
+    replica: int,
+    dispatch_id: str | None,
+    cancellation: CancellationToken,
+    task=None,
+):
+    """Analyses one replica of the simulation, the task finishing the last replica
+    merges them into the results.
+    """
+    started_at = time.monotonic()
+    cancellation.raise_if_cancelled()
+    replicas = [Path(trajectory) for trajectory in replica_files or [traj_file]]
+    trajectory = replicas[replica]
+    # the replicas are equally long, the upload rejects any other
+    frame_count = get_trajectory_frame_count(top_file, trajectory)
+    if frames is None:
+        frames = [x for x in range(frame_count)]
+    frames = sorted(frame for frame in set(frames) if 0 <= frame < frame_count)
+    if len(frames) == 0:
+        raise ValueError("No frames selected for the analysis")
+    replica_dirs = get_replica_dirs(work_dir, len(replicas))
+    progress = ProgressPublisher(sim_id, len(frames) * len(replicas))
+    shard_progress = (
+        progress
+        if len(replicas) == 1
+        else ProgressPublisher(sim_id, len(frames), replica, len(replicas))
+    )
+    try:
+        if len(replicas) > 1:
+            print(f"Analysing replica {trajectory.name}", flush=True)
+        analyse_replica(
+            TrajectoryFiles(top_file, trajectory),
+            replica_dirs[replica],
+            frames,
+            frame_count,
+            engine,
+            shard_progress,
+            cancellation,
+        )
+        cancellation.raise_if_cancelled()
+        if not finish_replica(
+            sim_id, dispatch_id, replica, time.monotonic() - started_at
+        ):
+            shard_progress.publish(STAGE_FINISHED)
+            return len(frames)
+        merge_started_at = time.monotonic()
+        progress.publish(STAGE_ANALYSING)
+        checkpoints = [
+            FrameCheckpoint(replica_dir / "checkpoint", frames, engine)
+            for replica_dir in replica_dirs
+        ]
+        if len(replicas) == 1:
+            df, ligand_df = checkpoints[0].load_dataframes()
+            replica_names = None
+        else:
+            replica_names = [replica_file.name for replica_file in replicas]
+            df, ligand_df = merge_replicas(
+                {
+                    name: checkpoint.load_dataframes()
+                    for name, checkpoint in zip(replica_names, checkpoints)
+                }
+            )
+        analyse_simulation(
+            top_file,
+            replicas[0],
+            df,
+            ligand_df,
+            results_dir,
+            frames,
+            frame_count,
+            engine,
+            replica_names,
+        )
+    except AnalysisCancelled:
+        raise
+    except Exception:
+        # huey runs the task again while it has retries left
+        if task is None or task.retries == 0:
+            shard_progress.publish(STAGE_FAILED)
+            progress.publish(STAGE_FAILED)
+        raise
+    for replica_dir in replica_dirs:
+        clean_replica(replica_dir)
+    if dispatch_id is not None:
+        merge_seconds = time.monotonic() - merge_started_at
+        set_simulation_status(
+            dispatch_id,
+            AnalysisStatus.FINISHED,
+            analysis_finished_at=django_now(),
+            analysis_worker_seconds=F("analysis_worker_seconds") + merge_seconds,
+        )
+    progress.publish(STAGE_FINISHED)
     return len(frames)
 
 
+def set_simulation_status(task_id: str, status: AnalysisStatus, **fields):
+    Simulation.objects.filter(analysis_task_id=task_id).exclude(
+        status=AnalysisStatus.DELETED
+    ).update(status=status, **fields)
+
+
+def get_dispatch_id(task) -> str:
+    # the tasks of the replicas share the dispatch stored on the simulation
+    return task.kwargs.get("dispatch_id") or task.id
+
+
+@signal(SIGNAL_EXECUTING)
+def mark_simulation_running(signal, task, exc=None):
+    dispatch_id = get_dispatch_id(task)
+    Simulation.objects.filter(
+        analysis_task_id=dispatch_id, status__in=LEASED_STATUSES
+    ).update(status=AnalysisStatus.RUNNING, lease_expires_at=get_lease_expiry())
+    # the first replica to run starts the analysis
+    Simulation.objects.filter(
+        analysis_task_id=dispatch_id, analysis_started_at__isnull=True
+    ).update(analysis_started_at=django_now())
+
+
+@signal(SIGNAL_COMPLETE)
+def mark_simulation_finished(signal, task, exc=None):
+    # the last replica marked the simulation finished, a worker slot was freed
+    dispatch_simulations()
+
+
+@signal(SIGNAL_ERROR, SIGNAL_CANCELED, SIGNAL_EXPIRED, SIGNAL_REVOKED)
+def mark_simulation_failed(signal, task, exc=None):
+    if signal == SIGNAL_ERROR and task.retries > 0:
+        # the task is retried, resuming from its checkpoint
+        print(
+            f"Analysis task {task.id} failed, {task.retries} retries left", flush=True
+        )
+        return
+    # the other replicas lose the lease and stop
+    set_simulation_status(
+        get_dispatch_id(task),
+        AnalysisStatus.FAILURE,
+        analysis_finished_at=django_now(),
+    )
+    dispatch_simulations()
+
+
+# analyses lost with a killed worker are requeued by the scheduler
+@on_startup()
+def dispatch_simulations_on_startup():
+    dispatch_simulations()
+
+
+# fallback for analyses a dispatch left waiting, e.g. when huey could not be reached
+@periodic_task(crontab(minute="*/1"))
+def dispatch_waiting_simulations():
+    dispatch_simulations()
+
+
 example_results_dir = settings.BASE_DIR / "example_results"
 example_results_dirnames = []
 if example_results_dir.is_dir():
@@ -329,12 +644,7 @@ def remove_unused_sim_files(sim_files_dir: Path):
         return
     try:
         sim = Simulation.objects.get(sim_id=sim_files_dir.name)
-        status = sim.get_analysis_status()
-        if (
-            status != "Queueing"
-            and status != "Queued"
-            and not status.startswith("Running")
-        ):
+        if sim.status not in IN_QUEUE_STATUSES:
             shutil.rmtree(sim_files_dir)
             print(f"Removing directory: {sim_files_dir}", flush=True)
     except:
@@ -0,0 +1,70 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+from ligand_service.checkpoint import FrameCheckpoint, count_completed_frames
+from ligand_service.plip_report import interaction_record
+
+HYDROPHOBIC_CONTACT = {
+    "reschain": "A",
+    "restype": "LEU",
+    "resnr": 92,
+    "reschain_lig": "L",
+    "restype_lig": "LIG",
+    "resnr_lig": 1,
+}
+
+
+def records(frame: int) -> dict[str, list[dict]]:
+    return {
+        "interactions": [
+            interaction_record(frame, "hydrophobic_interactions", HYDROPHOBIC_CONTACT)
+        ],
+        "ligands": [],
+    }
+
+
+class FrameCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = Path(self.tmp_dir.name) / "checkpoint"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resumes_the_missing_frames(self):
+        checkpoint = FrameCheckpoint(self.checkpoint_dir, [0, 5, 10])
+        checkpoint.store_by_frame({0: records(0), 10: records(10)})
+        self.assertEqual(count_completed_frames(self.checkpoint_dir), 2)
+        resumed = FrameCheckpoint(self.checkpoint_dir, [0, 5, 10])
+        self.assertEqual(resumed.missing(), [5])
+
+    def test_frames_without_a_file_are_missing(self):
+        checkpoint = FrameCheckpoint(self.checkpoint_dir, [0, 5])
+        checkpoint.store_by_frame({0: records(0), 5: records(5)})
+        checkpoint.frame_file(5).unlink()
+        self.assertEqual(FrameCheckpoint(self.checkpoint_dir, [0, 5]).missing(), [5])
+
+    def test_other_frames_discard_the_checkpoint(self):
+        checkpoint = FrameCheckpoint(self.checkpoint_dir, [0, 5])
+        checkpoint.store_by_frame({0: records(0)})
+        resumed = FrameCheckpoint(self.checkpoint_dir, [0, 5, 10])
+        self.assertEqual(resumed.missing(), [0, 5, 10])
+
+    def test_other_engines_discard_the_checkpoint(self):
+        checkpoint = FrameCheckpoint(self.checkpoint_dir, [0, 5])
+        checkpoint.store_by_frame({0: records(0)})
+        resumed = FrameCheckpoint(self.checkpoint_dir, [0, 5], engine="quick")
+        self.assertEqual(resumed.missing(), [0, 5])
+
+    def test_represented_frames_get_the_records_of_their_representative(self):
+        checkpoint = FrameCheckpoint(self.checkpoint_dir, [0, 5, 10])
+        checkpoint.store_by_frame({0: records(0)})
+        checkpoint.store_empty([10])
+        checkpoint.store_represented({5: 0})
+        self.assertEqual(checkpoint.missing(), [])
+        interactions, _ = checkpoint.load_dataframes()
+        self.assertEqual(sorted(interactions["Frame"]), [0, 5])
+
+    def test_no_manifest(self):
+        self.assertEqual(count_completed_frames(self.checkpoint_dir), 0)
@@ -0,0 +1,61 @@
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from ligand_service.desmond import (
+        DESMOND_TIMEKEYS_MAGIC,
+        DesmondTrajectory,
+        kept_frames,
+    )
+except ImportError as e:
+    raise unittest.SkipTest(f"Missing dependency: {e}")
+
+
+def write_timekeys(trj_dir: Path, times: list[float], frames_per_file: int):
+    with open(trj_dir / "timekeys", "wb") as f:
+        f.write(struct.pack(">3I", DESMOND_TIMEKEYS_MAGIC, frames_per_file, 24))
+        for time in times:
+            (bits,) = struct.unpack("<Q", struct.pack("<d", time))
+            # time, offset and size of the frame, the time split into two words
+            f.write(struct.pack(">6I", bits & 0xFFFFFFFF, bits >> 32, 0, 0, 0, 0))
+
+
+class KeptFramesTest(unittest.TestCase):
+    def test_continuous_run(self):
+        np.testing.assert_array_equal(kept_frames(np.array([0.0, 1, 2])), [0, 1, 2])
+
+    def test_restart_overwrites_the_later_frames(self):
+        times = np.array([0.0, 10, 20, 30, 20, 30, 40])
+        np.testing.assert_array_equal(kept_frames(times), [0, 1, 4, 5, 6])
+
+    def test_no_frames(self):
+        self.assertEqual(len(kept_frames(np.zeros(0))), 0)
+
+
+class DesmondTrajectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.trj_dir = Path(self.tmp_dir.name) / "md_trj"
+        self.trj_dir.mkdir()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_frames_by_the_count_of_vmd(self):
+        write_timekeys(self.trj_dir, [0.0, 10, 20, 30, 20, 30, 40], 2)
+        for file in range(4):
+            (self.trj_dir / f"frame{file:09d}").write_bytes(b"")
+        trajectory = DesmondTrajectory(self.trj_dir)
+        self.assertEqual(trajectory.frame_count, 5)
+        # the frame after the restart is the fifth one of the timekeys
+        self.assertEqual(trajectory.keys[2] // trajectory.frames_per_file, 2)
+
+    def test_missing_frame_files(self):
+        write_timekeys(self.trj_dir, [0.0, 10, 20], 1)
+        (self.trj_dir / "frame000000000").write_bytes(b"")
+        with self.assertRaises(ValueError):
+            DesmondTrajectory(self.trj_dir)
@@ -0,0 +1,88 @@
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from ligand_service.frame_index import (
+    XTC_MAGIC,
+    TRR_MAGIC,
+    build_frame_index,
+    get_frame_index,
+    index_path,
+    write_frames,
+)
+
+
+def xtc_frame(step: int, atom_count: int, compressed_bytes: int = 0) -> bytes:
+    header = struct.pack(
+        ">3if9fi", XTC_MAGIC, atom_count, step, step, *[0.0] * 9, atom_count
+    )
+    if atom_count <= 9:
+        return header + struct.pack(f">{atom_count * 3}f", *[0.0] * atom_count * 3)
+    compression = bytes(32) + struct.pack(">i", compressed_bytes)
+    # xdr pads the compressed coordinates to four bytes
+    return header + compression + bytes((compressed_bytes + 3) // 4 * 4)
+
+
+def trr_frame(step: int, atom_count: int) -> bytes:
+    version = b"GMX_trn_file"
+    sizes = [0, 0, 9 * 4, 0, 0, 0, 0, atom_count * 3 * 4, 0, 0, atom_count, step, 0]
+    header = struct.pack(">3i", TRR_MAGIC, len(version) + 1, len(version)) + version
+    # single precision time and lambda
+    header += struct.pack(">13i2f", *sizes, step, 0.0)
+    return header + bytes(9 * 4 + atom_count * 3 * 4)
+
+
+class FrameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_trajectory(self, name: str, frames: list[bytes]) -> Path:
+        path = self.dir / name
+        path.write_bytes(b"".join(frames))
+        return path
+
+    def test_xtc_offsets(self):
+        frames = [xtc_frame(0, 5), xtc_frame(1, 20, 37), xtc_frame(2, 20, 40)]
+        path = self.write_trajectory("md.xtc", frames)
+        offsets = build_frame_index(path)
+        np.testing.assert_array_equal(
+            offsets, np.cumsum([0] + [len(frame) for frame in frames])
+        )
+
+    def test_trr_offsets(self):
+        frames = [trr_frame(step, 4) for step in range(3)]
+        path = self.write_trajectory("md.trr", frames)
+        offsets = build_frame_index(path)
+        np.testing.assert_array_equal(
+            offsets, np.cumsum([0] + [len(frame) for frame in frames])
+        )
+
+    def test_incomplete_last_frame_is_left_out(self):
+        frames = [xtc_frame(0, 20, 40), xtc_frame(1, 20, 40)]
+        path = self.write_trajectory("md.xtc", [frames[0], frames[1][:-8]])
+        self.assertEqual(len(build_frame_index(path)) - 1, 1)
+
+    def test_index_is_stored_beside_the_trajectory(self):
+        path = self.write_trajectory("md.xtc", [xtc_frame(0, 5), xtc_frame(1, 5)])
+        offsets = get_frame_index(path)
+        self.assertTrue(index_path(path).is_file())
+        np.testing.assert_array_equal(get_frame_index(path), offsets)
+
+    def test_unindexed_trajectories(self):
+        self.assertIsNone(get_frame_index(self.dir / "md.dcd"))
+        path = self.write_trajectory("md.xtc", [trr_frame(0, 4)])
+        self.assertIsNone(get_frame_index(path))
+
+    def test_write_frames(self):
+        frames = [xtc_frame(step, 20, 30 + step) for step in range(4)]
+        path = self.write_trajectory("md.xtc", frames)
+        outfile = self.dir / "frames.xtc"
+        write_frames(path, get_frame_index(path), [1, 3], outfile)
+        self.assertEqual(outfile.read_bytes(), frames[1] + frames[3])
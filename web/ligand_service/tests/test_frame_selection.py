@@ -0,0 +1,63 @@
+import unittest
+
+try:
+    from ligand_service.utils import chunked, select_frames
+    from ligand_service.views import parse_frame_selection
+except ImportError as e:
+    raise unittest.SkipTest(f"Missing dependency: {e}")
+
+
+class SelectFramesTest(unittest.TestCase):
+    def test_every_frame(self):
+        self.assertEqual(select_frames(5), [0, 1, 2, 3, 4])
+
+    def test_window_and_stride(self):
+        self.assertEqual(select_frames(20, 3, 12, 4), [3, 7, 11])
+        self.assertEqual(select_frames(20, 15), [15, 16, 17, 18, 19])
+        # a window past the end is empty, not an error
+        self.assertEqual(select_frames(20, 25, 30), [])
+
+    def test_thinned_out_evenly(self):
+        self.assertEqual(select_frames(100, target_count=4), [0, 25, 50, 75])
+        self.assertEqual(select_frames(20, 0, 10, 2, 10), [0, 2, 4, 6, 8])
+
+    def test_chunked(self):
+        self.assertEqual(chunked([1, 2, 3, 4, 5], 2), [[1, 2], [3, 4], [5]])
+
+
+class ParseFrameSelectionTest(unittest.TestCase):
+    def test_empty_fields_are_left_out(self):
+        self.assertEqual(
+            parse_frame_selection({"frameStart": "", "frameStride": "2"}),
+            {"frame_stride": 2},
+        )
+
+    def test_every_field(self):
+        self.assertEqual(
+            parse_frame_selection(
+                {
+                    "frameStart": "10",
+                    "frameEnd": "50",
+                    "frameStride": "5",
+                    "targetFrameCount": 4,
+                }
+            ),
+            {
+                "frame_start": 10,
+                "frame_end": 50,
+                "frame_stride": 5,
+                "target_frame_count": 4,
+            },
+        )
+
+    def test_invalid_values(self):
+        for data in [
+            {"frameStart": "-1"},
+            {"frameStride": "0"},
+            {"targetFrameCount": "0"},
+            {"frameEnd": "abc"},
+            {"frameStart": "10", "frameEnd": "10"},
+            {"frameEnd": "0"},
+        ]:
+            with self.assertRaises(ValueError, msg=data):
+                parse_frame_selection(data)
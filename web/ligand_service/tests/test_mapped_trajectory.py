@@ -0,0 +1,64 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+
+from ligand_service.mapped_trajectory import DcdWriter, MappedDcd, map_trajectory
+
+
+class MappedDcdTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "frames.dcd"
+        rng = np.random.default_rng(0)
+        self.frames = rng.uniform(-50, 50, (4, 7, 3)).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, frames: dict[int, np.ndarray], frame_count: int):
+        writer = DcdWriter(self.path, 7, frame_count)
+        for frame, coordinates in frames.items():
+            writer.write(frame, coordinates)
+        writer.close()
+
+    def test_round_trip(self):
+        self.write(dict(enumerate(self.frames)), len(self.frames))
+        mapped = MappedDcd(self.path)
+        self.assertEqual(mapped.atom_count, 7)
+        self.assertEqual(mapped.frame_count, 4)
+        for frame, coordinates in enumerate(self.frames):
+            np.testing.assert_array_equal(mapped.frame_view(frame), coordinates)
+            out = np.zeros((7, 3), dtype=np.float32)
+            mapped.read_into(frame, out)
+            np.testing.assert_array_equal(out, coordinates)
+
+    def test_atom_ranges(self):
+        self.write(dict(enumerate(self.frames)), len(self.frames))
+        mapped = MappedDcd(self.path)
+        for atoms in [slice(2, 5), slice(0, 7, 2), slice(6, None)]:
+            np.testing.assert_array_equal(
+                mapped.frame_view(1, atoms), self.frames[1][atoms]
+            )
+
+    def test_views_are_read_only(self):
+        self.write(dict(enumerate(self.frames)), len(self.frames))
+        view = MappedDcd(self.path).frame_view(0)
+        with self.assertRaises(ValueError):
+            view[0, 0] = 0
+
+    def test_frames_written_out_of_order(self):
+        self.write({3: self.frames[3], 1: self.frames[1]}, len(self.frames))
+        mapped = MappedDcd(self.path)
+        self.assertEqual(mapped.frame_count, 4)
+        np.testing.assert_array_equal(mapped.frame_view(1), self.frames[1])
+        np.testing.assert_array_equal(mapped.frame_view(3), self.frames[3])
+        # frames never written are zero
+        np.testing.assert_array_equal(mapped.frame_view(0), np.zeros((7, 3)))
+        np.testing.assert_array_equal(mapped.frame_view(2), np.zeros((7, 3)))
+
+    def test_other_files_are_not_mapped(self):
+        self.path.write_bytes(b"not a dcd file at all" * 10)
+        self.assertIsNone(map_trajectory(self.path))
+        self.assertIsNone(map_trajectory(self.path.with_suffix(".xtc")))
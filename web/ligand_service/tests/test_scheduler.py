@@ -0,0 +1,83 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import unittest
+
+try:
+    from django.test import SimpleTestCase, override_settings
+
+    from ligand_service.models import AnalysisPriority, Simulation
+    from ligand_service.scheduler import pick_simulations
+except ImportError as e:
+    raise unittest.SkipTest(f"Missing dependency: {e}")
+
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def simulation(user_key: str, minute: int, **fields) -> Simulation:
+    """An unsaved analysis waiting since the minute."""
+    fields.setdefault("priority", AnalysisPriority.NORMAL)
+    sim = Simulation(user_key=user_key, **fields)
+    sim.created_at = START + timedelta(minutes=minute)
+    return sim
+
+
+@override_settings(
+    MAXIMUM_RUNNING_ANALYSES_PER_USER=None,
+    ANALYSIS_WORKER_SLOTS=4,
+    LARGE_ANALYSIS_THRESHOLD_IN_HOURS=None,
+    MAXIMUM_RUNNING_LARGE_ANALYSES=1,
+)
+class PickSimulationsTest(SimpleTestCase):
+    def test_priority_first(self):
+        normal = simulation("a", 0)
+        small = simulation("a", 1, priority=AnalysisPriority.SMALL)
+        self.assertEqual(pick_simulations([normal, small], Counter(), {}, 1), [small])
+
+    def test_users_take_turns(self):
+        first = simulation("a", 0)
+        second = simulation("a", 1)
+        other = simulation("b", 2)
+        picked = pick_simulations([first, second, other], Counter(), {}, 2)
+        self.assertEqual(picked, [first, other])
+
+    def test_fewest_in_flight_first(self):
+        busy = simulation("a", 0)
+        idle = simulation("b", 1)
+        picked = pick_simulations([busy, idle], Counter({"a": 1}), {}, 1)
+        self.assertEqual(picked, [idle])
+
+    def test_served_longest_ago_first(self):
+        recent = simulation("a", 0)
+        earlier = simulation("b", 1)
+        last_served = {"a": START + timedelta(hours=2), "b": START + timedelta(hours=1)}
+        self.assertEqual(
+            pick_simulations([recent, earlier], Counter(), last_served, 1), [earlier]
+        )
+
+    @override_settings(MAXIMUM_RUNNING_ANALYSES_PER_USER=1)
+    def test_limit_per_user(self):
+        waiting = [simulation("a", 0), simulation("a", 1)]
+        self.assertEqual(len(pick_simulations(waiting, Counter(), {}, 4)), 1)
+        self.assertEqual(pick_simulations(waiting, Counter({"a": 1}), {}, 4), [])
+
+    def test_replicas_wait_for_enough_workers(self):
+        replicas = simulation("a", 0, replica_files=["1.xtc", "2.xtc", "3.xtc"])
+        single = simulation("b", 1)
+        # the smaller analysis does not overtake the one waiting for workers
+        self.assertEqual(pick_simulations([replicas, single], Counter(), {}, 2), [])
+        self.assertEqual(
+            pick_simulations([replicas, single], Counter(), {}, 4), [replicas, single]
+        )
+
+    @override_settings(LARGE_ANALYSIS_THRESHOLD_IN_HOURS=1)
+    def test_large_analyses_have_their_own_lane(self):
+        large = simulation("a", 0, estimated_cost=2 * 3600)
+        small = simulation("b", 1, estimated_cost=60)
+        self.assertEqual(
+            pick_simulations([large, small], Counter(), {}, 2, large_in_flight=1),
+            [small],
+        )
+        self.assertEqual(
+            pick_simulations([large, small], Counter(), {}, 2), [large, small]
+        )
@@ -0,0 +1,144 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from vmd import atomsel, molecule
+
+    from ligand_service.selection import (
+        FRAME_SELECTION,
+        FrameSelector,
+        index_selection,
+        within,
+    )
+except ImportError as e:
+    raise unittest.SkipTest(f"Missing dependency: {e}")
+
+LIGAND = "resname LIG"
+
+
+def pdb_line(serial: int, name: str, resname: str, resid: int, xyz) -> str:
+    x, y, z = xyz
+    return (
+        f"ATOM  {serial:5d} {name:<4} {resname:<4}A{resid:4d}    "
+        f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00\n"
+    )
+
+
+def small_system() -> str:
+    """Four alanines along x, a ligand above the second one, waters and an ion
+    at different distances and a lipid next to the protein.
+    """
+    atoms = []
+    for resid in range(4):
+        x = resid * 3.8
+        atoms += [
+            ("N", "ALA", resid + 1, (x, 0, 0)),
+            ("CA", "ALA", resid + 1, (x + 1.45, 0, 0)),
+            ("C", "ALA", resid + 1, (x + 2.4, 0.9, 0)),
+            ("O", "ALA", resid + 1, (x + 2.4, 2.1, 0)),
+            ("CB", "ALA", resid + 1, (x + 1.45, -1.5, 0)),
+        ]
+    atoms += [
+        ("C1", "LIG", 10, (5.0, 0.5, 3.5)),
+        ("C2", "LIG", 10, (6.5, 0.5, 3.5)),
+    ]
+    for resid, (x, y, z) in enumerate(
+        [(5.5, 0.5, 6.5), (12.0, -5.0, 0), (40.0, 40.0, 40.0)], start=20
+    ):
+        atoms += [
+            ("OH2", "TIP3", resid, (x, y, z)),
+            ("H1", "TIP3", resid, (x + 0.96, y, z)),
+            ("H2", "TIP3", resid, (x - 0.24, y + 0.93, z)),
+        ]
+    atoms += [("SOD", "SOD", 30, (0.0, 4.0, 4.0))]
+    atoms += [
+        ("P", "POPC", 40, (-4.0, 0, 0)),
+        ("O11", "POPC", 40, (-5.5, 0, 0)),
+    ]
+    return (
+        "".join(pdb_line(serial, *atom) for serial, atom in enumerate(atoms, start=1))
+        + "END\n"
+    )
+
+
+class WithinTest(unittest.TestCase):
+    def brute_force(self, points, reference, cutoff):
+        delta = points[:, None, :].astype(np.float32) - reference[None, :, :]
+        return ((delta * delta).sum(axis=2) <= np.float32(cutoff) ** 2).any(axis=1)
+
+    def test_matches_every_pair_compared(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-30, 30, (2000, 3)).astype(np.float32)
+        reference = rng.uniform(-10, 10, (50, 3)).astype(np.float32)
+        for cutoff in [0.5, 3, 7.5]:
+            np.testing.assert_array_equal(
+                within(points, reference, cutoff),
+                self.brute_force(points, reference, cutoff),
+            )
+
+    def test_cutoff_is_inclusive(self):
+        reference = np.zeros((1, 3))
+        points = np.array([[3.0, 0, 0], [3.001, 0, 0], [0, -3.0, 0]])
+        np.testing.assert_array_equal(within(points, reference, 3), [True, False, True])
+
+    def test_nothing_to_compare(self):
+        self.assertEqual(len(within(np.zeros((0, 3)), np.zeros((1, 3)), 1)), 0)
+        self.assertFalse(within(np.zeros((2, 3)), np.zeros((0, 3)), 1).any())
+
+
+class IndexSelectionTest(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(index_selection(np.array([])), "none")
+        self.assertEqual(
+            index_selection(np.array([0, 1, 2, 5, 7, 8])), "index 0 to 2 5 7 to 8"
+        )
+
+
+class FrameSelectorTest(unittest.TestCase):
+    """The numpy selections against the same selections evaluated by VMD."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        pdb = Path(self.tmp_dir.name) / "system.pdb"
+        pdb.write_text(small_system())
+        self.molid = molecule.load("pdb", str(pdb))
+        self.selector = FrameSelector(self.molid, LIGAND, "water")
+
+    def tearDown(self):
+        molecule.delete(self.molid)
+        self.tmp_dir.cleanup()
+
+    def vmd_indices(self, selection: str) -> list[int]:
+        return sorted(atomsel(selection, molid=self.molid).index)
+
+    def test_frame_atoms(self):
+        self.assertEqual(
+            list(self.selector.frame_atoms(0)), self.vmd_indices(FRAME_SELECTION)
+        )
+
+    def test_pocket_atoms(self):
+        for radius in [3, 5, 8]:
+            self.assertEqual(
+                list(self.selector.pocket_atoms(0, radius)),
+                self.vmd_indices(
+                    f"({FRAME_SELECTION}) and (same residue as (within {radius} "
+                    f"of (({FRAME_SELECTION}) and {LIGAND})))"
+                ),
+            )
+
+    def test_ligand_near_protein(self):
+        self.assertTrue(self.selector.ligand_near_protein(0, 4))
+        self.assertFalse(self.selector.ligand_near_protein(0, 2))
+
+    def test_water_shell(self):
+        selected = self.selector.frame_mask(0)
+        shell = self.selector.water_shell(0, selected, 4)
+        expected = self.vmd_indices(
+            f"({FRAME_SELECTION}) and (not water or ((same residue as "
+            f"(within 4 of (({FRAME_SELECTION}) and {LIGAND}))) and (same residue "
+            f"as (within 4 of protein))))"
+        )
+        self.assertEqual(list(np.flatnonzero(shell)), expected)
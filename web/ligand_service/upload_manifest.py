@@ -0,0 +1,97 @@
+"""Every file of an upload with its size, type and role, written once the upload
+is complete. The topology and trajectory are found in it instead of walking the
+upload, maestro outputs have thousands of files and uploads can be on network storage.
+"""
+
+from pathlib import Path
+import json
+import os
+
+UPLOAD_MANIFEST = "upload_manifest.json"
+TOPOLOGY_ROLE = "topology"
+TRAJECTORY_ROLE = "trajectory"
+DIRECTORY_TYPE = "directory"
+TOPOLOGY_TYPES = ["pdb", "psf"]
+TRAJECTORY_TYPES = ["dcd", "xtc", "trr"]
+MAESTRO_TOPOLOGY_SUFFIX = "-out.cms"
+# desmond writes the frames of a trajectory into a directory of their own
+MAESTRO_TRAJECTORY_SUFFIX = "_trj"
+
+
+def manifest_path(directory: Path) -> Path:
+    return directory / UPLOAD_MANIFEST
+
+
+def get_role(name: str, type: str) -> str | None:
+    if type == DIRECTORY_TYPE:
+        return TRAJECTORY_ROLE if name.endswith(MAESTRO_TRAJECTORY_SUFFIX) else None
+    if type in TOPOLOGY_TYPES or name.endswith(MAESTRO_TOPOLOGY_SUFFIX):
+        return TOPOLOGY_ROLE
+    if type in TRAJECTORY_TYPES:
+        return TRAJECTORY_ROLE
+    return None
+
+
+def scan_upload(directory: Path) -> list[dict]:
+    """Directories and files of the upload in a single walk, sorted by path."""
+    entries = []
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        relative = Path(root).relative_to(directory)
+        for name in dirnames:
+            entries.append(
+                {
+                    "path": str(relative / name),
+                    "size": 0,
+                    "type": DIRECTORY_TYPE,
+                    "role": get_role(name, DIRECTORY_TYPE),
+                }
+            )
+        for name in sorted(filenames):
+            if root == str(directory) and name == UPLOAD_MANIFEST:
+                continue
+            type = Path(name).suffix[1:]
+            entries.append(
+                {
+                    "path": str(relative / name),
+                    "size": os.stat(Path(root) / name).st_size,
+                    "type": type,
+                    "role": get_role(name, type),
+                }
+            )
+    return sorted(entries, key=lambda entry: entry["path"])
+
+
+def write_upload_manifest(directory: Path) -> list[dict]:
+    entries = scan_upload(directory)
+    path = manifest_path(directory)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"files": entries}, f)
+    os.replace(tmp_path, path)
+    print(f"Listed {len(entries)} files of {directory.name}", flush=True)
+    return entries
+
+
+def get_upload_manifest(directory: Path) -> list[dict]:
+    """Entries of the upload manifest, directories without one are scanned."""
+    path = manifest_path(directory)
+    if path.is_file():
+        with open(path) as f:
+            return json.load(f)["files"]
+    return scan_upload(directory)
+
+
+def find_entries(
+    entries: list[dict], role: str, types: list[str], top_level: bool = False
+) -> list[dict]:
+    """Entries of the role with one of the types, only those directly in the
+    upload directory if top_level.
+    """
+    return [
+        entry
+        for entry in entries
+        if entry["role"] == role
+        and entry["type"] in types
+        and (not top_level or len(Path(entry["path"]).parts) == 1)
+    ]
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from pathlib import Path
+import os
 import shutil
+import tempfile
 from typing import BinaryIO
 import hashlib
 
@@ -20,6 +22,54 @@ def get_user_work_dir(session_key) -> Path:
     return settings.BASE_DIR / "user_uploads" / session_key / "work"
 
 
+# fast, local places for files that only live until they are read back,
+# the first one with enough free space is used
+SCRATCH_DIRS = [Path("/dev/shm"), Path(tempfile.gettempdir())]
+SCRATCH_HEADROOM = 2
+
+
+def choose_scratch_dir(required_bytes: int) -> Path | None:
+    for scratch_dir in SCRATCH_DIRS:
+        if not scratch_dir.is_dir() or not os.access(scratch_dir, os.W_OK):
+            continue
+        if shutil.disk_usage(scratch_dir).free > required_bytes * SCRATCH_HEADROOM:
+            return scratch_dir
+    return None
+
+
+def select_frames(
+    frame_count: int,
+    start: int | None = None,
+    end: int | None = None,
+    stride: int = 1,
+    target_count: int | None = None,
+) -> list[int]:
+    """Every stride-th frame of the window [start, end), thinned out evenly
+    to target_count frames if there are more of them.
+    """
+    frames = list(range(frame_count))[start:end:stride]
+    if target_count is not None and 0 < target_count < len(frames):
+        step = len(frames) / target_count
+        frames = [frames[int(i * step)] for i in range(target_count)]
+    return frames
+
+
+def chunked(frames: list[int], size: int) -> list[list[int]]:
+    return [frames[start : start + size] for start in range(0, len(frames), size)]
+
+
+def describe_frame_selection(frames: list[int], frame_count: int) -> str:
+    if len(frames) == frame_count:
+        return f"All {frame_count} frames"
+    description = f"{len(frames)} of {frame_count} frames"
+    if len(frames) > 1:
+        description += f", {frames[0]} to {frames[-1]}"
+        strides = {b - a for a, b in zip(frames, frames[1:])}
+        if len(strides) == 1 and strides != {1}:
+            description += f" with a stride of {strides.pop()}"
+    return description
+
+
 # Front-end salt maybe?
 @dataclass
 class ResumableFile:
@@ -100,6 +150,14 @@ class ResumableFilesManager:
         base_dir = Path(resumable_data.get("resumableRelativePath") or "").parts[0]
         return main_write_directory / base_dir
 
+    def is_managed_directory(
+        self, resumable_data: QueryDict, main_write_directory: Path
+    ) -> bool:
+        return (
+            self.get_writing_directory(resumable_data, main_write_directory)
+            in self.managed_directories
+        )
+
     def check_if_directory_finished(self, write_directory: Path):
         return (
             self.directory_file_count[write_directory][0]
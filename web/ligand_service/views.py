@@ -1,12 +1,16 @@
 from pathlib import Path
+import asyncio
 import csv
 import json
 import logging
 import shutil
+import time
 
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.http import FileResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from huey.contrib.djhuey import HUEY as huey
 from django.template.loader import render_to_string
 from django.conf import settings
 
@@ -17,27 +21,70 @@ from ligand_service.utils import (
     get_user_results_dir,
 )
 
-from .models import GroupAnalysis, Simulation, get_trajectory_frame_count
+from .models import (
+    AnalysisStatus,
+    GroupAnalysis,
+    IN_QUEUE_STATUSES,
+    InteractionEngine,
+    Simulation,
+    get_replica_frame_count,
+)
+from .progress import aget_progress
+from .cancellation import request_cancellation
+from .scheduler import annotate_queue_estimates, get_backlog_seconds, queue_simulation
+from .contacts import get_pocket_atom_count
+from .upload_manifest import write_upload_manifest
 from . import tasks
 
 logger = logging.getLogger(__name__)
 file_manager = ResumableFilesManager()
 
-
-def start_sim_task(sim: Simulation, session_key: str):
-    if sim.is_not_queued():
-        files = sim.get_trajectory_files()
-        print("Starting simulation!", flush=True)
-        if files is None:
-            return HttpResponse()
-        print("Files are not None!", flush=True)
-        sim.analysis_task_id = tasks.start_simulation(
-            files.topology,
-            files.trajectory,
-            get_user_work_dir(session_key) / str(sim.sim_id),
-            get_user_results_dir(sim.results_id),
-        ).id
-        sim.save()
+PROGRESS_STREAM_INTERVAL_IN_SECONDS = 1
+PROGRESS_STREAM_RETRY_IN_MS = 5000
+PROGRESS_SIM_LIST_REFRESH_IN_SECONDS = 15
+PROGRESS_KEEPALIVE_IN_SECONDS = 15
+BACKLOG_RETRY_AFTER_IN_SECONDS = 15 * 60
+
+
+# request fields of the frame selection, by the Simulation field they set
+FRAME_SELECTION_FIELDS = {
+    "frameStart": "frame_start",
+    "frameEnd": "frame_end",
+    "frameStride": "frame_stride",
+    "targetFrameCount": "target_frame_count",
+}
+
+
+def parse_frame_selection(data) -> dict[str, int]:
+    """Frame selection of an upload or a start request, empty fields are left out.
+    Raises ValueError on invalid values.
+    """
+    selection = {}
+    for key, field in FRAME_SELECTION_FIELDS.items():
+        value = data.get(key, None)
+        if value is None or value == "":
+            continue
+        value = int(value)
+        if value < 0 or (field in ["frame_stride", "target_frame_count"] and value < 1):
+            raise ValueError(f"Invalid {key}: {value}")
+        selection[field] = value
+    end = selection.get("frame_end", None)
+    if end is not None and end <= selection.get("frame_start", 0):
+        raise ValueError("The frame window is empty")
+    return selection
+
+
+def parse_analysis_options(data) -> dict:
+    """Frame selection and engine of an upload or a start request.
+    Raises ValueError on invalid values.
+    """
+    options = parse_frame_selection(data)
+    engine = data.get("engine", None)
+    if engine is not None and engine != "":
+        if engine not in InteractionEngine.values:
+            raise ValueError(f"Unknown engine: {engine}")
+        options["engine"] = engine
+    return options
 
 
 def rename_sim(request):
@@ -54,7 +101,33 @@ def start_sim(request):
     print(body, flush=True)
     session_key = request.session.session_key
     sim = Simulation.objects.get(user_key=session_key, sim_id=body["sim_id"])
-    start_sim_task(sim, session_key)
+    try:
+        options = parse_analysis_options(body)
+    except ValueError:
+        return HttpResponse(status=400)
+    if len(options) > 0:
+        if sim.was_deleted or (
+            sim.status in IN_QUEUE_STATUSES and not sim.is_not_queued()
+        ):
+            # the running analysis keeps its frames
+            return HttpResponse(status=409)
+        files = sim.get_trajectory_files()
+        if files is None or not files.topology.is_file():
+            # uploads are removed some time after their analysis
+            return HttpResponse(status=410)
+        # a finished quick pass can be run again with more frames or with PLIP
+        if any(field in options for field in FRAME_SELECTION_FIELDS.values()):
+            sim.frame_start = sim.frame_end = sim.target_frame_count = None
+            sim.frame_stride = 1
+        for field, value in options.items():
+            setattr(sim, field, value)
+        if len(sim.get_frames()) == 0:
+            return HttpResponse(status=422)
+        sim.status = AnalysisStatus.QUEUEING
+        sim.analysis_task_id = None
+        sim.analysis_started_at = sim.analysis_finished_at = None
+        sim.save()
+    queue_simulation(sim)
     return HttpResponse()
 
 
@@ -71,53 +144,72 @@ def upload_sim(request):
         and settings.MAXIMUM_UPLOAD_SIZE_IN_MB < float(total_size)
     ):
         return HttpResponse(status=400)
-    if settings.MAXIMUM_UPLOADS_IN_QUEUE is not None:
-        sims = Simulation.objects.filter(user_key=request.session.session_key)
-        in_queue_count = 0
-        print("Counting sims...")
-        for sim in sims:
-            status = sim.get_analysis_status()
-            if (
-                status == "Queueing"
-                or status == "Queued"
-                or status.startswith("Running")
-            ):
-                in_queue_count += 1
-        print(f"Counted {in_queue_count} sims in quque")
+    upload_dir = get_user_uploads_dir(request.session.session_key) / request.POST.get(
+        "uploadUUID", ""
+    )
+    # only the first chunk of an upload has to be checked against the queue limit
+    if settings.MAXIMUM_UPLOADS_IN_QUEUE is not None and (
+        not file_manager.is_managed_directory(request.POST, upload_dir)
+    ):
+        in_queue_count = Simulation.objects.filter(
+            user_key=request.session.session_key,
+            was_deleted=False,
+            status__in=IN_QUEUE_STATUSES,
+        ).count()
+        print(f"Counted {in_queue_count} sims in queue")
         if in_queue_count >= settings.MAXIMUM_UPLOADS_IN_QUEUE:
             print("Rejecting due to queue limit!")
             return HttpResponse(status=400)
+    if settings.MAXIMUM_QUEUE_BACKLOG_IN_HOURS is not None and (
+        not file_manager.is_managed_directory(request.POST, upload_dir)
+    ):
+        backlog = get_backlog_seconds()
+        if backlog > settings.MAXIMUM_QUEUE_BACKLOG_IN_HOURS * 3600:
+            print(f"Rejecting due to queue backlog of {backlog:.0f}s!")
+            return HttpResponse(
+                status=503, headers={"Retry-After": str(BACKLOG_RETRY_AFTER_IN_SECONDS)}
+            )
+
+    try:
+        analysis_options = parse_analysis_options(request.POST)
+    except ValueError:
+        return HttpResponse(status=400)
 
     if request.method == "POST":
         _, dir_complete = file_manager.handle_resumable_post_request(
             request.POST,
             request.FILES.get("file", None),
-            get_user_uploads_dir(request.session.session_key)
-            / request.POST.get("uploadUUID", ""),
+            upload_dir,
         )
         if dir_complete is not None:
             print("Adding new simulation file!", flush=True)
+            write_upload_manifest(upload_dir)
             try:
+                # only saved once the upload is accepted, nothing to delete before
                 sim = Simulation(
                     dirname=dir_complete.name,
                     user_key=request.session.session_key,
                     sim_id=request.POST.get("uploadUUID", ""),
+                    **analysis_options,
                 )
                 files = sim.get_trajectory_files()
                 if files is None:
-                    sim.delete()
-                    return HttpResponse(422)
-                sim.frame_count = get_trajectory_frame_count(
-                    files.topology, files.trajectory
-                )
+                    return HttpResponse(status=422)
+                # the same frames are analysed in every replica
+                sim.frame_count = get_replica_frame_count(sim.get_replicas())
+                if sim.frame_count is None:
+                    return HttpResponse(status=422)
                 if (
                     settings.MAXIMUM_FRAMES_PER_SIMULATION is not None
-                    and settings.MAXIMUM_FRAMES_PER_SIMULATION < sim.frame_count
+                    and settings.MAXIMUM_FRAMES_PER_SIMULATION
+                    < sim.frame_count * sim.get_replica_count()
                 ):
-                    sim.delete()
-                    return HttpResponse(422)
+                    return HttpResponse(status=422)
+                if len(sim.get_frames()) == 0:
+                    return HttpResponse(status=422)
+                sim.atom_count = get_pocket_atom_count(files.topology, files.trajectory)
                 sim.save()
-                start_sim_task(sim, request.session.session_key)
+                queue_simulation(sim)
             except Exception as e:
                 print(f"Db error: {e}")
     # elif request.method == "GET":
@@ -152,8 +244,15 @@ def delete_sim(request):
     sim = Simulation.objects.get(
         user_key=request.session.session_key, sim_id=body["sim_id"]
     )
+    # not picked up by a worker yet, huey can drop it from the queue
+    if sim.status == AnalysisStatus.QUEUED:
+        for task_id in sim.get_task_ids():
+            huey.revoke_by_id(task_id)
     sim.was_deleted = True
+    sim.status = AnalysisStatus.DELETED
     sim.save()
+    # a running analysis notices this, stops its PLIP processes and frees the worker
+    request_cancellation(sim.sim_id)
     # sim.delete()
     session_key = request.session.session_key
     shutil.rmtree(
@@ -166,8 +265,10 @@ def delete_sim(request):
 
 
 def send_sims_data(request):
-    sims = Simulation.objects.filter(
-        user_key=request.session.session_key, was_deleted=False
+    sims = annotate_queue_estimates(
+        Simulation.objects.filter(
+            user_key=request.session.session_key, was_deleted=False
+        )
     )
 
     #    for sim in sims:
@@ -185,6 +286,57 @@ def send_sims_data(request):
     return HttpResponse(sims_data, headers=headers)
 
 
+async def stream_sims_progress(request):
+    session_key = request.session.session_key
+    # under WSGI the stream would be buffered until it ends, so only send a snapshot
+    # and let the browser reconnect, which degrades gracefully to polling
+    lifetime = (
+        settings.PROGRESS_STREAM_LIFETIME_IN_SECONDS
+        if isinstance(request, ASGIRequest)
+        else 0
+    )
+
+    async def event_stream():
+        yield f"retry: {PROGRESS_STREAM_RETRY_IN_MS}\n\n"
+        sent = {}
+        sim_ids = []
+        started = time.monotonic()
+        last_event = started
+        sims_listed_at = None
+        while True:
+            now = time.monotonic()
+            # new uploads show up without reconnecting
+            if (
+                sims_listed_at is None
+                or now - sims_listed_at >= PROGRESS_SIM_LIST_REFRESH_IN_SECONDS
+            ):
+                sims_listed_at = now
+                sim_ids = [
+                    str(sim_id)
+                    async for sim_id in Simulation.objects.filter(
+                        user_key=session_key, was_deleted=False
+                    ).values_list("sim_id", flat=True)
+                ]
+            for sim_id, progress in (await aget_progress(sim_ids)).items():
+                if sent.get(sim_id) == progress["updated_at"]:
+                    continue
+                sent[sim_id] = progress["updated_at"]
+                last_event = now
+                yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+            if now - started >= lifetime:
+                break
+            if now - last_event >= PROGRESS_KEEPALIVE_IN_SECONDS:
+                last_event = now
+                yield ": keepalive\n\n"
+            await asyncio.sleep(PROGRESS_STREAM_INTERVAL_IN_SECONDS)
+
+    return StreamingHttpResponse(
+        event_stream(),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 def send_analyses_history(request):
     sims_data = render_to_string(
         "submit/history.html",
@@ -273,8 +425,10 @@ def dashboard(request):
         request,
         "submit/dashboard.html",
         {
-            "user_dirs": Simulation.objects.filter(
-                user_key=request.session.session_key, was_deleted=False
+            "user_dirs": annotate_queue_estimates(
+                Simulation.objects.filter(
+                    user_key=request.session.session_key, was_deleted=False
+                )
             ),
             "history": GroupAnalysis.objects.filter(
                 user_key=request.session.session_key
@@ -0,0 +1,27 @@
+import io
+import shutil
+import zipfile
+from pathlib import Path
+
+import requests
+
+# getcontacts is not packaged, the sources are run with the interpreter of the worker
+GETCONTACTS_ARCHIVE_URL = (
+    "https://github.com/getcontacts/getcontacts/archive/refs/heads/master.zip"
+)
+
+getcontacts_dir = Path("./getcontacts").absolute()
+print("Downloading getcontacts...")
+
+try:
+    r = requests.get(GETCONTACTS_ARCHIVE_URL, timeout=300)
+    r.raise_for_status()
+    with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+        # the archive holds a single getcontacts-<branch> directory
+        root = archive.namelist()[0].split("/")[0]
+        archive.extractall(getcontacts_dir.parent)
+    shutil.rmtree(getcontacts_dir, ignore_errors=True)
+    (getcontacts_dir.parent / root).rename(getcontacts_dir)
+    print("SUCCESS: getcontacts downloaded!")
+except Exception as e:
+    print(f"FAILURE: Failed to download getcontacts. Error: {e}")